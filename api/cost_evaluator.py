@@ -0,0 +1,213 @@
+"""
+Standalone path cost evaluation
+Scores whole paths, or many candidate paths at once, against one obstacle
+map without building a PathOptimizer: every cost term is computed once, in
+a single vectorized pass over all paths
+"""
+
+import numpy as np
+from typing import Dict, List, Sequence, Tuple, Union
+
+from obstacles import DIMENSIONS, MAX_SEGMENT_PAIRS, ObstacleSet
+from moving_obstacles import MovingObstacleSet
+from distance_field import DistanceField
+from obstacle_models import OBSTACLE_MODELS, build_obstacle_models
+from path_terms import length_cost, smoothness_cost
+from profiling import Profile, optional_timer
+
+# Cost terms reported by CostEvaluator, in the order of the response keys
+COST_TERMS = ('length', 'smoothness', 'obstacle', 'altitude')
+
+
+class CostEvaluator:
+    """
+    Evaluates the PathOptimizer cost (length, smoothness, obstacle and
+    altitude terms, clipped and weighted as in PathOptimizer.total_cost) of
+    paths against one obstacle map. Build it once per map and call evaluate
+    or evaluate_batch for every candidate.
+    """
+
+    def __init__(
+        self,
+        obstacles: Union[List[Dict], ObstacleSet],
+        safety_margin: float = 5.0,
+        weights: Dict[str, float] = None,
+        dim: int = 2,
+        altitude_limits: Tuple[float, float] = None,
+        obstacle_model: str = 'waypoints',
+        duration: float = None,
+        departure_time: float = 0.0,
+        moving_obstacles: MovingObstacleSet = None,
+        distance_field: DistanceField = None,
+        field_cell_size: float = None,
+        profile: bool = False
+    ):
+        """
+        Initialize the evaluator.
+
+        Args:
+            obstacles: Obstacles as for PathOptimizer, or a prebuilt ObstacleSet
+            safety_margin: Additional safety distance around obstacles
+            weights: Dictionary with keys 'length', 'smoothness', 'obstacle'
+                and optionally 'altitude'
+            dim: Dimension of the paths (2 or 3)
+            altitude_limits: Optional (z_min, z_max) for 3D paths
+            obstacle_model: 'waypoints' or 'segments', see PathOptimizer
+            duration: Time from start to goal, required with moving obstacles
+            departure_time: Time at which paths leave their first waypoint
+            moving_obstacles: Prebuilt MovingObstacleSet to share
+            distance_field: Prebuilt DistanceField to share
+            field_cell_size: Grid spacing when rasterizing polygon obstacles
+            profile: Record timers per cost term and the number of evaluated
+                paths in self.profile (see profiling.py)
+        """
+        if dim not in DIMENSIONS:
+            raise ValueError(f"paths must have one of {DIMENSIONS} coordinates, got {dim}")
+        if obstacle_model not in OBSTACLE_MODELS:
+            raise ValueError(f"obstacle_model must be one of {OBSTACLE_MODELS}, got {obstacle_model!r}")
+        if altitude_limits is not None and dim != 3:
+            raise ValueError("altitude_limits need 3D paths")
+
+        self.dim = dim
+        self.safety_margin = safety_margin
+        self.altitude_limits = altitude_limits
+        self.obstacle_model = obstacle_model
+        self.duration = duration
+        self.departure_time = departure_time
+        self.obstacle_set, self.moving_obstacles, self.distance_field = build_obstacle_models(
+            obstacles, safety_margin, dim, moving_obstacles, distance_field, field_cell_size
+        )
+        if self.moving_obstacles is not None and duration is None:
+            raise ValueError("duration is required with moving obstacles")
+
+        weights = weights or {}
+        self.weights = {
+            'length': weights.get('length', 1.0),
+            'smoothness': weights.get('smoothness', 50.0),
+            'obstacle': weights.get('obstacle', 1000.0),
+            'altitude': weights.get('altitude', 1000.0)
+        }
+        self.profile = Profile() if profile else None
+
+    def evaluate(self, path: np.ndarray) -> Dict[str, float]:
+        """
+        Cost of one path.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+
+        Returns:
+            Dictionary with 'total_cost', 'length_cost', 'smoothness_cost',
+            'obstacle_cost' and 'altitude_cost' (unweighted terms)
+        """
+        path = np.asarray(path, dtype=float)
+        costs = self.evaluate_batch(path[None])
+        return {key: float(values[0]) for key, values in costs.items()}
+
+    def evaluate_batch(self, paths: Union[np.ndarray, Sequence]) -> Dict[str, np.ndarray]:
+        """
+        Cost of many paths.
+
+        Args:
+            paths: Array (n_paths, n_points, dim), or a sequence of paths that
+                may differ in length (evaluated in one pass per length)
+
+        Returns:
+            Dictionary with 'total_cost', 'length_cost', 'smoothness_cost',
+            'obstacle_cost' and 'altitude_cost', each an array (n_paths,)
+        """
+        if not isinstance(paths, np.ndarray) or paths.dtype == object:
+            paths = [np.asarray(path, dtype=float) for path in paths]
+            if len({path.shape for path in paths}) > 1:
+                return self._evaluate_ragged(paths)
+            paths = np.stack(paths) if paths else np.zeros((0, 0, self.dim))
+
+        paths = np.asarray(paths, dtype=float)
+        if paths.ndim != 3 or (paths.size and paths.shape[2] != self.dim):
+            raise ValueError(f"paths must have shape (n_paths, n_points, {self.dim}), got {paths.shape}")
+
+        terms = {}
+        with optional_timer(self.profile, 'cost_length'):
+            terms['length'] = length_cost(paths)
+        with optional_timer(self.profile, 'cost_smoothness'):
+            terms['smoothness'] = smoothness_cost(paths)
+        with optional_timer(self.profile, 'cost_obstacle'):
+            terms['obstacle'] = self._obstacle_costs(paths)
+        with optional_timer(self.profile, 'cost_altitude'):
+            terms['altitude'] = self._altitude_costs(paths)
+        if self.profile is not None:
+            self.profile.count('cost_evaluations', len(paths))
+
+        # Clip individual costs to prevent overflow, as PathOptimizer.total_cost does
+        total = np.zeros(len(paths))
+        with np.errstate(over='ignore', invalid='ignore'):
+            for name in COST_TERMS:
+                terms[name] = np.minimum(terms[name], 1e12)
+                total += self.weights[name] * terms[name]
+        total = np.where(np.isfinite(total), total, 1e15)
+
+        return {'total_cost': total, **{f"{name}_cost": terms[name] for name in COST_TERMS}}
+
+    def _evaluate_ragged(self, paths: List[np.ndarray]) -> Dict[str, np.ndarray]:
+        # Group paths of the same shape, evaluate each group at once and scatter back
+        costs = {key: np.zeros(len(paths)) for key in ('total_cost',) + tuple(f"{n}_cost" for n in COST_TERMS)}
+        groups = {}
+        for index, path in enumerate(paths):
+            groups.setdefault(path.shape, []).append(index)
+        for indices in groups.values():
+            group = self.evaluate_batch(np.stack([paths[index] for index in indices]))
+            for key, values in group.items():
+                costs[key][indices] = values
+        return costs
+
+    def _obstacle_costs(self, paths: np.ndarray) -> np.ndarray:
+        n_paths, n_points, _ = paths.shape
+        costs = np.zeros(n_paths)
+        if n_paths == 0 or n_points == 0:
+            return costs
+
+        if self.obstacle_model == 'segments':
+            costs += self._segment_costs(paths, self.obstacle_set.segment_contacts)
+            if self.distance_field is not None:
+                costs += self._segment_costs(
+                    paths, lambda path: self.distance_field.segment_contacts(path, self.safety_margin))
+
+        # Intermediate waypoints (not start and goal) of every path as one point array
+        n_inner = n_points - 2
+        if n_inner <= 0:
+            return costs
+        inner = paths[:, 1:-1].reshape(-1, self.dim)
+        contacts = []
+        if self.obstacle_model == 'waypoints':
+            contacts.append(self.obstacle_set.contacts(inner))
+            if self.distance_field is not None:
+                contacts.append(self.distance_field.contacts(inner, self.safety_margin))
+        if self.moving_obstacles is not None:
+            times = self.departure_time + self.duration * np.linspace(0.0, 1.0, n_points)[1:-1]
+            contacts.append(self.moving_obstacles.contacts(inner, np.tile(times, n_paths)))
+        for point_index, _, violation in contacts:
+            costs += np.bincount(point_index // n_inner, weights=violation ** 2, minlength=n_paths)
+        return costs
+
+    def _segment_costs(self, paths: np.ndarray, segment_contacts) -> np.ndarray:
+        # Chain the paths into one and drop the segments joining one path to the next,
+        # at most MAX_SEGMENT_PAIRS segments at a time (the obstacle models bound their own pairs)
+        n_paths, n_points, _ = paths.shape
+        costs = np.zeros(n_paths)
+        chunk = max(MAX_SEGMENT_PAIRS // n_points, 1)
+        for first in range(0, n_paths, chunk):
+            chained = paths[first:first + chunk].reshape(-1, self.dim)
+            segment_index, _, _, violation = segment_contacts(chained)
+            within = segment_index % n_points != n_points - 1
+            costs[first:first + chunk] += np.bincount(
+                segment_index[within] // n_points, weights=violation[within] ** 2,
+                minlength=min(chunk, n_paths - first)
+            )
+        return costs
+
+    def _altitude_costs(self, paths: np.ndarray) -> np.ndarray:
+        if self.altitude_limits is None:
+            return np.zeros(len(paths))
+        z_min, z_max = self.altitude_limits
+        z = paths[:, 1:-1, 2]
+        return np.sum(np.maximum(z_min - z, 0.0) ** 2 + np.maximum(z - z_max, 0.0) ** 2, axis=1)
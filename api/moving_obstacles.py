@@ -0,0 +1,212 @@
+"""
+Moving obstacles for the path optimizer
+Circular obstacles following known trajectories, checked at each waypoint's arrival time
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+def is_moving(obstacle: Dict) -> bool:
+    """Whether an obstacle dict describes a moving obstacle."""
+    return 'velocity' in obstacle or 'trajectory' in obstacle
+
+
+def split_obstacles(obstacles: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Separate static from moving obstacle dicts.
+
+    Args:
+        obstacles: List of obstacles in the API representation
+
+    Returns:
+        Tuple of (static obstacles, moving obstacles)
+    """
+    static = [obstacle for obstacle in obstacles if not is_moving(obstacle)]
+    moving = [obstacle for obstacle in obstacles if is_moving(obstacle)]
+    return static, moving
+
+
+class MovingObstacleSet:
+    """
+    Circular obstacles whose centers move over time, stored as padded arrays.
+    Each obstacle follows piecewise-linear keyframes (held at the first and
+    last keyframe outside their time range) plus a constant velocity drift
+    measured from its first keyframe. A constant-velocity obstacle is one
+    keyframe with a velocity, a trajectory obstacle has zero velocity.
+    Positions, costs and gradients are evaluated for all waypoints and
+    obstacles at once.
+    """
+
+    def __init__(
+        self,
+        key_times: np.ndarray,
+        key_positions: np.ndarray,
+        key_counts: np.ndarray,
+        velocities: np.ndarray,
+        radii: np.ndarray,
+        safety_margin: float = 5.0
+    ):
+        """
+        Initialize the moving obstacle set.
+
+        Args:
+            key_times: Keyframe times (n_obstacles, max_keys), increasing, padding ignored
+            key_positions: Keyframe centers (n_obstacles, max_keys, dim)
+            key_counts: Number of valid keyframes per obstacle (n_obstacles,), at least 1
+            velocities: Constant drift velocity per obstacle (n_obstacles, dim)
+            radii: Obstacle radii (n_obstacles,)
+            safety_margin: Additional safety distance around obstacles
+        """
+        self.key_counts = np.asarray(key_counts, dtype=np.int64).reshape(-1)
+        n_obstacles = len(self.key_counts)
+        self.key_times = np.asarray(key_times, dtype=float).reshape(n_obstacles, -1)
+        self.key_positions = np.asarray(key_positions, dtype=float)
+        self.dim = self.key_positions.shape[-1]
+        self.key_positions = self.key_positions.reshape(n_obstacles, -1, self.dim)
+        self.velocities = np.asarray(velocities, dtype=float).reshape(n_obstacles, self.dim)
+        self.radii = np.asarray(radii, dtype=float).reshape(n_obstacles)
+        if np.any(self.key_counts < 1):
+            raise ValueError("every moving obstacle needs at least one keyframe")
+
+        self.safety_margin = safety_margin
+
+        # Squared effective radius (including safety margin)
+        self.inflated_sq = (self.radii + safety_margin) ** 2
+
+        valid = np.arange(self.key_times.shape[1])[None, :] < self.key_counts[:, None]
+        if np.any(np.diff(self.key_times, axis=1)[valid[:, 1:]] <= 0):
+            raise ValueError("trajectory times must be strictly increasing")
+
+        # Padding times never count as passed, so segment lookup ignores them
+        self.key_times = np.where(valid, self.key_times, np.inf)
+
+    @classmethod
+    def from_dicts(cls, obstacles: List[Dict], safety_margin: float = 5.0, dim: int = 2) -> 'MovingObstacleSet':
+        """
+        Build a moving obstacle set from the API representation.
+
+        Args:
+            obstacles: List of obstacles, each with 'radius' and either 'center'
+                (x, y) at time 0 plus 'velocity' (vx, vy), or 'trajectory'
+                [[t, x, y], ...] (with z after y in 3D)
+            safety_margin: Additional safety distance around obstacles
+            dim: Path dimension (2 or 3)
+
+        Returns:
+            MovingObstacleSet holding the same obstacles
+        """
+        keyframes = []
+        velocities = []
+        for obstacle in obstacles:
+            if 'trajectory' in obstacle:
+                keyframes.append(np.asarray(obstacle['trajectory'], dtype=float).reshape(-1, 1 + dim))
+            else:
+                keyframes.append(np.array([[0.0, *obstacle['center']]], dtype=float).reshape(-1, 1 + dim))
+            velocities.append(obstacle.get('velocity', (0.0,) * dim))
+
+        key_counts = np.array([len(frames) for frames in keyframes], dtype=np.int64)
+        max_keys = int(key_counts.max(initial=1))
+        key_times = np.zeros((len(keyframes), max_keys))
+        key_positions = np.zeros((len(keyframes), max_keys, dim))
+        for j, frames in enumerate(keyframes):
+            key_times[j, :len(frames)] = frames[:, 0]
+            key_positions[j, :len(frames)] = frames[:, 1:]
+
+        radii = np.array([obstacle['radius'] for obstacle in obstacles], dtype=float)
+        return cls(key_times, key_positions, key_counts, np.reshape(velocities, (-1, dim)), radii, safety_margin)
+
+    def __len__(self) -> int:
+        return len(self.radii)
+
+    def positions(self, times: np.ndarray) -> np.ndarray:
+        """
+        Obstacle centers at the given times.
+
+        Args:
+            times: Array of times (n_times,)
+
+        Returns:
+            Array of centers (n_times, n_obstacles, dim)
+        """
+        times = np.asarray(times, dtype=float).reshape(-1)
+        counts = self.key_counts[:, None]
+
+        # Segment k runs from keyframe k to k + 1, clamped to the valid keyframes
+        passed = np.sum(self.key_times[:, None, :] <= times[None, :, None], axis=2)
+        k = np.clip(passed - 1, 0, np.maximum(counts - 2, 0))
+        k_next = np.minimum(k + 1, counts - 1)
+
+        t0 = np.take_along_axis(self.key_times, k, axis=1)
+        t1 = np.take_along_axis(self.key_times, k_next, axis=1)
+        span = np.where(k_next > k, t1 - t0, 1.0)
+        u = np.clip((times[None, :] - t0) / span, 0.0, 1.0)
+        u = np.where(k_next > k, u, 0.0)
+
+        p0 = np.take_along_axis(self.key_positions, k[:, :, None], axis=1)
+        p1 = np.take_along_axis(self.key_positions, k_next[:, :, None], axis=1)
+        centers = p0 + (p1 - p0) * u[:, :, None]
+
+        # Constant velocity drift from the first keyframe
+        drift = times[None, :, None] - self.key_times[:, :1, None]
+        centers = centers + self.velocities[:, None, :] * drift
+
+        return centers.transpose(1, 0, 2)
+
+    def contacts(self, points: np.ndarray, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find every (point, obstacle) pair where the point is inside the safety
+        zone of the obstacle at that point's time.
+
+        Args:
+            points: Array of points (n_points, dim)
+            times: Arrival time of each point (n_points,)
+
+        Returns:
+            Tuple of (point_index, offset, violation) where offset is point - center
+            and violation is R_sq - d_sq (> 0) for each pair
+        """
+        if len(self) == 0 or len(points) == 0:
+            return np.zeros(0, dtype=int), np.zeros((0, self.dim)), np.zeros(0)
+
+        # Offsets from every obstacle centre at each point's time, shape (n_points, n_obstacles, dim)
+        offset = points[:, None, :] - self.positions(times)
+        d_sq = np.sum(offset ** 2, axis=2)
+        violation = self.inflated_sq[None, :] - d_sq
+
+        point_index, obstacle_index = np.nonzero(violation > 0)
+        return point_index, offset[point_index, obstacle_index], violation[point_index, obstacle_index]
+
+    def cost(self, points: np.ndarray, times: np.ndarray) -> float:
+        """
+        Calculate the penalty cost sum(max(0, R_sq - d_sq)^2) over all points.
+
+        Args:
+            points: Array of points (n_points, dim)
+            times: Arrival time of each point (n_points,)
+
+        Returns:
+            Obstacle cost value
+        """
+        _, _, violation = self.contacts(points, times)
+        return float(np.sum(violation ** 2))
+
+    def gradient(self, points: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """
+        Calculate the gradient of the penalty cost with respect to each point
+        (arrival times are fixed).
+
+        Args:
+            points: Array of points (n_points, dim)
+            times: Arrival time of each point (n_points,)
+
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = np.zeros((len(points), self.dim))
+        point_index, offset, violation = self.contacts(points, times)
+
+        # d/dp (max(0, R_sq - d_sq)^2) = 2 * violation * (-2 * (p - c(t)))
+        np.add.at(grad, point_index, -4 * violation[:, None] * offset)
+
+        return grad
@@ -0,0 +1,95 @@
+"""
+Multi-resolution helpers for the path optimizer
+Choose coarse waypoint counts and upsample coarse paths to finer ones
+"""
+
+import numpy as np
+from typing import Dict, List
+
+# Supported upsampling methods
+INTERPOLATIONS = ('linear', 'spline')
+
+# Coarsest waypoint count worth optimizing
+MIN_LEVEL_POINTS = 5
+
+
+def resolution_levels(n_points: int, levels: int) -> List[int]:
+    """
+    Waypoint counts from coarsest to finest, halving the segment count per level.
+    Every coarse waypoint coincides with a waypoint of the next level.
+
+    Args:
+        n_points: Waypoint count of the finest level
+        levels: Maximum number of levels (1 means just n_points)
+
+    Returns:
+        List of waypoint counts ending with n_points
+    """
+    counts = [n_points]
+    while len(counts) < levels:
+        coarser = (counts[0] - 1) // 2 + 1
+        if coarser < MIN_LEVEL_POINTS or coarser == counts[0]:
+            break
+        counts.insert(0, coarser)
+    return counts
+
+
+def scale_weights(weights: Dict[str, float], n_points: int, n_fine: int) -> Dict[str, float]:
+    """
+    Rescale cost weights for a coarser waypoint count.
+    With waypoint spacing h, the length cost scales with h, smoothness with
+    h^3 and the obstacle cost with 1/h, so these weights make every level
+    approximate the same continuous cost as the finest one.
+
+    Args:
+        weights: Weights of the finest level ('length', 'smoothness', 'obstacle', optionally 'altitude')
+        n_points: Waypoint count of the level
+        n_fine: Waypoint count of the finest level
+
+    Returns:
+        Weights for the level
+    """
+    ratio = (n_points - 1) / (n_fine - 1)
+    scaled = {
+        'length': weights['length'] * ratio,
+        'smoothness': weights['smoothness'] * ratio ** 3,
+        'obstacle': weights['obstacle'] / ratio
+    }
+    if 'altitude' in weights:
+        # Per-waypoint penalty like the obstacle cost
+        scaled['altitude'] = weights['altitude'] / ratio
+    return scaled
+
+
+def upsample_path(path: np.ndarray, n_points: int, interpolation: str = 'linear') -> np.ndarray:
+    """
+    Resample a path to a new waypoint count, uniformly in the waypoint index.
+
+    Args:
+        path: Array of waypoints (n, dim)
+        n_points: Waypoint count of the result
+        interpolation: 'linear' or 'spline' (Catmull-Rom through the waypoints)
+
+    Returns:
+        Array of waypoints (n_points, dim) with the same start and goal
+    """
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"interpolation must be one of {INTERPOLATIONS}, got {interpolation!r}")
+
+    n = len(path)
+    position = np.linspace(0.0, n - 1, n_points)
+    segment = np.minimum(position.astype(int), n - 2)
+    u = (position - segment)[:, None]
+
+    if interpolation == 'linear':
+        return path[segment] * (1 - u) + path[segment + 1] * u
+
+    # Catmull-Rom with the end waypoints repeated as outer control points
+    padded = np.vstack([path[:1], path, path[-1:]])
+    p0, p1, p2, p3 = padded[segment], padded[segment + 1], padded[segment + 2], padded[segment + 3]
+    return 0.5 * (
+        2 * p1 +
+        (p2 - p0) * u +
+        (2 * p0 - 5 * p1 + 4 * p2 - p3) * u ** 2 +
+        (3 * p1 - p0 - 3 * p2 + p3) * u ** 3
+    )
@@ -0,0 +1,53 @@
+"""
+Obstacle models shared by PathOptimizer and CostEvaluator
+Splits obstacle dictionaries into the static, moving and polygon structures the cost terms use
+"""
+
+from typing import Dict, List, Optional, Tuple, Union
+
+from obstacles import ObstacleSet
+from moving_obstacles import MovingObstacleSet, split_obstacles
+from distance_field import DistanceField, split_polygons
+
+# Supported ways of penalizing static obstacles: at the waypoints, or along the segments between them
+OBSTACLE_MODELS = ('waypoints', 'segments')
+
+
+def build_obstacle_models(obstacles: Union[List[Dict], ObstacleSet], safety_margin: float, dim: int,
+                          moving_obstacles: MovingObstacleSet = None, distance_field: DistanceField = None,
+                          field_cell_size: float = None
+                          ) -> Tuple[ObstacleSet, Optional[MovingObstacleSet], Optional[DistanceField]]:
+    """
+    Split obstacles into the structures the cost terms use.
+
+    Args:
+        obstacles: List of obstacle dictionaries (circles, moving obstacles and
+            polygons), or a prebuilt ObstacleSet to share
+        safety_margin: Additional safety distance around obstacles
+        dim: Path dimension (2 or 3)
+        moving_obstacles: Prebuilt MovingObstacleSet, used instead of any moving obstacles in obstacles
+        distance_field: Prebuilt DistanceField, used instead of any polygons in obstacles
+        field_cell_size: Grid spacing when rasterizing polygon obstacles
+
+    Returns:
+        Tuple of (obstacle_set, moving_obstacles or None, distance_field or None)
+
+    Raises:
+        ValueError: If a prebuilt ObstacleSet has another dimension than the path
+    """
+    if isinstance(obstacles, ObstacleSet):
+        if obstacles.dim != dim:
+            raise ValueError(f"obstacle set is {obstacles.dim}D but the path is {dim}D")
+        if obstacles.safety_margin != safety_margin:
+            obstacles = ObstacleSet(obstacles.centers, obstacles.radii, safety_margin, obstacles.spatial_index,
+                                    obstacles.heights)
+        obstacle_set = obstacles
+    else:
+        static, moving = split_obstacles(obstacles)
+        static, polygons = split_polygons(static)
+        obstacle_set = ObstacleSet.from_dicts(static, safety_margin, dim=dim)
+        if moving and moving_obstacles is None:
+            moving_obstacles = MovingObstacleSet.from_dicts(moving, safety_margin, dim=dim)
+        if polygons and distance_field is None:
+            distance_field = DistanceField.from_dicts(polygons, field_cell_size, padding=safety_margin)
+    return obstacle_set, moving_obstacles or None, distance_field
@@ -0,0 +1,737 @@
+"""
+Obstacle storage for the path optimizer
+Keeps circular (2D) or spherical and cylindrical (3D) obstacles in contiguous
+arrays so penalties can be vectorized
+"""
+
+import numpy as np
+from typing import Iterator, List, Dict, Optional, Tuple
+
+# Obstacle count from which ObstacleSet builds a spatial index by default
+SPATIAL_INDEX_MIN_OBSTACLES = 64
+
+# Supported spatial index options for ObstacleSet
+SPATIAL_INDEXES = ('auto', 'grid', 'none')
+
+# Fraction of obstacles changed since the grid was built that triggers a rebuild
+GRID_REBUILD_FRACTION = 0.125
+
+# Supported path dimensions
+DIMENSIONS = (2, 3)
+
+# Largest number of (segment, obstacle) pairs tested at once, bounding temporary arrays
+MAX_SEGMENT_PAIRS = 1_000_000
+
+
+def obstacle_arrays(obstacles: List[Dict], dim: int = 2) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Convert obstacles from the API representation to arrays.
+    In 2D every obstacle is a circle with 'center' (x, y). In 3D an obstacle
+    with 'center' (x, y, z) is a sphere and one with 'center' (x, y) is a
+    vertical cylinder (a building) from 'base' (default 0) to 'top' (default
+    unbounded).
+
+    Args:
+        obstacles: List of obstacles, each with 'center' and 'radius'
+        dim: Path dimension (2 or 3)
+
+    Returns:
+        Tuple of (centers (n, dim), radii (n,), heights (n,) or None in 2D),
+        where a cylinder's center is the middle of its base
+    """
+    if dim not in DIMENSIONS:
+        raise ValueError(f"dim must be one of {DIMENSIONS}, got {dim!r}")
+    radii = np.array([obstacle['radius'] for obstacle in obstacles], dtype=float)
+    if dim == 2:
+        centers = np.array([obstacle['center'] for obstacle in obstacles], dtype=float).reshape(-1, 2)
+        return centers, radii, None
+
+    centers = np.zeros((len(obstacles), 3))
+    heights = np.zeros(len(obstacles))
+    for j, obstacle in enumerate(obstacles):
+        center = obstacle['center']
+        if len(center) == 3:
+            centers[j] = center
+        elif len(center) == 2:
+            base = obstacle.get('base', 0.0)
+            centers[j] = (center[0], center[1], base)
+            heights[j] = obstacle.get('top', np.inf) - base
+        else:
+            raise ValueError(f"obstacle center must have 2 or 3 coordinates, got {len(center)}")
+    if np.any(heights < 0):
+        raise ValueError("cylinder top must not be below its base")
+    return centers, radii, heights
+
+
+class UniformGrid:
+    """
+    Uniform hash grid over inflated obstacle discs.
+    Every obstacle is registered in each cell its bounding box overlaps, so a
+    point only needs to be tested against the obstacles listed in its own cell.
+    """
+
+    def __init__(self, centers: np.ndarray, reach: np.ndarray, cell_size: float = None):
+        """
+        Build the grid over a non-empty set of obstacles.
+
+        Args:
+            centers: Array of obstacle centers (n_obstacles, 2)
+            reach: Distance from each center beyond which it has no effect (n_obstacles,)
+            cell_size: Grid cell edge length (defaults to the median obstacle diameter)
+        """
+        if cell_size is None:
+            cell_size = 2 * float(np.median(reach)) if len(reach) else 1.0
+        self.cell_size = max(cell_size, 1e-9)
+
+        lower = centers - reach[:, None]
+        upper = centers + reach[:, None]
+        self.origin = lower.min(axis=0)
+
+        cell_lo = np.floor((lower - self.origin) / self.cell_size).astype(np.int64)
+        cell_hi = np.floor((upper - self.origin) / self.cell_size).astype(np.int64)
+        self.shape = cell_hi.max(axis=0) + 1
+        self.n_obstacles = len(centers)
+
+        # One (cell, obstacle) entry per overlapped cell
+        span = cell_hi - cell_lo + 1
+        counts = span[:, 0] * span[:, 1]
+        obstacle_index = np.repeat(np.arange(len(centers)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = cell_lo[obstacle_index, 0] + local // span[obstacle_index, 1]
+        cell_y = cell_lo[obstacle_index, 1] + local % span[obstacle_index, 1]
+        keys = cell_x * self.shape[1] + cell_y
+
+        # Compressed cell -> obstacle lists, sorted by cell key
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        self.cell_obstacles = obstacle_index[order]
+        self.cell_keys, self.cell_start, cell_counts = np.unique(keys, return_index=True, return_counts=True)
+        self.cell_end = self.cell_start + cell_counts
+
+    def query(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find candidate (point, obstacle) pairs for a set of points.
+
+        Args:
+            points: Array of points (n_points, 2)
+
+        Returns:
+            Tuple of (point_index, obstacle_index) arrays
+        """
+        cell = np.floor((points - self.origin) / self.cell_size)
+        inside = np.all((cell >= 0) & (cell < self.shape), axis=1)
+        keys = np.where(inside, cell[:, 0] * self.shape[1] + cell[:, 1], -1).astype(np.int64)
+        return self._cell_members(keys)
+
+    def _box_cells(self, lower: np.ndarray, upper: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # First cell and (x, y) cell span of each box, clipped to the grid
+        cell_lo = np.maximum(np.floor((lower - self.origin) / self.cell_size), 0).astype(np.int64)
+        cell_hi = np.minimum(np.floor((upper - self.origin) / self.cell_size), self.shape - 1).astype(np.int64)
+        return cell_lo, np.maximum(cell_hi - cell_lo + 1, 0)
+
+    def box_cell_counts(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """
+        Number of grid cells each axis-aligned box covers.
+
+        Args:
+            lower: Lower corners of the boxes (n_boxes, 2)
+            upper: Upper corners of the boxes (n_boxes, 2)
+
+        Returns:
+            Cell count per box (n_boxes,)
+        """
+        _, span = self._box_cells(lower, upper)
+        return span[:, 0] * span[:, 1]
+
+    def query_boxes(self, lower: np.ndarray, upper: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find candidate (box, obstacle) pairs for axis-aligned boxes, e.g. the
+        bounding boxes of path segments. Obstacles are registered in every cell
+        their inflated disc overlaps, so any obstacle a box touches is listed.
+
+        Args:
+            lower: Lower corners of the boxes (n_boxes, 2)
+            upper: Upper corners of the boxes (n_boxes, 2)
+
+        Returns:
+            Tuple of (box_index, obstacle_index) arrays without duplicates
+        """
+        cell_lo, span = self._box_cells(lower, upper)
+        counts = span[:, 0] * span[:, 1]
+
+        # One key per (box, covered cell)
+        box_index = np.repeat(np.arange(len(lower)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = cell_lo[box_index, 0] + local // span[box_index, 1]
+        cell_y = cell_lo[box_index, 1] + local % span[box_index, 1]
+        key_index, obstacle_index = self._cell_members(cell_x * self.shape[1] + cell_y)
+
+        # An obstacle registered in several cells of a box is listed once
+        pairs = np.unique(box_index[key_index] * self.n_obstacles + obstacle_index)
+        return pairs // self.n_obstacles, pairs % self.n_obstacles
+
+    def _cell_members(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Locate each cell key among the occupied cells and list its obstacles
+        slot = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = (keys >= 0) & (self.cell_keys[slot] == keys)
+        counts = np.where(found, self.cell_end[slot] - self.cell_start[slot], 0)
+
+        key_index = np.repeat(np.arange(len(keys)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        obstacle_index = self.cell_obstacles[self.cell_start[slot][key_index] + local]
+
+        return key_index, obstacle_index
+
+
+class ObstacleSet:
+    """
+    Circular obstacles stored as contiguous arrays.
+    The squared radius inflated by the safety margin is precomputed once,
+    so cost and gradient evaluations never touch the original dicts.
+    Large sets are additionally indexed with a UniformGrid.
+    
+    In 3D each obstacle is a vertical segment from its center up by its
+    height, inflated by its radius: a sphere has height 0, a building
+    cylinder is a capsule whose top is rounded by the inflated radius. The
+    penalty uses the offset from the nearest point of the segment, and the
+    grid indexes the x/y footprint.
+    
+    Obstacles can be added, removed and moved in place (add, remove, move).
+    Each obstacle keeps a stable id; the arrays grow geometrically and stay
+    dense (a removed slot is filled with the last obstacle). Obstacles
+    changed since the grid was built are marked dirty and tested without the
+    grid until enough have changed to make a rebuild worthwhile, so an
+    update costs time proportional to the change.
+    """
+
+    def __init__(
+        self,
+        centers: np.ndarray,
+        radii: np.ndarray,
+        safety_margin: float = 5.0,
+        spatial_index: str = 'auto',
+        heights: np.ndarray = None
+    ):
+        """
+        Initialize the obstacle set.
+
+        Args:
+            centers: Array of obstacle centers (n_obstacles, 2) or (n_obstacles, 3)
+            radii: Array of obstacle radii (n_obstacles,)
+            safety_margin: Additional safety distance around obstacles
+            spatial_index: 'grid' always builds a UniformGrid, 'none' never does,
+                'auto' builds one from SPATIAL_INDEX_MIN_OBSTACLES obstacles
+            heights: Vertical extent above each center in 3D (n_obstacles,),
+                defaults to 0 (spheres); must be None in 2D
+        """
+        if spatial_index not in SPATIAL_INDEXES:
+            raise ValueError(f"spatial_index must be one of {SPATIAL_INDEXES}, got {spatial_index!r}")
+
+        centers = np.asarray(centers, dtype=float)
+        if centers.ndim != 2:
+            centers = centers.reshape(-1, 2)
+        radii = np.asarray(radii, dtype=float).reshape(-1)
+        if len(centers) != len(radii):
+            raise ValueError("centers and radii must have the same length")
+        if centers.shape[1] not in DIMENSIONS:
+            raise ValueError(f"centers must have one of {DIMENSIONS} coordinates, got {centers.shape[1]}")
+
+        self.dim = centers.shape[1]
+        if self.dim == 2 and heights is not None:
+            raise ValueError("heights are only supported in 3D")
+        if self.dim == 3:
+            heights = np.zeros(len(radii)) if heights is None else np.asarray(heights, dtype=float).reshape(-1)
+
+        self.safety_margin = safety_margin
+        self.spatial_index = spatial_index
+
+        # Storage with spare capacity; the public arrays are views of the first _size rows
+        self._size = len(radii)
+        self._centers = centers.copy()
+        self._radii = radii.copy()
+        # Squared effective radius (including safety margin)
+        self._inflated_sq = (radii + safety_margin) ** 2
+        self._heights = None if heights is None else heights.copy()
+        self._ids = np.arange(self._size, dtype=np.int64)
+        self._slots = dict(zip(range(self._size), range(self._size)))
+        self.next_id = self._size
+
+        self._build_grid()
+
+    @property
+    def centers(self) -> np.ndarray:
+        """Obstacle centers (n_obstacles, dim)."""
+        return self._centers[:self._size]
+
+    @property
+    def radii(self) -> np.ndarray:
+        """Obstacle radii (n_obstacles,)."""
+        return self._radii[:self._size]
+
+    @property
+    def inflated_sq(self) -> np.ndarray:
+        """Squared radii inflated by the safety margin (n_obstacles,)."""
+        return self._inflated_sq[:self._size]
+
+    @property
+    def heights(self) -> Optional[np.ndarray]:
+        """Vertical extent above each center in 3D (n_obstacles,), None in 2D."""
+        return None if self._heights is None else self._heights[:self._size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Stable obstacle ids, in array order (n_obstacles,)."""
+        return self._ids[:self._size]
+
+    def _build_grid(self):
+        # Index every obstacle from scratch; none are dirty afterwards
+        self.grid = None
+        self._dirty = np.zeros(len(self._radii), dtype=bool)
+        self._dirty_count = 0
+        use_grid = self.spatial_index == 'grid' or (
+            self.spatial_index == 'auto' and self._size >= SPATIAL_INDEX_MIN_OBSTACLES
+        )
+        if use_grid and self._size > 0:
+            self.grid = UniformGrid(self.centers[:, :2], self.radii + self.safety_margin)
+
+    def _mark_dirty(self, slots: np.ndarray):
+        # The grid's entries for these slots no longer describe them
+        slots = slots[~self._dirty[slots]]
+        self._dirty[slots] = True
+        self._dirty_count += len(slots)
+        if self._dirty_count > max(SPATIAL_INDEX_MIN_OBSTACLES, GRID_REBUILD_FRACTION * self._size):
+            self._build_grid()
+        elif self.grid is None and self.spatial_index == 'auto' and self._size >= 2 * SPATIAL_INDEX_MIN_OBSTACLES:
+            self._build_grid()
+
+    def _reserve(self, size: int):
+        capacity = len(self._radii)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        for name in ('_centers', '_radii', '_inflated_sq', '_heights', '_ids', '_dirty'):
+            old = getattr(self, name)
+            if old is None:
+                continue
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _slots_of(self, ids) -> np.ndarray:
+        try:
+            return np.array([self._slots[int(obstacle_id)] for obstacle_id in ids], dtype=np.int64)
+        except KeyError as e:
+            raise KeyError(f"Unknown obstacle id {e.args[0]}") from None
+
+    def add(self, centers: np.ndarray, radii: np.ndarray, heights: np.ndarray = None) -> np.ndarray:
+        """
+        Add obstacles.
+
+        Args:
+            centers: Array of obstacle centers (k, dim)
+            radii: Array of obstacle radii (k,)
+            heights: Vertical extents in 3D (k,), defaults to 0
+
+        Returns:
+            Ids of the new obstacles (k,)
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, self.dim)
+        radii = np.asarray(radii, dtype=float).reshape(-1)
+        if len(centers) != len(radii):
+            raise ValueError("centers and radii must have the same length")
+
+        start, count = self._size, len(radii)
+        self._reserve(start + count)
+        slots = np.arange(start, start + count)
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+
+        self._centers[slots] = centers
+        self._radii[slots] = radii
+        self._inflated_sq[slots] = (radii + self.safety_margin) ** 2
+        if self._heights is not None:
+            self._heights[slots] = 0.0 if heights is None else heights
+        self._ids[slots] = ids
+        self._dirty[slots] = False
+        self._slots.update(zip(ids.tolist(), slots.tolist()))
+        self._size += count
+        self.next_id += count
+
+        self._mark_dirty(slots)
+        return ids
+
+    def remove(self, ids):
+        """
+        Remove obstacles.
+
+        Args:
+            ids: Ids of the obstacles to remove
+
+        Raises:
+            KeyError: If an id is unknown
+        """
+        ids = list(dict.fromkeys(int(obstacle_id) for obstacle_id in ids))
+        self._slots_of(ids)
+        for obstacle_id in ids:
+            slot = self._slots.pop(obstacle_id)
+            last = self._size - 1
+            self._size -= 1
+            if slot != last:
+                # Fill the hole with the last obstacle
+                for array in (self._centers, self._radii, self._inflated_sq, self._heights, self._ids):
+                    if array is not None:
+                        array[slot] = array[last]
+                self._slots[int(self._ids[slot])] = slot
+                self._mark_dirty(np.array([slot]))
+            if self._dirty[last]:
+                self._dirty[last] = False
+                self._dirty_count -= 1
+
+    def move(self, ids, centers: np.ndarray, radii: np.ndarray = None, heights: np.ndarray = None):
+        """
+        Move and optionally resize obstacles.
+
+        Args:
+            ids: Ids of the obstacles to change (k,)
+            centers: New centers (k, dim)
+            radii: New radii (k,), or None to keep them
+            heights: New vertical extents (k,) in 3D, or None to keep them
+
+        Raises:
+            KeyError: If an id is unknown
+        """
+        if self.dim == 2 and heights is not None:
+            raise ValueError("heights are only supported in 3D")
+        slots = self._slots_of(ids)
+        self._centers[slots] = np.asarray(centers, dtype=float).reshape(-1, self.dim)
+        if radii is not None:
+            self._radii[slots] = np.asarray(radii, dtype=float).reshape(-1)
+            self._inflated_sq[slots] = (self._radii[slots] + self.safety_margin) ** 2
+        if heights is not None:
+            self._heights[slots] = np.asarray(heights, dtype=float).reshape(-1)
+        self._mark_dirty(slots)
+
+    @classmethod
+    def from_dicts(cls, obstacles: List[Dict], safety_margin: float = 5.0, spatial_index: str = 'auto',
+                   dim: int = 2) -> 'ObstacleSet':
+        """
+        Build an obstacle set from the API representation.
+
+        Args:
+            obstacles: List of obstacles, see obstacle_arrays
+            safety_margin: Additional safety distance around obstacles
+            spatial_index: Spatial index option, see __init__
+            dim: Path dimension (2 or 3)
+
+        Returns:
+            ObstacleSet holding the same obstacles
+        """
+        centers, radii, heights = obstacle_arrays(obstacles, dim)
+        return cls(centers, radii, safety_margin, spatial_index, heights)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, obstacle_id) -> bool:
+        return int(obstacle_id) in self._slots
+
+    def to_dicts(self) -> List[Dict]:
+        """
+        Convert back to the API representation.
+
+        Returns:
+            List of obstacles, each with 'id', 'center' and 'radius' (plus
+            'base' and 'top' for cylinders)
+        """
+        obstacles = [
+            {'id': obstacle_id, 'center': center, 'radius': radius}
+            for obstacle_id, center, radius in zip(self.ids.tolist(), self.centers.tolist(), self.radii.tolist())
+        ]
+        if self.heights is not None:
+            for obstacle, height in zip(obstacles, self.heights.tolist()):
+                if height > 0:
+                    base = obstacle['center'].pop()
+                    obstacle['base'], obstacle['top'] = base, base + height
+        return obstacles
+
+    def contacts(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find every (point, obstacle) pair where the point is inside the safety zone.
+
+        Args:
+            points: Array of points (n_points, dim)
+
+        Returns:
+            Tuple of (point_index, offset, violation) where offset is point - center
+            (from the nearest point of the vertical segment in 3D) and violation
+            is R_sq - d_sq (> 0) for each pair
+        """
+        if len(self) == 0 or len(points) == 0:
+            return np.zeros(0, dtype=int), np.zeros((0, self.dim)), np.zeros(0)
+
+        if self.grid is not None:
+            # Only test the obstacles registered in each point's grid cell
+            point_index, obstacle_index = self.grid.query(points[:, :2])
+            # Drop stale entries of removed slots (beyond the end, even with nothing dirty) and changed ones
+            valid = obstacle_index < self._size
+            if self._dirty_count:
+                valid[valid] = ~self._dirty[obstacle_index[valid]]
+            point_index, obstacle_index = point_index[valid], obstacle_index[valid]
+            offset = points[point_index] - self.centers[obstacle_index]
+            if self._heights is not None:
+                offset[:, 2] -= np.clip(offset[:, 2], 0.0, self.heights[obstacle_index])
+            violation = self.inflated_sq[obstacle_index] - np.sum(offset ** 2, axis=1)
+            hit = violation > 0
+            if not self._dirty_count:
+                return point_index[hit], offset[hit], violation[hit]
+
+            # Changed obstacles are tested against every point
+            dirty = np.flatnonzero(self._dirty[:self._size])
+            dirty_index, dirty_offset, dirty_violation = self._dense_contacts(points, dirty)
+            return (
+                np.concatenate([point_index[hit], dirty_index]),
+                np.concatenate([offset[hit], dirty_offset]),
+                np.concatenate([violation[hit], dirty_violation])
+            )
+
+        return self._dense_contacts(points, slice(None))
+
+    def _dense_contacts(self, points: np.ndarray, slots) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Offsets from every selected obstacle centre, shape (n_points, n_selected, dim)
+        offset = points[:, None, :] - self.centers[slots][None, :, :]
+        if self._heights is not None:
+            offset[:, :, 2] -= np.clip(offset[:, :, 2], 0.0, self.heights[slots][None, :])
+        d_sq = np.sum(offset ** 2, axis=2)
+        violation = self.inflated_sq[slots][None, :] - d_sq
+
+        point_index, obstacle_index = np.nonzero(violation > 0)
+        return point_index, offset[point_index, obstacle_index], violation[point_index, obstacle_index]
+
+    def cost(self, points: np.ndarray) -> float:
+        """
+        Calculate the penalty cost sum(max(0, R_sq - d_sq)^2) over all points.
+
+        Args:
+            points: Array of points (n_points, dim)
+
+        Returns:
+            Obstacle cost value
+        """
+        _, _, violation = self.contacts(points)
+        return float(np.sum(violation ** 2))
+
+    def point_costs(self, points: np.ndarray) -> np.ndarray:
+        """
+        Calculate the penalty cost contributed by each point separately.
+
+        Args:
+            points: Array of points (n_points, dim)
+
+        Returns:
+            Cost array (n_points,)
+        """
+        point_index, _, violation = self.contacts(points)
+        return np.bincount(point_index, weights=violation ** 2, minlength=len(points))
+
+    def gradient(self, points: np.ndarray) -> np.ndarray:
+        """
+        Calculate the gradient of the penalty cost with respect to each point.
+
+        Args:
+            points: Array of points (n_points, dim)
+
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = np.zeros((len(points), self.dim))
+        point_index, offset, violation = self.contacts(points)
+
+        # d/dp (max(0, R_sq - d_sq)^2) = 2 * violation * (-2 * (p - c))
+        np.add.at(grad, point_index, -4 * violation[:, None] * offset)
+
+        return grad
+
+    def _segment_offsets(self, path: np.ndarray, segment_index: np.ndarray,
+                         slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Closest points between path segments and obstacle cores, pair by pair.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+            segment_index: Segment of each pair (segment k joins waypoints k and k + 1)
+            slots: Obstacle slot of each pair
+
+        Returns:
+            Tuple of (s, offset): s (n_pairs,) is the position of the closest
+            point along the segment (0 at its first waypoint, 1 at its second)
+            and offset (n_pairs, dim) is that point minus the closest point of
+            the obstacle core
+        """
+        a = path[segment_index]
+        d1 = path[segment_index + 1] - a
+        r = a - self._centers[slots]
+        seg_sq = np.sum(d1 ** 2, axis=1)
+        proj = np.sum(d1 * r, axis=1)
+        degenerate = seg_sq <= 1e-12
+
+        if self._heights is None:
+            # Point cores: project the centre onto the segment
+            s = np.where(degenerate, 0.0, np.clip(-proj / np.where(degenerate, 1.0, seg_sq), 0.0, 1.0))
+            return s, r + s[:, None] * d1
+
+        # Vertical cores from the centre up by the height (segment-segment closest points)
+        h = self._heights[slots]
+        h_sq = h ** 2
+        flat = h_sq <= 1e-12
+        bb = d1[:, 2] * h
+        f = r[:, 2] * h
+        safe_seg = np.where(degenerate, 1.0, seg_sq)
+        safe_h = np.where(flat, 1.0, h_sq)
+        denom = seg_sq * h_sq - bb ** 2
+
+        s = np.where(denom > 1e-12, np.clip((bb * f - proj * h_sq) / np.where(denom > 1e-12, denom, 1.0), 0.0, 1.0), 0.0)
+        t = (bb * s + f) / safe_h
+        s = np.where(t < 0, np.clip(-proj / safe_seg, 0.0, 1.0), np.where(t > 1, np.clip((bb - proj) / safe_seg, 0.0, 1.0), s))
+        t = np.clip(t, 0.0, 1.0)
+
+        # Degenerate segments or spheres
+        s = np.where(flat, np.clip(-proj / safe_seg, 0.0, 1.0), s)
+        t = np.where(flat, 0.0, t)
+        s = np.where(degenerate, 0.0, s)
+        t = np.where(degenerate & ~flat, np.clip(f / safe_h, 0.0, 1.0), t)
+
+        offset = r + s[:, None] * d1
+        offset[:, 2] -= t * h
+        return s, offset
+
+    def _dense_pairs(self, n_segments: int, slots: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # Every (segment, slot) pair, segment-major, in chunks of at most MAX_SEGMENT_PAIRS
+        chunk = max(MAX_SEGMENT_PAIRS // max(len(slots), 1), 1)
+        for first in range(0, n_segments, chunk):
+            segments = np.arange(first, min(first + chunk, n_segments))
+            yield np.repeat(segments, len(slots)), np.tile(slots, len(segments))
+
+    def _pair_contacts(self, path: np.ndarray, segment_index: np.ndarray,
+                       slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # Keep the (segment, slot) pairs where the segment enters the safety zone
+        s, offset = self._segment_offsets(path, segment_index, slots)
+        violation = self._inflated_sq[slots] - np.sum(offset ** 2, axis=1)
+        hit = violation > 0
+        return segment_index[hit], s[hit], offset[hit], violation[hit]
+
+    def segment_contacts(self, path: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find every (segment, obstacle) pair where the segment enters the safety zone.
+        With a grid, each segment is only tested against the obstacles
+        registered in the cells its bounding box covers; otherwise every pair
+        is tested, MAX_SEGMENT_PAIRS at a time.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+
+        Returns:
+            Tuple of (segment_index, s, offset, violation) where segment k joins
+            waypoints k and k + 1, s is the position of the closest point along
+            it, offset is that point minus the nearest core point and violation
+            is R_sq - d_sq (> 0)
+        """
+        if len(self) == 0 or len(path) < 2:
+            return np.zeros(0, dtype=int), np.zeros(0), np.zeros((0, self.dim)), np.zeros(0)
+
+        n_segments = len(path) - 1
+        if self.grid is not None:
+            xy = path[:, :2]
+            lower, upper = np.minimum(xy[:-1], xy[1:]), np.maximum(xy[:-1], xy[1:])
+            cells = np.cumsum(self.grid.box_cell_counts(lower, upper))
+        if self.grid is None or cells[-1] > n_segments * self._size:
+            # No grid, or segments so long that scanning their cells costs more than testing every pair
+            return self._merge_contacts([
+                self._pair_contacts(path, segment_index, slots)
+                for segment_index, slots in self._dense_pairs(n_segments, np.arange(self._size))
+            ])
+
+        # Query the segments in chunks covering at most MAX_SEGMENT_PAIRS cells
+        bounds = np.searchsorted(cells, np.arange(MAX_SEGMENT_PAIRS, cells[-1], MAX_SEGMENT_PAIRS))
+        bounds = np.unique(np.concatenate([[0], bounds, [n_segments]]))
+        parts = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            box_index, slots = self.grid.query_boxes(lower[first:last], upper[first:last])
+            # Drop stale entries of removed and changed slots, as in contacts
+            valid = slots < self._size
+            if self._dirty_count:
+                valid[valid] = ~self._dirty[slots[valid]]
+            parts.append(self._pair_contacts(path, box_index[valid] + first, slots[valid]))
+        if self._dirty_count:
+            # Changed obstacles are tested against every segment
+            dirty = np.flatnonzero(self._dirty[:self._size])
+            parts += [self._pair_contacts(path, segment_index, slots)
+                      for segment_index, slots in self._dense_pairs(n_segments, dirty)]
+        return self._merge_contacts(parts)
+
+    @staticmethod
+    def _merge_contacts(parts: List[Tuple[np.ndarray, ...]]) -> Tuple[np.ndarray, ...]:
+        # Concatenate per-chunk contact tuples
+        if len(parts) == 1:
+            return parts[0]
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    def segment_cost(self, path: np.ndarray) -> float:
+        """
+        Calculate the penalty cost sum(max(0, R_sq - d_sq)^2) over all segments,
+        with d the distance from each segment to each obstacle.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+
+        Returns:
+            Obstacle cost value
+        """
+        _, _, _, violation = self.segment_contacts(path)
+        return float(np.sum(violation ** 2))
+
+    def segment_gradient(self, path: np.ndarray) -> np.ndarray:
+        """
+        Calculate the gradient of segment_cost with respect to each waypoint.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = np.zeros((len(path), self.dim))
+        segment_index, s, offset, violation = self.segment_contacts(path)
+
+        # The closest point moves with weight (1 - s) on the first waypoint and s on the second
+        pull = -4 * violation[:, None] * offset
+        np.add.at(grad, segment_index, (1 - s)[:, None] * pull)
+        np.add.at(grad, segment_index + 1, s[:, None] * pull)
+
+        return grad
+
+    def segment_clearance(self, path: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact clearance of each segment: the distance from the segment to the
+        nearest obstacle surface (negative inside an obstacle, safety margin
+        not included).
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+
+        Returns:
+            Tuple of (clearance, nearest) arrays (n_points - 1,) where nearest is
+            the id of the closest obstacle (inf and -1 without obstacles)
+        """
+        n_segments = max(len(path) - 1, 0)
+        if len(self) == 0 or n_segments == 0:
+            return np.full(n_segments, np.inf), np.full(n_segments, -1, dtype=np.int64)
+
+        clearance = np.empty(n_segments)
+        nearest = np.empty(n_segments, dtype=np.int64)
+        for segment_index, slots in self._dense_pairs(n_segments, np.arange(self._size)):
+            _, offset = self._segment_offsets(path, segment_index, slots)
+            distance = (np.sqrt(np.sum(offset ** 2, axis=1)) - self._radii[slots]).reshape(-1, self._size)
+            segments = segment_index[::self._size]
+            closest = np.argmin(distance, axis=1)
+            clearance[segments] = distance[np.arange(len(segments)), closest]
+            nearest[segments] = closest
+        return clearance, self.ids[nearest]
@@ -0,0 +1,89 @@
+"""
+Banded linear algebra for the path optimizer
+Builds and solves the pentadiagonal systems from the length and smoothness terms
+"""
+
+import math
+import numpy as np
+from typing import Tuple
+
+
+def quadratic_bands(n_points: int, w_len: float, w_smooth: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bands of the Hessian of w_len * cost_length + w_smooth * cost_smoothness
+    with respect to the intermediate waypoints (same for x and y).
+
+    Args:
+        n_points: Number of waypoints in the path
+        w_len: Weight of the length term
+        w_smooth: Weight of the smoothness term
+
+    Returns:
+        Tuple of (diagonal, first off-diagonal, second off-diagonal) with
+        lengths n_points - 2, n_points - 3 and n_points - 4
+    """
+    main = np.zeros(n_points)
+    off1 = np.zeros(max(n_points - 1, 0))
+    off2 = np.zeros(max(n_points - 2, 0))
+
+    # Each squared difference contributes 2 * w * s s^T over its stencil s
+    for weight, stencil in ((w_len, (-1.0, 1.0)), (w_smooth, (1.0, -2.0, 1.0))):
+        rows = n_points - len(stencil) + 1
+        if rows <= 0:
+            continue
+        for a, s_a in enumerate(stencil):
+            main[a:a + rows] += 2 * weight * s_a * s_a
+            for b in range(a + 1, len(stencil)):
+                band = off1 if b - a == 1 else off2
+                band[a:a + rows] += 2 * weight * s_a * stencil[b]
+
+    return main[1:-1], off1[1:-1], off2[1:-1]
+
+
+def solve_pentadiagonal(main: np.ndarray, off1: np.ndarray, off2: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    """
+    Solve A x = rhs for a symmetric positive definite pentadiagonal A using a
+    banded Cholesky factorization, O(n) work.
+
+    Args:
+        main: Diagonal of A (n,)
+        off1: First off-diagonal of A (n - 1,)
+        off2: Second off-diagonal of A (n - 2,)
+        rhs: Right-hand side (n,)
+
+    Returns:
+        Solution x (n,)
+    """
+    n = len(main)
+    a0, a1, a2 = main.tolist(), off1.tolist(), off2.tolist()
+
+    # Factor A = L L^T with L lower triangular of bandwidth 2
+    l0 = [0.0] * n
+    l1 = [0.0] * n
+    l2 = [0.0] * n
+    for i in range(n):
+        if i >= 2:
+            l2[i] = a2[i - 2] / l0[i - 2]
+        if i >= 1:
+            l1[i] = (a1[i - 1] - l2[i] * l1[i - 1]) / l0[i - 1]
+        l0[i] = math.sqrt(a0[i] - l1[i] * l1[i] - l2[i] * l2[i])
+
+    # Forward substitution L y = rhs
+    y = rhs.tolist()
+    for i in range(n):
+        if i >= 1:
+            y[i] -= l1[i] * y[i - 1]
+        if i >= 2:
+            y[i] -= l2[i] * y[i - 2]
+        y[i] /= l0[i]
+
+    # Back substitution L^T x = y
+    x = y
+    for i in range(n - 1, -1, -1):
+        if i + 1 < n:
+            x[i] -= l1[i + 1] * x[i + 1]
+        if i + 2 < n:
+            x[i] -= l2[i + 2] * x[i + 2]
+        x[i] /= l0[i]
+
+    return np.array(x)
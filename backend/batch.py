@@ -0,0 +1,230 @@
+"""
+Batch Path Optimization
+Runs gradient descent on many start/goal problems against the same obstacle map
+"""
+
+import numpy as np
+from typing import Callable, List, Tuple, Dict
+
+from obstacles import ObstacleSet
+from moving_obstacles import split_obstacles
+from distance_field import DistanceField, split_polygons
+from path_terms import length_cost, length_gradient, smoothness_cost, smoothness_gradient
+from step_rules import apply_update, clip_gradient
+
+
+class BatchPathOptimizer:
+    """
+    Optimizes many paths at once with the same cost function as PathOptimizer.
+    All paths are stacked into one (batch, n_points, 2) array and share a single
+    preprocessed ObstacleSet.
+    """
+
+    def __init__(
+        self,
+        starts: List[Tuple[float, float]],
+        goals: List[Tuple[float, float]],
+        obstacles: List[Dict],
+        n_points: int = 20,
+        safety_margin: float = 5.0,
+        weights: Dict[str, float] = None
+    ):
+        """
+        Initialize the batch optimizer.
+
+        Args:
+            starts: Starting point (x, y) of each problem
+            goals: Goal point (x, y) of each problem
+            obstacles: List of obstacles, each with 'center' (x, y) and 'radius',
+                or with 'polygon' [[x, y], ...] (see DistanceField)
+            n_points: Number of waypoints in every path
+            safety_margin: Additional safety distance around obstacles
+            weights: Dictionary with keys 'length', 'smoothness', 'obstacle'
+        """
+        if np.shape(starts)[-1:] != (2,) or np.shape(goals)[-1:] != (2,):
+            raise ValueError("Batch optimization supports 2D paths only")
+        self.starts = np.array(starts, dtype=float).reshape(-1, 2)
+        self.goals = np.array(goals, dtype=float).reshape(-1, 2)
+        if len(self.starts) != len(self.goals):
+            raise ValueError("starts and goals must have the same length")
+
+        self.obstacles = obstacles
+        self.n_points = n_points
+        self.safety_margin = safety_margin
+        self.batch_size = len(self.starts)
+
+        # Obstacle preprocessing shared by every path in the batch
+        if split_obstacles(obstacles)[1]:
+            raise ValueError("Batch optimization supports static obstacles only")
+        circles, polygons = split_polygons(obstacles)
+        self.obstacle_set = ObstacleSet.from_dicts(circles, safety_margin)
+        self.distance_field = DistanceField.from_dicts(polygons, padding=safety_margin) if polygons else None
+
+        # Initialize velocity for momentum
+        self.velocity = None
+
+        # Default weights
+        if weights is None:
+            weights = {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0}
+        self.w_len = weights.get('length', 1.0)
+        self.w_smooth = weights.get('smoothness', 50.0)
+        self.w_obs = weights.get('obstacle', 1000.0)
+
+        # Initialize paths with linear interpolation
+        self.paths = self._initialize_paths()
+
+        # Store cost history, one row per iteration
+        self.cost_history = []
+
+    def _initialize_paths(self) -> np.ndarray:
+        """
+        Initialize every path as a straight line from its start to its goal.
+
+        Returns:
+            Array of shape (batch, n_points, 2)
+        """
+        t = np.linspace(0.0, 1.0, self.n_points)[None, :, None]
+        return self.starts[:, None, :] * (1 - t) + self.goals[:, None, :] * t
+
+    def cost_length(self, paths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the length cost of each path.
+
+        Args:
+            paths: Array of waypoints (batch, n_points, 2)
+
+        Returns:
+            Length cost per path (batch,)
+        """
+        return length_cost(paths)
+
+    def cost_smoothness(self, paths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the smoothness cost of each path.
+
+        Args:
+            paths: Array of waypoints (batch, n_points, 2)
+
+        Returns:
+            Smoothness cost per path (batch,)
+        """
+        return smoothness_cost(paths)
+
+    def cost_obstacle(self, paths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the obstacle cost of each path (intermediate points only).
+
+        Args:
+            paths: Array of waypoints (batch, n_points, 2)
+
+        Returns:
+            Obstacle cost per path (batch,)
+        """
+        inner = paths[:, 1:self.n_points - 1]
+        point_costs = self.obstacle_set.point_costs(inner.reshape(-1, 2))
+        if self.distance_field is not None:
+            distance, _ = self.distance_field.sample(inner.reshape(-1, 2))
+            point_costs = point_costs + np.maximum(self.safety_margin - distance, 0.0) ** 2
+        return point_costs.reshape(len(paths), -1).sum(axis=1)
+
+    def total_cost(self, paths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the total weighted cost of each path.
+
+        Args:
+            paths: Array of waypoints (batch, n_points, 2)
+
+        Returns:
+            Total cost per path (batch,)
+        """
+        # Clip individual costs to prevent overflow
+        f_len = np.minimum(self.cost_length(paths), 1e12)
+        f_smooth = np.minimum(self.cost_smoothness(paths), 1e12)
+        f_obs = np.minimum(self.cost_obstacle(paths), 1e12)
+
+        total = self.w_len * f_len + self.w_smooth * f_smooth + self.w_obs * f_obs
+
+        # Return finite values
+        return np.where(np.isfinite(total), total, 1e15)
+
+    def gradient_total(self, paths: np.ndarray) -> np.ndarray:
+        """
+        Calculate the total gradient for every waypoint of every path.
+
+        Args:
+            paths: Array of waypoints (batch, n_points, 2)
+
+        Returns:
+            Gradient array (batch, n_points, 2)
+        """
+        grad_obs = self.obstacle_set.gradient(paths.reshape(-1, 2)).reshape(paths.shape)
+        if self.distance_field is not None:
+            grad_obs += self.distance_field.gradient(paths.reshape(-1, 2), self.safety_margin).reshape(paths.shape)
+
+        return (self.w_len * length_gradient(paths) +
+                self.w_smooth * smoothness_gradient(paths) +
+                self.w_obs * grad_obs)
+
+    def optimize_step(self, learning_rate: float = 0.001, momentum: float = 0.9) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Perform one gradient descent step with momentum on every path.
+        Uses the same per-waypoint clipping and overflow handling as PathOptimizer
+        (step_rules.clip_gradient and apply_update).
+
+        Args:
+            learning_rate: Step size for gradient descent
+            momentum: Momentum coefficient (0.0 to 1.0)
+
+        Returns:
+            Tuple of (updated_paths, current_costs)
+        """
+        if self.velocity is None:
+            self.velocity = np.zeros_like(self.paths)
+
+        # Update only intermediate points (not start and goal)
+        inner = slice(1, self.n_points - 1)
+        grad = clip_gradient(self.gradient_total(self.paths)[:, inner])
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            velocity = momentum * self.velocity[:, inner] - learning_rate * grad
+        new_paths = apply_update(self.paths, velocity, velocity)
+        self.velocity[:, inner] = velocity
+
+        costs = self.total_cost(new_paths)
+        self.cost_history.append(costs)
+        self.paths = new_paths
+
+        return new_paths, costs
+
+    def optimize(self, n_iterations: int = 500, learning_rate: float = 0.001, momentum: float = 0.9,
+                 on_step: Callable[[], None] = None) -> List[Dict]:
+        """
+        Run the full optimization process on every path.
+
+        Args:
+            n_iterations: Number of gradient descent iterations
+            learning_rate: Step size for gradient descent
+            momentum: Momentum coefficient (0.0 to 1.0)
+            on_step: Called after every iteration, e.g. to abort the run by raising
+
+        Returns:
+            List with one dictionary per problem containing the final 'path',
+            'initial_cost', 'final_cost' and 'cost_history'
+        """
+        self.cost_history = [self.total_cost(self.paths)]
+
+        for _ in range(n_iterations):
+            self.optimize_step(learning_rate, momentum)
+            if on_step is not None:
+                on_step()
+
+        history = np.array(self.cost_history)
+        return [
+            {
+                'path': self.paths[b].tolist(),
+                'initial_cost': float(history[0, b]),
+                'final_cost': float(history[-1, b]),
+                'cost_history': history[:, b].tolist()
+            }
+            for b in range(self.batch_size)
+        ]
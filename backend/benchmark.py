@@ -0,0 +1,343 @@
+"""
+Benchmark suite for the path optimizer
+Times the cost, gradient, step and batch cost functions and the HTTP endpoints over
+sweeps of waypoints, obstacles and iterations, writes the results as JSON
+and compares them against a baseline run
+
+Usage:
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from optimizer import PathOptimizer
+from cost_evaluator import CostEvaluator
+
+# Scene every benchmark runs in
+WIDTH, HEIGHT = 800.0, 600.0
+START, GOAL = (50.0, 300.0), (750.0, 300.0)
+
+# Fraction of the scene covered by obstacles, whatever their number
+COVERAGE = 0.3
+
+# Sweeps of the full suite and of --quick
+SWEEPS = {
+    'full': {
+        'n_points': (10, 100, 1000, 5000),
+        'n_obstacles': (1, 100, 10000, 100000),
+        'n_iterations': (10, 100, 1000),
+        'endpoint_obstacles': (10, 1000)
+    },
+    'quick': {
+        'n_points': (10, 100, 1000),
+        'n_obstacles': (1, 100, 10000),
+        'n_iterations': (10, 100),
+        'endpoint_obstacles': (10,)
+    }
+}
+
+# Fixed sizes while another parameter is swept
+BASE_POINTS = 100
+BASE_OBSTACLES = 100
+
+# Candidate paths scored per evaluate_batch call
+BATCH_PATHS = 100
+
+
+def make_obstacles(n_obstacles: int, seed: int = 0) -> List[Dict]:
+    """
+    Random circular obstacles covering COVERAGE of the scene.
+
+    Args:
+        n_obstacles: Number of obstacles
+        seed: Random seed, so every run times the same problem
+
+    Returns:
+        List of obstacles in the API representation
+    """
+    rng = np.random.default_rng(seed)
+    radius = float(np.sqrt(COVERAGE * WIDTH * HEIGHT / (np.pi * n_obstacles)))
+    centers = rng.uniform((0.0, 0.0), (WIDTH, HEIGHT), (n_obstacles, 2))
+    return [{'center': center, 'radius': radius} for center in centers.tolist()]
+
+
+def make_optimizer(n_points: int, n_obstacles: int, seed: int = 0) -> PathOptimizer:
+    """
+    Optimizer on the benchmark scene, its path a noisy straight line.
+
+    Args:
+        n_points: Number of waypoints
+        n_obstacles: Number of obstacles
+        seed: Random seed
+
+    Returns:
+        PathOptimizer ready to time
+    """
+    optimizer = PathOptimizer(START, GOAL, make_obstacles(n_obstacles, seed), n_points=n_points)
+    rng = np.random.default_rng(seed + 1)
+    optimizer.path[1:-1] += rng.normal(0.0, 5.0, optimizer.path[1:-1].shape)
+    return optimizer
+
+
+def time_call(fn: Callable, repeat: int = 5, min_time: float = 0.05) -> Dict:
+    """
+    Time a function like timeit: calls are batched so each of the repeat
+    measurements lasts at least min_time.
+
+    Args:
+        fn: Function without arguments
+        repeat: Number of measurements
+        min_time: Shortest duration of one measurement in seconds
+
+    Returns:
+        Dictionary with 'median', 'min' and 'mean' seconds per call and
+        'calls' (calls per measurement)
+    """
+    fn()  # warm up caches and lazy initialization
+
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        calls *= 2 if elapsed == 0 else min(max(int(1.5 * min_time / elapsed), 2), 100)
+
+    timings = [elapsed / calls]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - started) / calls)
+
+    return {
+        'median': float(np.median(timings)),
+        'min': float(np.min(timings)),
+        'mean': float(np.mean(timings)),
+        'calls': calls
+    }
+
+
+def benchmark_key(name: str, params: Dict) -> str:
+    """Identify a benchmark by name and parameters, e.g. total_cost[n_obstacles=100,n_points=10]."""
+    return f"{name}[{','.join(f'{key}={value}' for key, value in sorted(params.items()))}]"
+
+
+def core_cases(sweep: Dict) -> Iterator[tuple]:
+    """Yield (name, params, setup) for the optimizer benchmarks; setup returns the function to time."""
+    sizes = [(n_points, BASE_OBSTACLES) for n_points in sweep['n_points']]
+    sizes += [(BASE_POINTS, n_obstacles) for n_obstacles in sweep['n_obstacles'] if n_obstacles != BASE_OBSTACLES]
+
+    for n_points, n_obstacles in sizes:
+        params = {'n_points': n_points, 'n_obstacles': n_obstacles}
+
+        def total_cost(n_points=n_points, n_obstacles=n_obstacles):
+            optimizer = make_optimizer(n_points, n_obstacles)
+            return lambda: optimizer.total_cost(optimizer.path)
+
+        def gradient_total(n_points=n_points, n_obstacles=n_obstacles):
+            optimizer = make_optimizer(n_points, n_obstacles)
+            return lambda: optimizer.gradient_total_path(optimizer.path)
+
+        def optimize_step(n_points=n_points, n_obstacles=n_obstacles):
+            optimizer = make_optimizer(n_points, n_obstacles)
+            return lambda: optimizer.optimize_step()
+
+        def evaluate_batch(n_points=n_points, n_obstacles=n_obstacles):
+            optimizer = make_optimizer(n_points, n_obstacles)
+            evaluator = CostEvaluator(optimizer.obstacle_set)
+            rng = np.random.default_rng(2)
+            paths = optimizer.path[None] + rng.normal(0.0, 5.0, (BATCH_PATHS,) + optimizer.path.shape)
+            return lambda: evaluator.evaluate_batch(paths)
+
+        yield 'total_cost', params, total_cost
+        yield 'gradient_total', params, gradient_total
+        yield 'optimize_step', params, optimize_step
+        yield 'evaluate_batch', dict(params, n_paths=BATCH_PATHS), evaluate_batch
+
+    for n_iterations in sweep['n_iterations']:
+        params = {'n_points': BASE_POINTS, 'n_obstacles': BASE_OBSTACLES, 'n_iterations': n_iterations}
+
+        def optimize(n_iterations=n_iterations):
+            optimizer = make_optimizer(BASE_POINTS, BASE_OBSTACLES)
+            initial = optimizer.path.copy()
+
+            def run():
+                optimizer.path = initial.copy()
+                optimizer.velocity = None
+                optimizer.step_rule.reset()
+                optimizer.optimize(n_iterations=n_iterations)
+            return run
+
+        yield 'optimize', params, optimize
+
+
+def endpoint_cases(sweep: Dict) -> Iterator[tuple]:
+    """
+    Yield (name, params, setup) for the Flask endpoints, run through the test
+    client. Replaces server.pool and server.cache so requests run inline and
+    are never answered from the cache.
+    """
+    import server
+    from result_cache import ResultCache
+    from worker_pool import OptimizationPool
+
+    # Time the request handling itself: no worker processes, no cached answers
+    server.pool = OptimizationPool(max_workers=0)
+    server.cache = ResultCache(max_entries=0)
+    client = server.app.test_client()
+
+    def post(url: str, payload: Dict):
+        response = client.post(url, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} answered {response.status_code}: {response.get_data(as_text=True)}")
+
+    for n_obstacles in sweep['endpoint_obstacles']:
+        params = {'n_points': BASE_POINTS, 'n_obstacles': n_obstacles}
+        obstacles = make_obstacles(n_obstacles)
+        path = make_optimizer(BASE_POINTS, 1).path.tolist()
+        problem = {'start': START, 'goal': GOAL, 'obstacles': obstacles, 'n_points': BASE_POINTS}
+
+        yield 'api_optimize', dict(params, n_iterations=100), \
+            lambda problem=problem: lambda: post('/api/optimize', dict(problem, n_iterations=100))
+        yield 'api_single_step', params, \
+            lambda problem=problem, path=path: lambda: post('/api/single_step', dict(problem, current_path=path))
+        yield 'api_calculate_cost', params, \
+            lambda obstacles=obstacles, path=path: lambda: post('/api/calculate_cost',
+                                                                {'path': path, 'obstacles': obstacles})
+        yield 'api_calculate_cost_batch', dict(params, n_paths=BATCH_PATHS), \
+            lambda obstacles=obstacles, path=path: lambda: post('/api/calculate_cost_batch',
+                                                                {'paths': [path] * BATCH_PATHS, 'obstacles': obstacles})
+
+
+def run_benchmarks(quick: bool = False, endpoints: bool = True, only: Optional[str] = None,
+                   repeat: int = 5, min_time: float = 0.05, log: Callable = print) -> Dict:
+    """
+    Run the suite.
+
+    Args:
+        quick: Use the smaller sweeps
+        endpoints: Also time the HTTP endpoints
+        only: Run only benchmarks whose key contains this text
+        repeat: Measurements per benchmark
+        min_time: Shortest duration of one measurement in seconds
+        log: Called with a line of progress per benchmark
+
+    Returns:
+        Dictionary with 'meta' (machine and library versions) and 'results',
+        one entry per benchmark with 'key', 'name', 'params' and the timings
+        of time_call
+    """
+    sweep = SWEEPS['quick' if quick else 'full']
+    cases = list(core_cases(sweep))
+    if endpoints:
+        cases += list(endpoint_cases(sweep))
+
+    results = []
+    for name, params, setup in cases:
+        key = benchmark_key(name, params)
+        if only and only not in key:
+            continue
+        timing = time_call(setup(), repeat, min_time)
+        results.append({'key': key, 'name': name, 'params': params, **timing})
+        log(f"{key:<70} {timing['median'] * 1e3:12.4f} ms")
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'quick': quick
+        },
+        'results': results
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.2) -> List[Dict]:
+    """
+    Compare timings against a baseline run. The fastest measurement of each
+    benchmark is compared, as it is the least disturbed by other load.
+
+    Args:
+        results: Output of run_benchmarks
+        baseline: Earlier output of run_benchmarks
+        tolerance: Allowed slowdown as a fraction (0.2 allows 20 % slower)
+
+    Returns:
+        One entry per benchmark present in both runs with 'key', 'baseline'
+        and 'current' fastest seconds per call, 'ratio' (current / baseline)
+        and 'regression'
+    """
+    previous = {entry['key']: entry for entry in baseline.get('results', [])}
+    comparison = []
+    for entry in results['results']:
+        before = previous.get(entry['key'])
+        if before is None:
+            continue
+        ratio = entry['min'] / before['min'] if before['min'] > 0 else float('inf')
+        comparison.append({
+            'key': entry['key'],
+            'baseline': before['min'],
+            'current': entry['min'],
+            'ratio': ratio,
+            'regression': ratio > 1 + tolerance
+        })
+    return comparison
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the path optimizer and its HTTP endpoints.")
+    parser.add_argument('--quick', action='store_true', help="smaller sweeps for a fast check")
+    parser.add_argument('--no-endpoints', action='store_true', help="skip the Flask endpoints")
+    parser.add_argument('--only', help="run only benchmarks whose key contains this text")
+    parser.add_argument('--repeat', type=int, default=5, help="measurements per benchmark (default 5)")
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help="shortest duration of one measurement in seconds (default 0.05)")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against results written earlier with --output")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown against the baseline as a fraction (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, endpoints=not args.no_endpoints, only=args.only,
+                             repeat=args.repeat, min_time=args.min_time)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.tolerance)
+        results['comparison'] = comparison
+        print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for entry in comparison:
+            flag = 'REGRESSION' if entry['regression'] else ''
+            print(f"{entry['key']:<70} {entry['ratio']:8.2f}x {flag}")
+        regressions = [entry for entry in comparison if entry['regression']]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than the baseline allows")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
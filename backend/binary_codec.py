@@ -0,0 +1,200 @@
+"""
+Binary request and response bodies
+A JSON header describes the body with each array replaced by a reference
+into a data section of raw little-endian buffers, so paths go from NumPy
+to the wire (and back) without tolist() or JSON number formatting
+
+Layout:
+    bytes 0-3    magic b'PTHB'
+    byte  4      format version (1)
+    bytes 5-7    reserved, zero
+    bytes 8-11   header length H, uint32 little-endian
+    bytes 12-    H bytes of UTF-8 JSON: {"body": ..., "arrays": [{"dtype", "shape", "offset"}, ...]}
+                 where every array in body is {"$array": index}
+    then         zero padding to a multiple of 8 bytes, then the data section;
+                 offsets are relative to its start and multiples of 8
+"""
+
+import json
+import struct
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Media type of binary bodies
+BINARY_MIMETYPE = 'application/x-path-optimizer'
+
+MAGIC = b'PTHB'
+VERSION = 1
+PREFIX = struct.Struct('<4sB3xI')
+
+# Float precisions a client may ask for, by name and dtype
+FLOAT_DTYPES = {'float64': '<f8', 'float32': '<f4'}
+
+# Dtypes accepted in request bodies
+ARRAY_DTYPES = ('<f8', '<f4', '<i8', '<i4')
+
+# Keys whose list values are sent as arrays
+ARRAY_KEYS = ('path', 'final_path', 'cost_history', 'costs')
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def pack_arrays(payload: Any, dtype: str = '<f8', array_keys: Iterable[str] = ARRAY_KEYS
+                ) -> Tuple[Any, List[np.ndarray]]:
+    """
+    Replace the arrays in a payload by references.
+
+    Args:
+        payload: Nested dicts and lists; ndarrays, and lists under array_keys,
+            become arrays
+        dtype: Little-endian float dtype floating-point arrays are sent as
+        array_keys: Keys whose list values are converted to arrays
+
+    Returns:
+        Tuple of (body with {"$array": index} references, list of arrays)
+    """
+    array_keys = frozenset(array_keys)
+    arrays = []
+
+    def pack(value, key=None):
+        if isinstance(value, dict):
+            return {name: pack(item, name) for name, item in value.items()}
+        if isinstance(value, list) and key in array_keys:
+            value = np.asarray(value, dtype=float)
+        if isinstance(value, np.ndarray):
+            if value.dtype.kind == 'f':
+                value = value.astype(dtype, copy=False)
+            elif value.dtype.kind in 'iub':
+                value = value.astype('<i8', copy=False)
+            else:
+                raise ValueError(f"Cannot send {value.dtype} arrays")
+            arrays.append(np.ascontiguousarray(value))
+            return {'$array': len(arrays) - 1}
+        if isinstance(value, (list, tuple)):
+            return [pack(item) for item in value]
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    return pack(payload), arrays
+
+
+def write_binary(body: Any, arrays: List[np.ndarray]) -> bytes:
+    """
+    Lay out a packed body and its arrays (output of pack_arrays).
+
+    Returns:
+        The binary body
+    """
+    descriptors = []
+    offset = 0
+    for array in arrays:
+        descriptors.append({'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({'body': body, 'arrays': descriptors}, separators=(',', ':')).encode('utf-8')
+    start = _align(PREFIX.size + len(header))
+    parts = [PREFIX.pack(MAGIC, VERSION, len(header)), header, bytes(start - PREFIX.size - len(header))]
+    for array in arrays:
+        parts.append(array.data)
+        parts.append(bytes(_align(array.nbytes) - array.nbytes))
+    return b''.join(parts)
+
+
+def encode_binary(payload: Any, dtype: str = '<f8', array_keys: Iterable[str] = ARRAY_KEYS) -> bytes:
+    """
+    Encode a payload as a binary body, see pack_arrays.
+
+    Returns:
+        The binary body
+    """
+    return write_binary(*pack_arrays(payload, dtype, array_keys))
+
+
+def decode_binary(data: bytes) -> Any:
+    """
+    Decode a binary body. Arrays are read-only views into data, not copies.
+
+    Args:
+        data: Binary body
+
+    Returns:
+        The body with every {"$array": index} replaced by its ndarray
+
+    Raises:
+        ValueError: If data is not a valid binary body
+    """
+    if len(data) < PREFIX.size:
+        raise ValueError("Binary body is too short")
+    magic, version, header_length = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Binary body does not start with the expected magic bytes")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary body version {version}")
+    if PREFIX.size + header_length > len(data):
+        raise ValueError("Binary body header is truncated")
+
+    header = json.loads(bytes(data[PREFIX.size:PREFIX.size + header_length]).decode('utf-8'))
+    start = _align(PREFIX.size + header_length)
+    arrays = []
+    for descriptor in header.get('arrays', []):
+        dtype = np.dtype(descriptor['dtype'])
+        if dtype.str not in ARRAY_DTYPES:
+            raise ValueError(f"Unsupported array dtype {descriptor['dtype']!r}")
+        shape = tuple(int(n) for n in descriptor['shape'])
+        if any(n < 0 for n in shape):
+            raise ValueError(f"Invalid array shape {shape}")
+        count = int(np.prod(shape, dtype=np.int64))
+        offset = start + int(descriptor['offset'])
+        if descriptor['offset'] < 0 or offset + count * dtype.itemsize > len(data):
+            raise ValueError("Binary body array data is truncated")
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape))
+
+    def unpack(value):
+        if isinstance(value, dict):
+            if set(value) == {'$array'}:
+                index = value['$array']
+                if not isinstance(index, int) or not 0 <= index < len(arrays):
+                    raise ValueError(f"Invalid array reference {index!r}")
+                return arrays[index]
+            return {name: unpack(item) for name, item in value.items()}
+        if isinstance(value, list):
+            return [unpack(item) for item in value]
+        return value
+
+    return unpack(header.get('body'))
+
+
+def accepted_dtype(accept: Optional[str]) -> Optional[str]:
+    """
+    Pick the binary float dtype an Accept header asks for. Binary bodies are
+    sent whenever the header names BINARY_MIMETYPE (with a q above 0).
+
+    Args:
+        accept: Accept header, e.g. "application/x-path-optimizer; dtype=float32"
+
+    Returns:
+        '<f8' or '<f4' when BINARY_MIMETYPE is accepted (dtype defaults to
+        float64), None otherwise
+
+    Raises:
+        ValueError: If the dtype parameter is not one of FLOAT_DTYPES
+    """
+    for media_range in (accept or '').split(','):
+        media_type, *params = (part.strip() for part in media_range.split(';'))
+        if media_type.lower() != BINARY_MIMETYPE:
+            continue
+        options = dict(param.split('=', 1) for param in params if '=' in param)
+        try:
+            if float(options.get('q', '1')) <= 0:
+                return None
+        except ValueError:
+            return None
+        name = options.get('dtype', 'float64').strip().strip('"')
+        if name not in FLOAT_DTYPES:
+            raise ValueError(f"dtype must be one of {tuple(FLOAT_DTYPES)}, got {name!r}")
+        return FLOAT_DTYPES[name]
+    return None
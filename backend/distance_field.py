@@ -0,0 +1,332 @@
+"""
+Signed distance field obstacles for the path optimizer
+Rasterizes polygons (and optionally circles) once per map so every waypoint
+costs a bilinear lookup, however complex the map is
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+# Default number of cells along the longer side of the field
+FIELD_CELLS = 256
+
+# Upper bound on grid nodes times polygon edges evaluated at once while rasterizing
+RASTER_CHUNK = 1 << 22
+
+
+def is_polygon(obstacle: Dict) -> bool:
+    """Whether an obstacle dict describes a polygon."""
+    return 'polygon' in obstacle
+
+
+def split_polygons(obstacles: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Separate circular from polygon obstacle dicts.
+
+    Args:
+        obstacles: List of static obstacles in the API representation
+
+    Returns:
+        Tuple of (circular obstacles, polygon obstacles)
+    """
+    circles = [obstacle for obstacle in obstacles if not is_polygon(obstacle)]
+    polygons = [obstacle for obstacle in obstacles if is_polygon(obstacle)]
+    return circles, polygons
+
+
+def polygon_distances(nodes: np.ndarray, polygons: List[np.ndarray]) -> np.ndarray:
+    """
+    Signed distance from points to the union of polygons, negative inside.
+
+    Args:
+        nodes: Array of points (n, 2)
+        polygons: List of vertex arrays (n_vertices, 2), open or closed
+
+    Returns:
+        Array of distances (n,)
+    """
+    if not polygons:
+        return np.full(len(nodes), np.inf)
+
+    starts = np.cumsum([0] + [len(vertices) for vertices in polygons[:-1]])
+    a = np.concatenate(polygons)
+    b = np.concatenate([np.roll(vertices, -1, axis=0) for vertices in polygons])
+    edge = b - a
+    edge_sq = np.maximum(np.sum(edge ** 2, axis=1), 1e-12)
+
+    distance = np.empty(len(nodes))
+    chunk = max(RASTER_CHUNK // len(a), 1)
+    for first in range(0, len(nodes), chunk):
+        p = nodes[first:first + chunk, None, :]
+        r = p - a[None, :, :]
+
+        # Unsigned distance to the nearest edge
+        s = np.clip(np.sum(r * edge, axis=2) / edge_sq, 0.0, 1.0)
+        d_sq = np.sum((r - s[:, :, None] * edge) ** 2, axis=2)
+        nearest = np.sqrt(np.min(d_sq, axis=1))
+
+        # Even-odd rule per polygon: count edges crossed by a ray towards +x
+        py = p[:, :, 1]
+        straddles = (a[:, 1] > py) != (b[:, 1] > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = a[:, 0] + edge[:, 0] * (py - a[:, 1]) / edge[:, 1]
+        crossings = straddles & (p[:, :, 0] < x_cross)
+        inside = np.any(np.add.reduceat(crossings, starts, axis=1) % 2 == 1, axis=1)
+
+        distance[first:first + chunk] = np.where(inside, -nearest, nearest)
+    return distance
+
+
+class DistanceField:
+    """
+    Signed distance to the nearest obstacle surface sampled on a regular grid
+    (negative inside obstacles). Lookups interpolate bilinearly, so distance
+    and gradient are exact derivatives of the same continuous field. The field
+    lies in the xy plane; for 3D paths obstacles are unbounded vertical prisms.
+    Points outside the grid are treated as free, so it should extend past the
+    obstacles by at least the safety margin.
+    """
+
+    def __init__(self, origin: Tuple[float, float], cell_size: float, values: np.ndarray):
+        """
+        Initialize the field.
+
+        Args:
+            origin: Coordinates (x, y) of grid node [0, 0]
+            cell_size: Spacing between grid nodes
+            values: Signed distances at the grid nodes (ny, nx), row i at
+                y = origin[1] + i * cell_size
+        """
+        self.origin = np.asarray(origin, dtype=float).reshape(2)
+        self.cell_size = float(cell_size)
+        self.values = np.ascontiguousarray(values, dtype=float)
+        if self.values.ndim != 2 or min(self.values.shape) < 2:
+            raise ValueError("values must be a grid of at least 2 x 2 nodes")
+        if self.cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+
+    @classmethod
+    def from_dicts(cls, obstacles: List[Dict], cell_size: float = None, padding: float = 0.0) -> 'DistanceField':
+        """
+        Rasterize obstacles in the API representation.
+
+        Args:
+            obstacles: List of obstacles, each with 'polygon' [[x, y], ...] or
+                'center' (x, y) and 'radius' (only x and y are used)
+            cell_size: Grid spacing, by default the padded bounds over FIELD_CELLS
+            padding: Free space kept around the obstacles' bounding box (plus one cell)
+
+        Returns:
+            DistanceField of the union of the obstacles
+        """
+        circles, polygons = split_polygons(obstacles)
+        polygons = [np.asarray(obstacle['polygon'], dtype=float).reshape(-1, 2) for obstacle in polygons]
+        if any(len(vertices) < 3 for vertices in polygons):
+            raise ValueError("polygons need at least 3 vertices")
+        centers = np.array([obstacle['center'][:2] for obstacle in circles], dtype=float).reshape(-1, 2)
+        radii = np.array([obstacle['radius'] for obstacle in circles], dtype=float)
+        if not polygons and not circles:
+            raise ValueError("a distance field needs at least one obstacle")
+
+        points = np.concatenate(polygons + [centers - radii[:, None], centers + radii[:, None]])
+        lower = points.min(axis=0)
+        upper = points.max(axis=0)
+        if cell_size is None:
+            cell_size = max(np.max(upper - lower) + 2 * padding, 1e-9) / FIELD_CELLS
+        lower -= padding + cell_size
+        upper += padding + cell_size
+
+        # One extra node so the grid covers the upper bound
+        nx, ny = (np.ceil((upper - lower) / cell_size).astype(int) + 1).clip(min=2)
+        xs = lower[0] + cell_size * np.arange(nx)
+        ys = lower[1] + cell_size * np.arange(ny)
+        nodes = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+
+        values = polygon_distances(nodes, polygons)
+        if len(circles):
+            circle_distance = np.linalg.norm(nodes[:, None, :] - centers[None, :, :], axis=2) - radii[None, :]
+            values = np.minimum(values, circle_distance.min(axis=1))
+
+        return cls(lower, cell_size, values.reshape(ny, nx))
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def sample(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Interpolate distance and gradient at many points at once.
+
+        Args:
+            points: Array of points (n_points, 2) or (n_points, 3); z is ignored
+
+        Returns:
+            Tuple of (distance (n_points,), gradient (n_points, dim)); points
+            outside the grid get an infinite distance and zero gradient
+        """
+        points = np.asarray(points, dtype=float)
+        ny, nx = self.values.shape
+        u = (points[:, :2] - self.origin) / self.cell_size
+        outside = np.any((u < 0) | (u > [nx - 1, ny - 1]), axis=1)
+
+        cell = np.clip(np.floor(u).astype(int), 0, [nx - 2, ny - 2])
+        fx, fy = (u - cell).T
+        i, j = cell[:, 1], cell[:, 0]
+        v00 = self.values[i, j]
+        v01 = self.values[i, j + 1]
+        v10 = self.values[i + 1, j]
+        v11 = self.values[i + 1, j + 1]
+
+        distance = (v00 * (1 - fx) + v01 * fx) * (1 - fy) + (v10 * (1 - fx) + v11 * fx) * fy
+        gradient = np.zeros(points.shape)
+        gradient[:, 0] = ((v01 - v00) * (1 - fy) + (v11 - v10) * fy) / self.cell_size
+        gradient[:, 1] = ((v10 - v00) * (1 - fx) + (v11 - v01) * fx) / self.cell_size
+
+        distance[outside] = np.inf
+        gradient[outside] = 0.0
+        return distance, gradient
+
+    def _segment_samples(self, path: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Points every half cell along all segments in one array, each segment from t = 0 to 1
+        ny, nx = self.values.shape
+        lengths = np.linalg.norm(np.diff(path[:, :2], axis=0), axis=1)
+        counts = np.minimum(np.ceil(lengths / (0.5 * self.cell_size)).astype(int), 4 * (nx + ny)) + 1
+
+        segment = np.repeat(np.arange(len(counts)), counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        t = (np.arange(len(segment)) - starts[segment]) / np.maximum(counts[segment] - 1, 1)
+        points = path[segment] + t[:, None] * (path[segment + 1] - path[segment])
+        return starts, t, points
+
+    def segment_clearance(self, path: np.ndarray) -> np.ndarray:
+        """
+        Smallest field distance along each path segment, sampled every half cell.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+
+        Returns:
+            Array of distances (n_points - 1,), infinite where a segment stays
+            outside the grid
+        """
+        path = np.asarray(path, dtype=float)
+        if len(path) < 2:
+            return np.zeros(0)
+        starts, _, points = self._segment_samples(path)
+        distance, _ = self.sample(points)
+        return np.minimum.reduceat(distance, starts)
+
+    def segment_contacts(self, path: np.ndarray, safety_margin: float
+                         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find every segment whose closest sample is within the safety margin.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+            safety_margin: Distance to keep from the surfaces
+
+        Returns:
+            Tuple of (segment_index, s, offset, violation) as in
+            ObstacleSet.segment_contacts, with s the position of the closest
+            sample and offset half the field gradient there (see contacts)
+        """
+        if len(path) < 2:
+            return np.zeros(0, dtype=int), np.zeros(0), np.zeros((0, path.shape[1])), np.zeros(0)
+        starts, t, points = self._segment_samples(path)
+        distance, gradient = self.sample(points)
+
+        # Sorting by segment then distance puts each segment's closest sample at its start
+        segment = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(t))))
+        closest = np.lexsort((distance, segment))[starts]
+        violation = safety_margin - distance[closest]
+        segment_index = np.nonzero(violation > 0)[0]
+        closest = closest[segment_index]
+        return segment_index, t[closest], 0.5 * gradient[closest], violation[segment_index]
+
+    def segment_cost(self, path: np.ndarray, safety_margin: float) -> float:
+        """
+        Calculate the penalty cost sum(max(0, safety_margin - distance)^2) over
+        all segments, with distance taken at each segment's closest sample.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+            safety_margin: Distance to keep from the surfaces
+
+        Returns:
+            Obstacle cost value
+        """
+        _, _, _, violation = self.segment_contacts(path, safety_margin)
+        return float(np.sum(violation ** 2))
+
+    def segment_gradient(self, path: np.ndarray, safety_margin: float) -> np.ndarray:
+        """
+        Calculate the gradient of segment_cost with respect to each waypoint.
+
+        Args:
+            path: Array of waypoints (n_points, dim)
+            safety_margin: Distance to keep from the surfaces
+
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = np.zeros(np.shape(path))
+        segment_index, s, offset, violation = self.segment_contacts(path, safety_margin)
+
+        # The closest sample moves with weight (1 - s) on the first waypoint and s on the second
+        pull = -4 * violation[:, None] * offset
+        np.add.at(grad, segment_index, (1 - s)[:, None] * pull)
+        np.add.at(grad, segment_index + 1, s[:, None] * pull)
+
+        return grad
+
+    def contacts(self, points: np.ndarray, safety_margin: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find every point closer than the safety margin to an obstacle surface.
+
+        Args:
+            points: Array of points (n_points, dim)
+            safety_margin: Distance to keep from the surfaces
+
+        Returns:
+            Tuple of (point_index, offset, violation) where violation is
+            safety_margin - distance (> 0) and offset is half the field
+            gradient, so -4 * violation * offset is the gradient as for
+            ObstacleSet.contacts
+        """
+        distance, gradient = self.sample(points)
+        violation = safety_margin - distance
+        point_index = np.nonzero(violation > 0)[0]
+        return point_index, 0.5 * gradient[point_index], violation[point_index]
+
+    def cost(self, points: np.ndarray, safety_margin: float) -> float:
+        """
+        Calculate the penalty cost sum(max(0, safety_margin - distance)^2) over all points.
+
+        Args:
+            points: Array of points (n_points, dim)
+            safety_margin: Distance to keep from the surfaces
+
+        Returns:
+            Obstacle cost value
+        """
+        _, _, violation = self.contacts(points, safety_margin)
+        return float(np.sum(violation ** 2))
+
+    def gradient(self, points: np.ndarray, safety_margin: float) -> np.ndarray:
+        """
+        Calculate the gradient of the penalty cost with respect to each point.
+
+        Args:
+            points: Array of points (n_points, dim)
+            safety_margin: Distance to keep from the surfaces
+
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = np.zeros(np.shape(points))
+        point_index, offset, violation = self.contacts(points, safety_margin)
+
+        # d/dp (safety_margin - distance)^2 = -2 * violation * grad(distance)
+        grad[point_index] = -4 * violation[:, None] * offset
+
+        return grad
@@ -0,0 +1,135 @@
+"""
+Iteration history encoding for optimization responses
+Drops frames clients do not need and optionally sends paths as float32 deltas.
+Frames arrive with NumPy paths, so dropped frames are never converted to lists
+"""
+
+import base64
+import numpy as np
+from typing import Dict, Iterable, Iterator
+
+from optimizer import PATH_FORMATS
+from profiling import Profile, optional_timer
+
+# Supported frame encodings
+FRAME_ENCODINGS = ('full', 'delta')
+
+
+def decimate_frames(frames: Iterable[Dict], stride: int = 1, min_cost_change: float = 0.0) -> Iterator[Dict]:
+    """
+    Keep only a subset of optimization frames.
+    The first and last frames are always kept. Any other frame is kept only if
+    it passes every enabled filter.
+
+    Args:
+        frames: Frames with 'iteration', 'path' and 'cost'
+        stride: Keep frames whose iteration is a multiple of stride
+        min_cost_change: Keep frames whose cost differs from the last kept
+            frame by more than this fraction of it (0 disables the filter)
+
+    Returns:
+        Iterator over the kept frames, in order
+    """
+    if stride < 1:
+        raise ValueError("frame_stride must be at least 1")
+    if min_cost_change < 0:
+        raise ValueError("min_cost_change must not be negative")
+
+    return _decimate(iter(frames), stride, min_cost_change)
+
+
+def _decimate(frames: Iterator[Dict], stride: int, min_cost_change: float) -> Iterator[Dict]:
+    first = next(frames, None)
+    if first is None:
+        return
+    yield first
+    last_kept_cost = first['cost']
+
+    # Hold one frame back so the final frame can always be emitted
+    pending = None
+    for frame in frames:
+        if pending is not None:
+            keep = pending['iteration'] % stride == 0
+            if min_cost_change > 0:
+                keep = keep and abs(pending['cost'] - last_kept_cost) > min_cost_change * abs(last_kept_cost)
+            if keep:
+                last_kept_cost = pending['cost']
+                yield pending
+        pending = frame
+
+    if pending is not None:
+        yield pending
+
+
+class DeltaEncoder:
+    """
+    Encodes each path as the float32 difference from the previous frame.
+    Deltas are taken against the client's float32-accumulated reconstruction,
+    so rounding errors do not build up over long histories. A frame whose
+    path has a different shape (a new multires level) is sent in full.
+    """
+
+    def __init__(self):
+        self.reference = None
+
+    def encode(self, frame: Dict) -> Dict:
+        """
+        Encode one frame.
+
+        Args:
+            frame: Frame with 'iteration', 'path' and 'cost'
+
+        Returns:
+            The first frame unchanged, later frames with 'path' replaced by
+            'delta': base64 of little-endian float32 values (n_points * dim)
+        """
+        path = np.asarray(frame['path'], dtype=float)
+        if self.reference is None or self.reference.shape != path.shape:
+            self.reference = path
+            return frame
+
+        delta = (path - self.reference).astype('<f4')
+        self.reference = self.reference + delta.astype(float)
+
+        encoded = {key: value for key, value in frame.items() if key != 'path'}
+        encoded['delta'] = base64.b64encode(delta.tobytes()).decode('ascii')
+        return encoded
+
+
+def encode_frames(frames: Iterable[Dict], encoding: str = 'full', path_format: str = 'list',
+                  profile: Profile = None) -> Iterator[Dict]:
+    """
+    Encode frames for the response. Run it after decimate_frames on frames
+    with array paths (optimize_iter with path_format='array'), so only the
+    kept frames pay for tolist().
+
+    Args:
+        frames: Frames with 'iteration', 'path' and 'cost'
+        encoding: 'full' sends every path, 'delta' sends float32 deltas
+        path_format: 'list' converts the remaining paths to nested lists,
+            'array' keeps them as arrays (binary responses)
+        profile: Optional Profile timing the conversions as 'tolist'
+
+    Returns:
+        Iterator over the encoded frames
+    """
+    if encoding not in FRAME_ENCODINGS:
+        raise ValueError(f"frame_encoding must be one of {FRAME_ENCODINGS}, got {encoding!r}")
+    if path_format not in PATH_FORMATS:
+        raise ValueError(f"path_format must be one of {PATH_FORMATS}, got {path_format!r}")
+
+    frames = iter(frames)
+    if encoding == 'delta':
+        encoder = DeltaEncoder()
+        frames = (encoder.encode(frame) for frame in frames)
+    if path_format == 'list':
+        frames = (_list_path(frame, profile) for frame in frames)
+    return frames
+
+
+def _list_path(frame: Dict, profile: Profile) -> Dict:
+    # Convert an array path to nested lists for JSON
+    if isinstance(frame.get('path'), np.ndarray):
+        with optional_timer(profile, 'tolist'):
+            frame['path'] = frame['path'].tolist()
+    return frame
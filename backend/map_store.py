@@ -0,0 +1,297 @@
+"""
+Stored obstacle maps
+Preprocesses an obstacle list once and keeps it on disk as memory-mapped
+arrays, so requests can reference it by id instead of resending it
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from obstacles import ObstacleSet, obstacle_arrays
+from moving_obstacles import split_obstacles
+from distance_field import DistanceField, split_polygons
+from result_cache import problem_key
+
+# Map ids are the first 32 hex digits of the content hash
+MAP_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class MapNotFoundError(Exception):
+    """Raised when a map id is unknown."""
+
+
+class ObstacleMap:
+    """
+    A preprocessed obstacle map: circle arrays (memory-mapped when loaded
+    from disk) and an optional DistanceField holding the polygons, and the
+    circles too when they were rasterized. Rasterized circles are penalized
+    like polygons, (safety_margin - distance)^2, instead of the analytic
+    (R^2 - d^2)^2 of circle obstacles, which changes the cost scale. The
+    spatial index depends on the safety margin and is not stored with the
+    map: obstacle sets are built once per margin in each process and reused.
+    """
+
+    def __init__(self, map_id: str, centers: np.ndarray, radii: np.ndarray, heights: Optional[np.ndarray],
+                 distance_field: Optional[DistanceField] = None, field_padding: float = 0.0,
+                 rasterized: bool = False):
+        """
+        Initialize the map.
+
+        Args:
+            map_id: Id the map is stored under
+            centers: Circle centers (n_obstacles, dim)
+            radii: Circle radii (n_obstacles,)
+            heights: Vertical extents in 3D (n_obstacles,), None in 2D
+            distance_field: Rasterized polygons (and circles), if any
+            field_padding: Free space around the field, the largest safety margin it supports
+            rasterized: Whether the circles were rasterized into the distance field
+        """
+        self.map_id = map_id
+        self.centers = centers
+        self.radii = radii
+        self.heights = heights
+        self.dim = centers.shape[1]
+        self.distance_field = distance_field
+        self.field_padding = field_padding
+        self.rasterized = rasterized
+        self._obstacle_sets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        size = self.centers.nbytes + self.radii.nbytes
+        if self.heights is not None:
+            size += self.heights.nbytes
+        if self.distance_field is not None:
+            size += self.distance_field.nbytes
+        return size
+
+    def obstacle_set(self, safety_margin: float, copy: bool = False) -> ObstacleSet:
+        """
+        Obstacle set for a safety margin, built on first use.
+
+        Args:
+            safety_margin: Additional safety distance around obstacles
+            copy: Return a private set (for callers that add, remove or move
+                obstacles) instead of the shared one
+
+        Returns:
+            ObstacleSet of the map's circles
+
+        Raises:
+            ValueError: If the distance field is not padded for this margin
+        """
+        if self.distance_field is not None and safety_margin > self.field_padding:
+            raise ValueError(f"map {self.map_id} supports safety margins up to {self.field_padding}")
+        if copy:
+            return ObstacleSet(self.centers, self.radii, safety_margin, heights=self.heights)
+        with self._lock:
+            obstacle_set = self._obstacle_sets.get(safety_margin)
+            if obstacle_set is None:
+                obstacle_set = ObstacleSet(self.centers, self.radii, safety_margin, heights=self.heights)
+                self._obstacle_sets[safety_margin] = obstacle_set
+            return obstacle_set
+
+    def optimizer_options(self, safety_margin: float, copy: bool = False) -> Dict:
+        """
+        PathOptimizer keyword arguments for this map.
+
+        Returns:
+            Dictionary with 'obstacles' (see obstacle_set) and 'distance_field'
+        """
+        return {'obstacles': self.obstacle_set(safety_margin, copy), 'distance_field': self.distance_field}
+
+    def info(self) -> Dict:
+        """
+        Describe the map.
+
+        Returns:
+            Dictionary with 'map_id', 'dim', 'n_circles', 'distance_field'
+            (whether one was built), 'field_padding', 'circle_penalty'
+            ('analytic', or 'distance_field' when the circles were rasterized)
+            and 'nbytes'
+        """
+        return {
+            'map_id': self.map_id,
+            'dim': self.dim,
+            'n_circles': len(self.radii),
+            'distance_field': self.distance_field is not None,
+            'field_padding': self.field_padding,
+            'circle_penalty': 'distance_field' if self.rasterized else 'analytic',
+            'nbytes': self.nbytes
+        }
+
+
+class MapStore:
+    """
+    Maps saved as .npy files in one directory per map, loaded with
+    memory mapping and kept in an LRU of recently used maps. Ids are content
+    hashes, so uploading the same map twice returns the same id and worker
+    processes can open the same files by id.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_loaded: int = 16):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Where maps are saved (defaults to a folder in the temp directory)
+            max_loaded: Maximum number of maps kept loaded in memory
+        """
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'path_optimizer_maps')
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'MapStore':
+        """Build a store configured by OPTIMIZER_MAP_DIR and OPTIMIZER_MAPS_LOADED environment variables."""
+        return cls(
+            directory=os.environ.get('OPTIMIZER_MAP_DIR') or None,
+            max_loaded=int(os.environ.get('OPTIMIZER_MAPS_LOADED', '16'))
+        )
+
+    def _map_path(self, map_id: str) -> str:
+        if not MAP_ID_PATTERN.fullmatch(map_id or ''):
+            raise MapNotFoundError(f"Unknown map {map_id!r}")
+        return os.path.join(self.directory, map_id)
+
+    def put(self, obstacles: List[Dict], dim: int = 2, rasterize: bool = False,
+            field_cell_size: float = None, field_padding: float = 50.0) -> ObstacleMap:
+        """
+        Preprocess and save a map.
+
+        Args:
+            obstacles: Static obstacles, circles (see obstacle_arrays) or polygons
+                (see DistanceField.from_dicts)
+            dim: Path dimension (2 or 3)
+            rasterize: Also rasterize the circles into the distance field, so
+                every waypoint costs one lookup (2D only); they are then
+                penalized like polygons (see ObstacleMap)
+            field_cell_size: Grid spacing of the distance field
+            field_padding: Free space around the distance field, the largest
+                safety margin the map can be used with
+
+        Returns:
+            The stored map
+
+        Raises:
+            ValueError: If obstacles move, or rasterize is asked for in 3D
+        """
+        if split_obstacles(obstacles)[1]:
+            raise ValueError("Stored maps hold static obstacles only")
+        if rasterize and dim != 2:
+            raise ValueError("Only 2D maps can rasterize their circles")
+
+        map_id = problem_key({
+            'obstacles': obstacles, 'dim': dim, 'rasterize': rasterize,
+            'field_cell_size': field_cell_size, 'field_padding': field_padding
+        })[:32]
+        path = self._map_path(map_id)
+        if not os.path.isdir(path):
+            circles, polygons = split_polygons(obstacles)
+            field_obstacles = circles + polygons if rasterize else polygons
+            centers, radii, heights = obstacle_arrays([] if rasterize else circles, dim)
+            arrays = {'centers': centers, 'radii': radii}
+            if heights is not None:
+                arrays['heights'] = heights
+            meta = {'dim': dim, 'created': time.time(), 'field_padding': field_padding, 'rasterize': rasterize}
+            if field_obstacles:
+                field = DistanceField.from_dicts(field_obstacles, field_cell_size, field_padding)
+                arrays['field'] = field.values
+                meta.update(field_origin=field.origin.tolist(), field_cell_size=field.cell_size)
+
+            # Write into a temporary folder, then rename so readers never see a partial map
+            tmp_path = tempfile.mkdtemp(dir=self.directory)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Stored concurrently by another request
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        return self.get(map_id)
+
+    def get(self, map_id: str) -> ObstacleMap:
+        """
+        Load a map, memory-mapping its arrays.
+
+        Args:
+            map_id: Id returned by put
+
+        Returns:
+            The map
+
+        Raises:
+            MapNotFoundError: If no map is stored under the id
+        """
+        path = self._map_path(map_id)
+        with self._lock:
+            stored = self._loaded.get(map_id)
+            if stored is not None:
+                self._loaded.move_to_end(map_id)
+                return stored
+
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except OSError:
+            raise MapNotFoundError(f"Unknown map {map_id!r}")
+
+        def load(name):
+            file_path = os.path.join(path, f"{name}.npy")
+            return np.load(file_path, mmap_mode='r') if os.path.exists(file_path) else None
+
+        field = load('field')
+        distance_field = None
+        if field is not None:
+            distance_field = DistanceField(meta['field_origin'], meta['field_cell_size'], field)
+        stored = ObstacleMap(map_id, load('centers'), load('radii'), load('heights'), distance_field,
+                             meta['field_padding'], meta.get('rasterize', False))
+
+        with self._lock:
+            self._loaded[map_id] = stored
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return stored
+
+    def delete(self, map_id: str):
+        """
+        Remove a map from disk and memory.
+
+        Raises:
+            MapNotFoundError: If no map is stored under the id
+        """
+        path = self._map_path(map_id)
+        with self._lock:
+            self._loaded.pop(map_id, None)
+        if not os.path.isdir(path):
+            raise MapNotFoundError(f"Unknown map {map_id!r}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@lru_cache(maxsize=None)
+def open_store(directory: str) -> MapStore:
+    """
+    Shared MapStore for a directory, so each worker process loads a map once.
+
+    Args:
+        directory: Map directory of the server's store
+
+    Returns:
+        MapStore reading that directory
+    """
+    return MapStore(directory)
@@ -3,54 +3,159 @@ Path Optimization using Gradient Descent
 Finds the optimal path from start to goal while avoiding obstacles
 """
 
+import time
 import numpy as np
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterator, Union
+
+from obstacles import DIMENSIONS, ObstacleSet, obstacle_arrays
+from moving_obstacles import MovingObstacleSet, is_moving
+from distance_field import DistanceField, is_polygon
+from obstacle_models import OBSTACLE_MODELS, build_obstacle_models
+from multires import resolution_levels, scale_weights, upsample_path
+from path_terms import length_cost, length_gradient, smoothness_cost, smoothness_gradient
+from step_rules import MAX_GRAD_NORM, STEP_RULES, StepRule, make_step_rule
+from profiling import Profile, optional_timer
+
+# Supported ways of computing the path gradient in optimize_step
+GRADIENT_MODES = ('vectorized', 'pointwise')
+
+# Supported types of the frame paths yielded by optimize_iter: nested lists, or NumPy arrays
+PATH_FORMATS = ('list', 'array')
+
+# Keyword arguments of optimize_iter/optimize that control early stopping
+STOPPING_CRITERIA = ('cost_tolerance', 'grad_tolerance', 'step_tolerance', 'time_budget', 'patience')
 
 
 class PathOptimizer:
     """
     Optimizes a path from start to goal using gradient descent.
     Minimizes a cost function that balances path length, smoothness, and obstacle avoidance.
+    Paths are 2D or 3D, following the dimension of start and goal.
     """
     
     def __init__(
         self,
-        start: Tuple[float, float],
-        goal: Tuple[float, float],
-        obstacles: List[Dict],
+        start: Tuple[float, ...],
+        goal: Tuple[float, ...],
+        obstacles: Union[List[Dict], ObstacleSet],
         n_points: int = 20,
         safety_margin: float = 5.0,
-        weights: Dict[str, float] = None
+        weights: Dict[str, float] = None,
+        gradient_mode: str = 'vectorized',
+        step_rule='momentum',
+        initial_path: np.ndarray = None,
+        duration: float = None,
+        departure_time: float = 0.0,
+        moving_obstacles: MovingObstacleSet = None,
+        altitude_limits: Tuple[float, float] = None,
+        obstacle_model: str = 'waypoints',
+        distance_field: DistanceField = None,
+        field_cell_size: float = None,
+        profile: bool = False
     ):
         """
         Initialize the path optimizer.
         
         Args:
-            start: Starting point (x, y)
-            goal: Goal point (x, y)
-            obstacles: List of obstacles, each with 'center' (x, y) and 'radius'
+            start: Starting point (x, y) or (x, y, z)
+            goal: Goal point with the same dimension as start
+            obstacles: List of obstacles, each with 'center' (x, y) and 'radius',
+                or a prebuilt ObstacleSet to share between optimizers. Obstacles
+                with a 'velocity' or 'trajectory' move, see MovingObstacleSet.from_dicts.
+                In 3D, obstacles are spheres or vertical cylinders, see obstacle_arrays.
+                Obstacles with a 'polygon' [[x, y], ...] are rasterized into a
+                DistanceField (unbounded vertical prisms in 3D)
             n_points: Number of waypoints in the path
             safety_margin: Additional safety distance around obstacles
             weights: Dictionary with keys 'length', 'smoothness', 'obstacle'
+                and optionally 'altitude'
+            gradient_mode: 'vectorized' computes the gradient of the whole path
+                with array operations, 'pointwise' uses the per-point reference
+                functions (gradient_total) one waypoint at a time
+            step_rule: How optimize_step moves the path, one of STEP_RULES
+                ('momentum', 'nesterov', 'adam', 'lbfgs', 'banded_newton') or a
+                StepRule instance
+            initial_path: Optional path to start from instead of a straight line
+                (any number of waypoints, see _fit_initial_path)
+            duration: Time from start to goal; waypoint i is reached at
+                departure_time + duration * i / (n_points - 1). Required with
+                moving obstacles
+            departure_time: Time at which the path leaves start
+            moving_obstacles: Prebuilt MovingObstacleSet to share between
+                optimizers, used instead of any moving obstacles in obstacles
+            altitude_limits: Optional (z_min, z_max) for 3D paths, enforced by
+                a penalty weighted by weights['altitude']
+            obstacle_model: 'waypoints' penalizes intermediate waypoints inside
+                static obstacles, 'segments' penalizes the closest point of every
+                segment so a path cannot cut through an obstacle between
+                waypoints (the distance field at the closest of samples every
+                half cell). Moving obstacles are always checked at the waypoints
+            distance_field: Prebuilt DistanceField to share between optimizers,
+                used instead of any polygon obstacles in obstacles
+            field_cell_size: Grid spacing when rasterizing polygon obstacles
+                (default: see DistanceField.from_dicts)
+            profile: Record timers per cost and gradient term, cost evaluations,
+                clipped gradients and NaN resets in self.profile (see profiling.py)
         """
+        if gradient_mode not in GRADIENT_MODES:
+            raise ValueError(f"gradient_mode must be one of {GRADIENT_MODES}, got {gradient_mode!r}")
+        if obstacle_model not in OBSTACLE_MODELS:
+            raise ValueError(f"obstacle_model must be one of {OBSTACLE_MODELS}, got {obstacle_model!r}")
+
         self.start = np.array(start)
         self.goal = np.array(goal)
+        self.dim = len(self.start)
+        if self.dim not in DIMENSIONS or len(self.goal) != self.dim:
+            raise ValueError(f"start and goal must both have one of {DIMENSIONS} coordinates")
+        if altitude_limits is not None and self.dim != 3:
+            raise ValueError("altitude_limits need 3D start and goal")
+        self.altitude_limits = altitude_limits
         self.obstacles = obstacles
         self.n_points = n_points
         self.safety_margin = safety_margin
+        self.gradient_mode = gradient_mode
+        self.obstacle_model = obstacle_model
+        self.step_rule = make_step_rule(step_rule)
+        self.profile = Profile() if profile else None
+        
+        # Contiguous obstacle arrays with precomputed inflated radii, moving obstacles and polygons
+        self.obstacle_set, self.moving_obstacles, self.distance_field = build_obstacle_models(
+            obstacles, safety_margin, self.dim, moving_obstacles, distance_field, field_cell_size
+        )
+        
+        # Arrival time of each waypoint, for moving obstacles
+        self.duration = duration
+        self.departure_time = departure_time
+        self.waypoint_times = None
+        if duration is not None:
+            self.waypoint_times = departure_time + duration * np.linspace(0.0, 1.0, n_points)
+        elif self.moving_obstacles is not None:
+            raise ValueError("duration is required with moving obstacles")
         
         # Initialize velocity for momentum
         self.velocity = None
         
+        # Largest unclipped waypoint gradient and waypoint move of the last step
+        self.last_grad_norm = None
+        self.last_step_size = None
+        
+        # Why and after how many iterations the last optimize run stopped
+        self.stop_reason = None
+        self.iterations = 0
+        
         # Default weights
         if weights is None:
             weights = {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0}
         self.w_len = weights.get('length', 1.0)
         self.w_smooth = weights.get('smoothness', 50.0)
         self.w_obs = weights.get('obstacle', 1000.0)
+        self.w_alt = weights.get('altitude', 1000.0)
         
-        # Initialize path with linear interpolation
-        self.path = self._initialize_path()
+        # Initialize path with linear interpolation, or warm-start from a given path
+        if initial_path is None:
+            self.path = self._initialize_path()
+        else:
+            self.path = self._fit_initial_path(initial_path)
         
         # Store cost history
         self.cost_history = []
@@ -60,27 +165,158 @@ class PathOptimizer:
         Initialize path as a straight line from start to goal.
         
         Returns:
-            Array of shape (n_points, 2) representing the initial path
+            Array of shape (n_points, dim) representing the initial path
         """
-        path = np.zeros((self.n_points, 2))
+        path = np.zeros((self.n_points, self.dim))
         for i in range(self.n_points):
             t = i / (self.n_points - 1)
             path[i] = self.start * (1 - t) + self.goal * t
         return path
     
+    def _fit_initial_path(self, initial_path: np.ndarray) -> np.ndarray:
+        """
+        Adapt a previously computed path to this problem: resample it to
+        n_points waypoints, then shift it by a linear blend of the start and
+        goal offsets so it begins at start and ends at goal.
+        
+        Args:
+            initial_path: Array of waypoints (m, dim), m >= 2
+            
+        Returns:
+            Array of shape (n_points, dim)
+        """
+        initial_path = np.asarray(initial_path, dtype=float).reshape(-1, self.dim)
+        if len(initial_path) < 2:
+            raise ValueError("initial_path needs at least 2 waypoints")
+        
+        path = upsample_path(initial_path, self.n_points, 'linear')
+        t = np.linspace(0.0, 1.0, self.n_points)[:, None]
+        return path + (1 - t) * (self.start - path[0]) + t * (self.goal - path[-1])
+    
+    def warm_start(self, path: np.ndarray) -> bool:
+        """
+        Start from a previously computed path (fitted as initial_path is)
+        instead of the current one, but only when it costs less.
+        
+        Args:
+            path: Array of waypoints (m, dim), m >= 2
+            
+        Returns:
+            True if the path is used
+        """
+        seeded = self._fit_initial_path(path)
+        if self.total_cost(seeded) >= self.total_cost(self.path):
+            return False
+        self.path = seeded
+        return True
+    
+    def add_obstacles(self, obstacles: List[Dict]) -> List[int]:
+        """
+        Add obstacles without rebuilding the obstacle set.
+        Optimization continues from the current path; momentum is kept, other
+        step rule state is reset.
+        
+        Args:
+            obstacles: List of obstacles, each with 'center' (x, y) and 'radius'
+            
+        Returns:
+            Ids of the new obstacles
+        """
+        ids = self.obstacle_set.add(*self._added_arrays(obstacles))
+        self.step_rule.reset()
+        return ids.tolist()
+    
+    def _added_arrays(self, obstacles: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Check and convert obstacles to add (see add_obstacles)
+        if any(is_moving(obstacle) or is_polygon(obstacle) for obstacle in obstacles):
+            raise ValueError("Only static circular obstacles can be added in place")
+        return obstacle_arrays(obstacles, self.dim)
+    
+    def remove_obstacles(self, ids: List[int]):
+        """
+        Remove obstacles by id (see ObstacleSet.ids), continuing from the current path.
+        
+        Args:
+            ids: Ids of the obstacles to remove
+        """
+        self.obstacle_set.remove(ids)
+        self.step_rule.reset()
+    
+    def move_obstacles(self, moves: List[Dict]):
+        """
+        Move or resize obstacles by id, continuing from the current path.
+        Centers are read as in add_obstacles (see obstacle_arrays), so in 3D a
+        2-coordinate center places a building with its 'base' and 'top'.
+        
+        Args:
+            moves: List of changes, each with 'id', 'center' and optionally 'radius'
+        """
+        self._apply_moves(*self._moved_arrays(moves))
+        self.step_rule.reset()
+    
+    def _moved_arrays(self, moves: List[Dict]) -> Tuple[np.ndarray, ...]:
+        # Check and convert moves (see move_obstacles); radii are only applied where resized
+        ids = np.array([move['id'] for move in moves], dtype=np.int64)
+        resized = np.array(['radius' in move for move in moves], dtype=bool)
+        centers, radii, heights = obstacle_arrays([{'radius': 0.0, **move} for move in moves], self.dim)
+        return ids, resized, centers, radii, heights
+    
+    def _apply_moves(self, ids: np.ndarray, resized: np.ndarray, centers: np.ndarray,
+                     radii: np.ndarray, heights: np.ndarray):
+        for group, group_radii in ((~resized, None), (resized, radii[resized])):
+            if np.any(group):
+                self.obstacle_set.move(ids[group], centers[group], group_radii,
+                                       None if heights is None else heights[group])
+    
+    def update_obstacles(self, add: List[Dict] = None, remove: List[int] = None,
+                         move: List[Dict] = None) -> List[int]:
+        """
+        Apply several obstacle edits, in the order remove, move, add. Every
+        edit is checked before any is applied, so an invalid one leaves the
+        obstacle set unchanged.
+        
+        Args:
+            add: New obstacles, see add_obstacles
+            remove: Ids of obstacles to remove
+            move: Changes, see move_obstacles
+            
+        Returns:
+            Ids of the new obstacles
+            
+        Raises:
+            KeyError: If a removed or moved id is unknown, or a moved one is also removed
+            ValueError: If an obstacle to add or a move is invalid
+        """
+        remove = [int(obstacle_id) for obstacle_id in remove or []]
+        moved = self._moved_arrays(move) if move else None
+        added = self._added_arrays(add) if add else None
+        for obstacle_id in remove + (moved[0].tolist() if moved else []):
+            if obstacle_id not in self.obstacle_set:
+                raise KeyError(f"Unknown obstacle id {obstacle_id}")
+        if moved and set(remove) & set(moved[0].tolist()):
+            raise KeyError("Obstacles cannot be moved and removed at once")
+        
+        if remove:
+            self.obstacle_set.remove(remove)
+        if moved:
+            self._apply_moves(*moved)
+        ids = self.obstacle_set.add(*added) if added else np.zeros(0, dtype=np.int64)
+        if remove or moved or added:
+            self.step_rule.reset()
+        return ids.tolist()
+    
     def cost_length(self, path: np.ndarray) -> float:
         """
         Calculate the length cost of the path.
         Sum of squared distances between consecutive waypoints.
         
         Args:
-            path: Array of waypoints (n_points, 2)
+            path: Array of waypoints (n_points, dim)
             
         Returns:
             Length cost value
         """
-        diff = path[1:] - path[:-1]
-        return np.sum(diff ** 2)
+        return length_cost(path)
     
     def cost_smoothness(self, path: np.ndarray) -> float:
         """
@@ -88,7 +324,7 @@ class PathOptimizer:
         Sum of squared accelerations (second derivatives).
         
         Args:
-            path: Array of waypoints (n_points, 2)
+            path: Array of waypoints (n_points, dim)
             
         Returns:
             Smoothness cost value
@@ -96,69 +332,85 @@ class PathOptimizer:
         if self.n_points < 3:
             return 0.0
         
-        # Acceleration at each intermediate point
-        acceleration = path[2:] - 2 * path[1:-1] + path[:-2]
-        return np.sum(acceleration ** 2)
+        return smoothness_cost(path)
     
     def cost_obstacle(self, path: np.ndarray) -> float:
         """
         Calculate the obstacle avoidance cost using the penalty method.
         
         Args:
-            path: Array of waypoints (n_points, 2)
+            path: Array of waypoints (n_points, dim)
             
         Returns:
             Obstacle cost value
         """
-        total_cost = 0.0
+        # Check intermediate points (not start and goal), or every segment
+        inner = slice(1, self.n_points - 1)
+        if self.obstacle_model == 'segments':
+            cost = self.obstacle_set.segment_cost(path)
+        else:
+            cost = self.obstacle_set.cost(path[inner])
+        if self.moving_obstacles is not None:
+            cost += self.moving_obstacles.cost(path[inner], self.waypoint_times[inner])
+        if self.distance_field is not None and self.obstacle_model == 'segments':
+            cost += self.distance_field.segment_cost(path, self.safety_margin)
+        elif self.distance_field is not None:
+            cost += self.distance_field.cost(path[inner], self.safety_margin)
+        return cost
+    
+    def cost_altitude(self, path: np.ndarray) -> float:
+        """
+        Calculate the altitude limit penalty of the path (0 without limits).
+        Sum of squared distances below z_min or above z_max.
         
-        # Check intermediate points (not start and goal)
-        for i in range(1, self.n_points - 1):
-            point = path[i]
+        Args:
+            path: Array of waypoints (n_points, 3)
             
-            for obstacle in self.obstacles:
-                center = np.array(obstacle['center'])
-                radius = obstacle['radius']
-                
-                # Squared distance from point to obstacle center
-                d_sq = np.sum((point - center) ** 2)
-                
-                # Squared effective radius (including safety margin)
-                R_sq = (radius + self.safety_margin) ** 2
-                
-                # Violation amount
-                violation = R_sq - d_sq
-                
-                # Penalty if inside safety zone
-                if violation > 0:
-                    total_cost += violation ** 2
+        Returns:
+            Altitude cost value
+        """
+        if self.altitude_limits is None:
+            return 0.0
         
-        return total_cost
+        z_min, z_max = self.altitude_limits
+        z = path[1:self.n_points - 1, 2]
+        return float(np.sum(np.maximum(z_min - z, 0.0) ** 2 + np.maximum(z - z_max, 0.0) ** 2))
     
     def total_cost(self, path: np.ndarray) -> float:
         """
         Calculate the total weighted cost of the path.
         
         Args:
-            path: Array of waypoints (n_points, 2)
+            path: Array of waypoints (n_points, dim)
             
         Returns:
             Total cost value
         """
-        f_len = self.cost_length(path)
-        f_smooth = self.cost_smoothness(path)
-        f_obs = self.cost_obstacle(path)
+        f_len = self._timed('cost_length', self.cost_length, path)
+        f_smooth = self._timed('cost_smoothness', self.cost_smoothness, path)
+        f_obs = self._timed('cost_obstacle', self.cost_obstacle, path)
+        f_alt = self._timed('cost_altitude', self.cost_altitude, path)
+        if self.profile is not None:
+            self.profile.count('cost_evaluations')
         
         # Clip individual costs to prevent overflow
         f_len = min(f_len, 1e12)
         f_smooth = min(f_smooth, 1e12)
         f_obs = min(f_obs, 1e12)
+        f_alt = min(f_alt, 1e12)
         
-        total = self.w_len * f_len + self.w_smooth * f_smooth + self.w_obs * f_obs
+        total = self.w_len * f_len + self.w_smooth * f_smooth + self.w_obs * f_obs + self.w_alt * f_alt
         
         # Return finite value
         return total if np.isfinite(total) else 1e15
     
+    def _timed(self, name: str, fn, path: np.ndarray):
+        # Call fn(path), adding its duration to timer name when profiling
+        if self.profile is None:
+            return fn(path)
+        with self.profile.timer(name):
+            return fn(path)
+    
     def gradient_length(self, path: np.ndarray, i: int) -> np.ndarray:
         """
         Calculate the gradient of the length cost with respect to point i.
@@ -168,9 +420,9 @@ class PathOptimizer:
             i: Index of the point
             
         Returns:
-            Gradient vector (2,)
+            Gradient vector (dim,)
         """
-        grad = np.zeros(2)
+        grad = np.zeros(self.dim)
         
         # Contribution from segment (i-1) to i
         if i > 0:
@@ -191,12 +443,12 @@ class PathOptimizer:
             i: Index of the point
             
         Returns:
-            Gradient vector (2,)
+            Gradient vector (dim,)
         """
         if self.n_points < 3:
-            return np.zeros(2)
+            return np.zeros(self.dim)
         
-        grad = np.zeros(2)
+        grad = np.zeros(self.dim)
         
         # Point i appears in three acceleration terms:
         # a_{i-1} = p_i - 2*p_{i-1} + p_{i-2}  (coefficient: +1)
@@ -229,33 +481,77 @@ class PathOptimizer:
             i: Index of the point
             
         Returns:
-            Gradient vector (2,)
+            Gradient vector (dim,)
         """
-        grad = np.zeros(2)
+        grad = np.zeros(self.dim)
         point = path[i]
+        obstacle_set = self.obstacle_set
+        
+        if self.obstacle_model == 'segments':
+            # Only the segments ending at point i depend on it
+            first = max(i - 1, 0)
+            grad += obstacle_set.segment_gradient(path[first:i + 2])[i - first]
+            if self.distance_field is not None:
+                grad += self.distance_field.segment_gradient(path[first:i + 2], self.safety_margin)[i - first]
+        else:
+            for j in range(len(obstacle_set)):
+                center = obstacle_set.centers[j]
+                if obstacle_set.heights is not None:
+                    # Nearest point of the vertical segment
+                    center = center.copy()
+                    center[2] += np.clip(point[2] - center[2], 0.0, obstacle_set.heights[j])
+                
+                # Squared distance
+                d_sq = np.sum((point - center) ** 2)
+                
+                # Violation against the precomputed squared effective radius
+                violation = obstacle_set.inflated_sq[j] - d_sq
+                
+                if violation > 0:
+                    # Gradient of d_sq with respect to point
+                    grad_d_sq = 2 * (point - center)
+                    
+                    # Chain rule: d/dp (max(0, R_sq - d_sq)^2)
+                    grad += 2 * violation * (-grad_d_sq)
+        
+        # Moving obstacles, at their positions when point i is reached
+        if self.moving_obstacles is not None:
+            centers = self.moving_obstacles.positions(self.waypoint_times[i:i + 1])[0]
+            for j in range(len(self.moving_obstacles)):
+                d_sq = np.sum((point - centers[j]) ** 2)
+                violation = self.moving_obstacles.inflated_sq[j] - d_sq
+                if violation > 0:
+                    grad += 2 * violation * (-2 * (point - centers[j]))
         
-        for obstacle in self.obstacles:
-            center = np.array(obstacle['center'])
-            radius = obstacle['radius']
-            
-            # Squared distance
-            d_sq = np.sum((point - center) ** 2)
-            
-            # Squared effective radius
-            R_sq = (radius + self.safety_margin) ** 2
-            
-            # Violation
-            violation = R_sq - d_sq
-            
+        # Distance field, d/dp (safety_margin - distance)^2
+        if self.distance_field is not None and self.obstacle_model == 'waypoints':
+            distance, distance_grad = self.distance_field.sample(path[i:i + 1])
+            violation = self.safety_margin - distance[0]
             if violation > 0:
-                # Gradient of d_sq with respect to point
-                grad_d_sq = 2 * (point - center)
-                
-                # Chain rule: d/dp (max(0, R_sq - d_sq)^2)
-                grad += 2 * violation * (-grad_d_sq)
+                grad += 2 * violation * (-distance_grad[0])
         
         return grad
     
+    def gradient_altitude(self, path: np.ndarray, i: int) -> np.ndarray:
+        """
+        Calculate the gradient of the altitude cost with respect to point i.
+        
+        Args:
+            path: Current path
+            i: Index of the point
+            
+        Returns:
+            Gradient vector (dim,)
+        """
+        grad = np.zeros(self.dim)
+        if self.altitude_limits is None:
+            return grad
+        
+        z_min, z_max = self.altitude_limits
+        z = path[i, 2]
+        grad[2] = -2 * max(z_min - z, 0.0) + 2 * max(z - z_max, 0.0)
+        return grad
+    
     def gradient_total(self, path: np.ndarray, i: int) -> np.ndarray:
         """
         Calculate the total gradient at point i.
@@ -265,66 +561,226 @@ class PathOptimizer:
             i: Index of the point
             
         Returns:
-            Total gradient vector (2,)
+            Total gradient vector (dim,)
         """
         grad_len = self.gradient_length(path, i)
         grad_smooth = self.gradient_smoothness(path, i)
         grad_obs = self.gradient_obstacle(path, i)
+        grad_alt = self.gradient_altitude(path, i)
         
         return (self.w_len * grad_len + 
                 self.w_smooth * grad_smooth + 
-                self.w_obs * grad_obs)
+                self.w_obs * grad_obs +
+                self.w_alt * grad_alt)
     
-    def optimize_step(self, learning_rate: float = 0.001, momentum: float = 0.9) -> Tuple[np.ndarray, float]:
+    def gradient_length_path(self, path: np.ndarray) -> np.ndarray:
         """
-        Perform one gradient descent step with momentum.
+        Calculate the gradient of the length cost for every waypoint at once.
+        Matches gradient_length(path, i) for each row i.
         
         Args:
-            learning_rate: Step size for gradient descent
-            momentum: Momentum coefficient (0.0 to 1.0)
+            path: Array of waypoints (n_points, dim)
             
         Returns:
-            Tuple of (updated_path, current_cost)
+            Gradient array (n_points, dim)
+        """
+        return length_gradient(path)
+    
+    def gradient_smoothness_path(self, path: np.ndarray) -> np.ndarray:
         """
-        # Initialize velocity if first step
-        if self.velocity is None:
-            self.velocity = np.zeros_like(self.path)
+        Calculate the gradient of the smoothness cost for every waypoint at once.
+        Matches gradient_smoothness(path, i) for each row i.
         
-        # Create a copy of the path
-        new_path = self.path.copy()
+        Args:
+            path: Array of waypoints (n_points, dim)
+            
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        return smoothness_gradient(path)
+    
+    def gradient_obstacle_path(self, path: np.ndarray) -> np.ndarray:
+        """
+        Calculate the gradient of the obstacle cost for every waypoint at once.
+        Matches gradient_obstacle(path, i) for each row i.
         
-        # Update only intermediate points (not start and goal)
-        for i in range(1, self.n_points - 1):
-            # Calculate gradient
-            grad = self.gradient_total(self.path, i)
+        Args:
+            path: Array of waypoints (n_points, dim)
             
-            # Gradient clipping to prevent overflow (reduced for smoother optimization)
-            grad_norm = np.linalg.norm(grad)
-            max_grad_norm = 50.0  # Reduced from 1000 to prevent vibration
-            if grad_norm > max_grad_norm:
-                grad = grad * (max_grad_norm / grad_norm)
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        if self.obstacle_model == 'segments':
+            grad = self.obstacle_set.segment_gradient(path)
+        else:
+            grad = self.obstacle_set.gradient(path)
+        if self.moving_obstacles is not None:
+            grad += self.moving_obstacles.gradient(path, self.waypoint_times)
+        if self.distance_field is not None and self.obstacle_model == 'segments':
+            grad += self.distance_field.segment_gradient(path, self.safety_margin)
+        elif self.distance_field is not None:
+            grad += self.distance_field.gradient(path, self.safety_margin)
+        return grad
+    
+    def gradient_altitude_path(self, path: np.ndarray) -> np.ndarray:
+        """
+        Calculate the gradient of the altitude cost for every waypoint at once.
+        Matches gradient_altitude(path, i) for each row i.
+        
+        Args:
+            path: Array of waypoints (n_points, dim)
             
-            # Check for NaN or Inf
-            if not np.all(np.isfinite(grad)):
-                grad = np.zeros_like(grad)
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = np.zeros_like(path, dtype=float)
+        if self.altitude_limits is None:
+            return grad
+        
+        z_min, z_max = self.altitude_limits
+        z = path[:, 2]
+        grad[:, 2] = -2 * np.maximum(z_min - z, 0.0) + 2 * np.maximum(z - z_max, 0.0)
+        return grad
+    
+    def gradient_total_path(self, path: np.ndarray) -> np.ndarray:
+        """
+        Calculate the total gradient for every waypoint at once.
+        Matches gradient_total(path, i) for each row i.
+        
+        Args:
+            path: Array of waypoints (n_points, dim)
             
-            # Update velocity with momentum
-            self.velocity[i] = momentum * self.velocity[i] - learning_rate * grad
+        Returns:
+            Gradient array (n_points, dim)
+        """
+        grad = (self.w_len * self._timed('gradient_length', self.gradient_length_path, path) +
+                self.w_smooth * self._timed('gradient_smoothness', self.gradient_smoothness_path, path) +
+                self.w_obs * self._timed('gradient_obstacle', self.gradient_obstacle_path, path))
+        if self.altitude_limits is not None:
+            grad += self.w_alt * self._timed('gradient_altitude', self.gradient_altitude_path, path)
+        return grad
+    
+    def interior_contacts(self, path: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the obstacle contacts of the intermediate waypoints: static, moving
+        and distance field.
+        
+        Args:
+            path: Array of waypoints (n_points, dim)
+            
+        Returns:
+            Tuple of (point_index, offset, violation) as in ObstacleSet.contacts,
+            with point_index counted from the first intermediate waypoint
+        """
+        inner = slice(1, self.n_points - 1)
+        if self.obstacle_model == 'segments':
+            contacts = self._segment_point_contacts(path, self.obstacle_set.segment_contacts(path))
+        else:
+            contacts = self.obstacle_set.contacts(path[inner])
+        extra = []
+        if self.moving_obstacles is not None:
+            extra.append(self.moving_obstacles.contacts(path[inner], self.waypoint_times[inner]))
+        if self.distance_field is not None and self.obstacle_model == 'segments':
+            extra.append(self._segment_point_contacts(
+                path, self.distance_field.segment_contacts(path, self.safety_margin)))
+        elif self.distance_field is not None:
+            extra.append(self.distance_field.contacts(path[inner], self.safety_margin))
+        if not extra:
+            return contacts
+        return tuple(np.concatenate(parts) for parts in zip(contacts, *extra))
+    
+    def _segment_point_contacts(self, path: np.ndarray, segment_contacts: Tuple
+                                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Attribute each segment contact to both endpoints, with the offset
+        # scaled by how much the closest point moves with that endpoint
+        segment_index, s, offset, violation = segment_contacts
+        point_index = np.concatenate([segment_index, segment_index + 1])
+        offset = np.concatenate([(1 - s)[:, None] * offset, s[:, None] * offset])
+        violation = np.concatenate([violation, violation])
+        interior = (point_index >= 1) & (point_index <= self.n_points - 2)
+        return point_index[interior] - 1, offset[interior], violation[interior]
+    
+    def validate_path(self, path: np.ndarray = None) -> Dict:
+        """
+        Check every segment of a path against the static obstacles. The
+        distance field is sampled every half cell along each segment.
+        
+        Args:
+            path: Array of waypoints (n_points, dim), defaults to the current path
             
-            # Update path using velocity
-            new_path[i] = self.path[i] + self.velocity[i]
+        Returns:
+            Dictionary with 'clearance' (distance from each segment to the nearest
+            obstacle surface, negative inside an obstacle, None without obstacles),
+            'nearest' (id of that obstacle, -1 without obstacles or when it is
+            in the distance field), 'min_clearance', 'collision_free' (no segment
+            touches an obstacle) and 'within_margin' (every segment keeps the
+            safety margin)
+        """
+        path = self.path if path is None else np.asarray(path, dtype=float)
+        clearance, nearest = self.obstacle_set.segment_clearance(path)
+        if self.distance_field is not None:
+            field_clearance = self.distance_field.segment_clearance(path)
+            nearest = np.where(field_clearance < clearance, -1, nearest)
+            clearance = np.minimum(clearance, field_clearance)
+        min_clearance = float(np.min(clearance, initial=np.inf))
+        return {
+            'clearance': [value if np.isfinite(value) else None for value in clearance.tolist()],
+            'nearest': nearest.tolist(),
+            'min_clearance': min_clearance if np.isfinite(min_clearance) else None,
+            'collision_free': bool(min_clearance > 0),
+            'within_margin': bool(min_clearance >= self.safety_margin)
+        }
+    
+    def interior_gradient(self, path: np.ndarray) -> np.ndarray:
+        """
+        Calculate the total gradient of the intermediate waypoints (not start and goal),
+        using the configured gradient mode. Records the largest waypoint gradient
+        norm in self.last_grad_norm.
+        
+        Args:
+            path: Array of waypoints (n_points, dim)
+            
+        Returns:
+            Gradient array (n_points - 2, dim)
+        """
+        if self.gradient_mode == 'pointwise':
+            grad = np.zeros((max(self.n_points - 2, 0), self.dim))
+            with optional_timer(self.profile, 'gradient_pointwise'):
+                for i in range(1, self.n_points - 1):
+                    grad[i - 1] = self.gradient_total(path, i)
+        else:
+            grad = self.gradient_total_path(path)[1:self.n_points - 1]
+        if self.profile is not None:
+            self.profile.count('gradient_evaluations')
+        
+        with np.errstate(over='ignore', invalid='ignore'):
+            self.last_grad_norm = float(np.max(np.linalg.norm(grad, axis=1), initial=0.0))
+        return grad
+    
+    def optimize_step(self, learning_rate: float = 0.001, momentum: float = 0.9) -> Tuple[np.ndarray, float]:
+        """
+        Perform one optimization step with the configured step rule
+        (gradient descent with momentum by default).
+        
+        Args:
+            learning_rate: Step size for gradient descent
+            momentum: Momentum coefficient (0.0 to 1.0)
             
-            # Ensure the updated point is finite
-            if not np.all(np.isfinite(new_path[i])):
-                new_path[i] = self.path[i]  # Keep old value if overflow
-                self.velocity[i] = np.zeros(2)  # Reset velocity if overflow
+        Returns:
+            Tuple of (updated_path, current_cost)
+        """
+        new_path, cost = self.step_rule.step(self, learning_rate, momentum)
+        self.last_step_size = float(np.max(np.linalg.norm(new_path - self.path, axis=1), initial=0.0))
         
-        # Calculate cost
-        cost = self.total_cost(new_path)
+        # Calculate cost unless the step rule already did
+        if cost is None:
+            cost = self.total_cost(new_path)
         
         # Check for overflow in cost
         if not np.isfinite(cost):
             cost = 1e15  # Large but finite number
+            if self.profile is not None:
+                self.profile.count('nan_resets')
         
         self.cost_history.append(cost)
         
@@ -333,43 +789,224 @@ class PathOptimizer:
         
         return new_path, cost
     
-    def optimize(self, n_iterations: int = 500, learning_rate: float = 0.001, momentum: float = 0.9) -> List[Dict]:
+    def optimize_iter(
+        self,
+        n_iterations: int = 500,
+        learning_rate: float = 0.001,
+        momentum: float = 0.9,
+        cost_tolerance: float = None,
+        grad_tolerance: float = None,
+        step_tolerance: float = None,
+        time_budget: float = None,
+        patience: int = 5,
+        path_format: str = 'list'
+    ) -> Iterator[Dict]:
         """
-        Run the full optimization process.
+        Run the optimization process, yielding each iteration as it is computed.
+        Only the current frame is held in memory, so callers can stream results.
+        
+        The run stops before n_iterations once any enabled tolerance has been met
+        for `patience` consecutive iterations, or once time_budget is spent.
+        The last frame carries 'stop_reason', which is also kept in
+        self.stop_reason together with the iteration count in self.iterations.
         
         Args:
-            n_iterations: Number of gradient descent iterations
+            n_iterations: Maximum number of gradient descent iterations
             learning_rate: Step size for gradient descent
             momentum: Momentum coefficient (0.0 to 1.0)
+            cost_tolerance: Stop when |cost change| <= cost_tolerance * |previous cost|
+            grad_tolerance: Stop when every waypoint gradient norm is <= grad_tolerance
+            step_tolerance: Stop when no waypoint moves more than step_tolerance
+            time_budget: Stop after this many seconds of wall-clock time
+            patience: Consecutive iterations a tolerance must hold before stopping
+            path_format: 'list' yields paths as nested lists, 'array' as (copied)
+                NumPy arrays for callers that serialize them in binary
             
-        Returns:
-            List of dictionaries, each containing 'path' and 'cost' for that iteration
+        Yields:
+            Dictionary with 'iteration', 'path' and 'cost', starting with the initial path
         """
-        results = []
+        if path_format not in PATH_FORMATS:
+            raise ValueError(f"path_format must be one of {PATH_FORMATS}, got {path_format!r}")
+        started = time.perf_counter()
+        self.stop_reason = None
+        self.iterations = 0
         
         # Add initial path
         initial_cost = self.total_cost(self.path)
         self.cost_history = [initial_cost]
-        results.append({
+        frame_path = self._frame_path(self.path, path_format)
+        frame = {
             'iteration': 0,
-            'path': self.path.tolist(),
+            'path': frame_path,
             'cost': initial_cost
-        })
+        }
+        if n_iterations <= 0:
+            self.stop_reason = frame['stop_reason'] = 'max_iterations'
+        yield frame
+        
+        # Consecutive iterations each tolerance has held
+        streak = {'cost_tolerance': 0, 'grad_tolerance': 0, 'step_tolerance': 0}
+        previous_cost = initial_cost
         
         # Run optimization
         for iteration in range(1, n_iterations + 1):
             new_path, cost = self.optimize_step(learning_rate, momentum)
+            self.iterations = iteration
+            
+            met = {
+                'cost_tolerance': cost_tolerance is not None and
+                    abs(previous_cost - cost) <= cost_tolerance * abs(previous_cost),
+                'grad_tolerance': grad_tolerance is not None and self.last_grad_norm <= grad_tolerance,
+                'step_tolerance': step_tolerance is not None and self.last_step_size <= step_tolerance
+            }
+            for criterion, holds in met.items():
+                streak[criterion] = streak[criterion] + 1 if holds else 0
+            previous_cost = cost
             
-            results.append({
+            frame_path = self._frame_path(new_path, path_format)
+            frame = {
                 'iteration': iteration,
-                'path': new_path.tolist(),
+                'path': frame_path,
                 'cost': cost
-            })
+            }
+            
+            converged = [criterion for criterion, count in streak.items() if count >= patience]
+            if converged:
+                self.stop_reason = converged[0]
+            elif time_budget is not None and time.perf_counter() - started >= time_budget:
+                self.stop_reason = 'time_budget'
+            elif iteration == n_iterations:
+                self.stop_reason = 'max_iterations'
+            
+            if self.stop_reason is not None:
+                frame['stop_reason'] = self.stop_reason
+            
+            yield frame
+            
+            if self.stop_reason is not None:
+                return
+    
+    def _frame_path(self, path: np.ndarray, path_format: str):
+        # Frames own their paths: a copy, or the nested lists of tolist()
+        if path_format == 'array':
+            return path.copy()
+        with optional_timer(self.profile, 'tolist'):
+            return path.tolist()
+    
+    def optimize(self, n_iterations: int = 500, learning_rate: float = 0.001, momentum: float = 0.9,
+                 **stopping) -> List[Dict]:
+        """
+        Run the full optimization process.
         
-        return results
+        Args:
+            n_iterations: Maximum number of gradient descent iterations
+            learning_rate: Step size for gradient descent
+            momentum: Momentum coefficient (0.0 to 1.0)
+            **stopping: Early stopping criteria (and path_format), see optimize_iter
+            
+        Returns:
+            List of dictionaries, each containing 'path' and 'cost' for that iteration
+        """
+        return list(self.optimize_iter(n_iterations, learning_rate, momentum, **stopping))
+    
+    def optimize_multires_iter(
+        self,
+        n_iterations: int = 500,
+        learning_rate: float = 0.001,
+        momentum: float = 0.9,
+        levels: int = 3,
+        interpolation: str = 'linear',
+        **stopping
+    ) -> Iterator[Dict]:
+        """
+        Run the optimization coarse-to-fine, yielding each iteration as it is computed.
+        The path is first optimized with about n_points / 2**(levels - 1) waypoints,
+        then upsampled and refined at each finer level until n_points. The
+        coarsest level gets n_iterations and each finer level half as many, so
+        the full resolution is only a short polish. Weights are rescaled per
+        level (see multires.scale_weights).
+        
+        Args:
+            n_iterations: Maximum iterations of the coarsest level
+            learning_rate: Step size for gradient descent
+            momentum: Momentum coefficient (0.0 to 1.0)
+            levels: Maximum number of resolution levels (1 is a plain optimize_iter)
+            interpolation: Upsampling between levels, 'linear' or 'spline'
+            **stopping: Early stopping criteria applied to every level (and
+                path_format), see optimize_iter
+            
+        Yields:
+            Dictionary with 'iteration' (counted across levels), 'level' (0 is the
+            coarsest), 'path' and 'cost'. The first frame of each finer level is
+            skipped, as it only repeats the upsampled path.
+        """
+        counts = resolution_levels(self.n_points, levels)
+        weights = {'length': self.w_len, 'smoothness': self.w_smooth, 'obstacle': self.w_obs, 'altitude': self.w_alt}
+        
+        path = None
+        iterations = 0
+        history = []
+        for level, n_points in enumerate(counts):
+            finest = level == len(counts) - 1
+            if finest:
+                level_optimizer = self
+                self.velocity = None
+                self.step_rule.reset()
+            else:
+                level_optimizer = PathOptimizer(
+                    start=self.start,
+                    goal=self.goal,
+                    obstacles=self.obstacle_set,
+                    n_points=n_points,
+                    safety_margin=self.safety_margin,
+                    weights=scale_weights(weights, n_points, self.n_points),
+                    gradient_mode=self.gradient_mode,
+                    step_rule=self.step_rule.fresh(),
+                    duration=self.duration,
+                    departure_time=self.departure_time,
+                    moving_obstacles=self.moving_obstacles,
+                    altitude_limits=self.altitude_limits,
+                    obstacle_model=self.obstacle_model,
+                    distance_field=self.distance_field
+                )
+                # Coarse levels add to the same profile
+                level_optimizer.profile = self.profile
+            if path is None:
+                # The coarsest level starts from the current (straight or warm-start) path
+                path = self.path
+            level_optimizer.path = upsample_path(path, n_points, interpolation)
+            
+            budget = max(n_iterations >> level, 1)
+            for frame in level_optimizer.optimize_iter(budget, learning_rate, momentum, **stopping):
+                if frame['iteration'] == 0 and level > 0:
+                    continue
+                if frame['iteration'] > 0:
+                    iterations += 1
+                if not finest:
+                    frame.pop('stop_reason', None)
+                frame['iteration'] = iterations
+                frame['level'] = level
+                history.append(frame['cost'])
+                yield frame
+            
+            path = level_optimizer.path
+        
+        self.cost_history = history
+        self.iterations = iterations
+    
+    def optimize_multires(self, n_iterations: int = 500, learning_rate: float = 0.001, momentum: float = 0.9,
+                          levels: int = 3, interpolation: str = 'linear', **stopping) -> List[Dict]:
+        """
+        Run the full coarse-to-fine optimization process, see optimize_multires_iter.
+        
+        Returns:
+            List of dictionaries, each containing 'level', 'path' and 'cost' for that iteration
+        """
+        return list(self.optimize_multires_iter(n_iterations, learning_rate, momentum, levels,
+                                                interpolation, **stopping))
     
     def get_path(self) -> List[List[float]]:
-        """Get the current path as a list of [x, y] coordinates."""
+        """Get the current path as a list of [x, y] (or [x, y, z]) coordinates."""
         return self.path.tolist()
     
     def get_cost_history(self) -> List[float]:
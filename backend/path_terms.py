@@ -0,0 +1,78 @@
+"""
+Length and smoothness terms of the path cost
+Costs and gradients on one path (n_points, dim) or a stack of paths
+(..., n_points, dim), shared by PathOptimizer, BatchPathOptimizer and CostEvaluator
+"""
+
+import numpy as np
+
+
+def length_cost(paths: np.ndarray) -> np.ndarray:
+    """
+    Sum of squared distances between consecutive waypoints.
+
+    Args:
+        paths: Array of waypoints (..., n_points, dim)
+
+    Returns:
+        Length cost per path (...)
+    """
+    diff = paths[..., 1:, :] - paths[..., :-1, :]
+    return np.sum(diff ** 2, axis=(-2, -1))
+
+
+def smoothness_cost(paths: np.ndarray) -> np.ndarray:
+    """
+    Sum of squared accelerations (second differences).
+
+    Args:
+        paths: Array of waypoints (..., n_points, dim)
+
+    Returns:
+        Smoothness cost per path (...), 0 for fewer than 3 waypoints
+    """
+    acceleration = paths[..., 2:, :] - 2 * paths[..., 1:-1, :] + paths[..., :-2, :]
+    return np.sum(acceleration ** 2, axis=(-2, -1))
+
+
+def length_gradient(paths: np.ndarray) -> np.ndarray:
+    """
+    Gradient of length_cost for every waypoint.
+
+    Args:
+        paths: Array of waypoints (..., n_points, dim)
+
+    Returns:
+        Gradient array (..., n_points, dim)
+    """
+    grad = np.zeros_like(paths, dtype=float)
+    diff = paths[..., 1:, :] - paths[..., :-1, :]
+
+    # Segment (i-1) -> i pulls point i back, segment i -> (i+1) pulls it forward
+    grad[..., 1:, :] += 2 * diff
+    grad[..., :-1, :] -= 2 * diff
+    return grad
+
+
+def smoothness_gradient(paths: np.ndarray) -> np.ndarray:
+    """
+    Gradient of smoothness_cost for every waypoint.
+
+    Args:
+        paths: Array of waypoints (..., n_points, dim)
+
+    Returns:
+        Gradient array (..., n_points, dim)
+    """
+    grad = np.zeros_like(paths, dtype=float)
+    if paths.shape[-2] < 3:
+        return grad
+
+    # accel[k] is the acceleration centred on point k+1
+    accel = paths[..., 2:, :] - 2 * paths[..., 1:-1, :] + paths[..., :-2, :]
+
+    # Coefficients +1, -2, +1 on points k, k+1, k+2
+    grad[..., 2:, :] += 2 * accel
+    grad[..., 1:-1, :] += 2 * (-2) * accel
+    grad[..., :-2, :] += 2 * accel
+    return grad
@@ -0,0 +1,104 @@
+"""
+Opt-in profiling for the path optimizer
+Cumulative timers and event counters, filled by PathOptimizer, the step
+rules and the server when a request asks for a profile
+"""
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, Optional
+
+
+class Profile:
+    """
+    Cumulative seconds per timer and occurrences per counter.
+    Timers hold 'seconds' and 'calls'. Not thread-safe: each optimizer run
+    fills its own profile, which the server merges into a shared one.
+    """
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+
+    def add_time(self, name: str, seconds: float):
+        """Add one timed call of seconds to timer name."""
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = {'seconds': seconds, 'calls': 1}
+        else:
+            timer['seconds'] += seconds
+            timer['calls'] += 1
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time the body of a with block into timer name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def count(self, name: str, n: int = 1):
+        """Add n occurrences to counter name."""
+        if n:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def merge(self, other: Dict):
+        """
+        Add another profile's totals to this one.
+
+        Args:
+            other: Output of as_dict
+        """
+        for name, timer in other.get('timers', {}).items():
+            mine = self.timers.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            mine['seconds'] += timer['seconds']
+            mine['calls'] += timer['calls']
+        for name, value in other.get('counters', {}).items():
+            self.count(name, value)
+
+    def as_dict(self) -> Dict:
+        """
+        Profile as JSON-ready data.
+
+        Returns:
+            Dictionary with 'timers' ({name: {'seconds', 'calls'}}) and 'counters' ({name: count})
+        """
+        return {
+            'timers': {name: dict(timer) for name, timer in self.timers.items()},
+            'counters': dict(self.counters)
+        }
+
+
+class ProfileTotals:
+    """
+    Thread-safe running totals of every profile a process has produced,
+    exposed by the server as cumulative counters.
+    """
+
+    def __init__(self):
+        self._profile = Profile()
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict):
+        """Merge one request's profile (output of Profile.as_dict)."""
+        with self._lock:
+            self._profile.merge(profile)
+            self._requests += 1
+
+    def stats(self) -> Dict:
+        """
+        Totals so far.
+
+        Returns:
+            Dictionary with 'requests' (profiled requests), 'timers' and 'counters'
+        """
+        with self._lock:
+            return {'requests': self._requests, **self._profile.as_dict()}
+
+
+def optional_timer(profile: Optional[Profile], name: str):
+    """Profile.timer when profiling, otherwise a no-op context manager."""
+    return profile.timer(name) if profile is not None else nullcontext()
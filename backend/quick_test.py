@@ -1,8 +1,9 @@
 """
 Quick test to verify the optimizer works
 """
+import os
 import sys
-sys.path.insert(0, 'C:/Users/Lenovo/Documents/optmisation/backend')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from optimizer import PathOptimizer
 import numpy as np
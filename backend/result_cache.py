@@ -0,0 +1,212 @@
+"""
+Result cache for optimization requests
+In-process LRU with a time-to-live, optionally backed by JSON files on disk
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from numbers import Number
+from typing import Any, Dict, Optional
+
+
+def canonicalize(value: Any) -> Any:
+    """
+    Normalize a JSON-like value so equivalent problems compare equal:
+    tuples become lists and every number becomes a float.
+
+    Args:
+        value: Nested dicts, lists, tuples and scalars
+
+    Returns:
+        Normalized copy
+    """
+    if isinstance(value, dict):
+        return {str(key): canonicalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, Number):
+        return float(value)
+    if hasattr(value, 'tolist'):
+        return canonicalize(value.tolist())
+    return value
+
+
+def problem_key(problem: Dict) -> str:
+    """
+    Hash a problem definition into a cache key.
+
+    Args:
+        problem: Everything that determines the result (start, goal, obstacles,
+            n_points, safety_margin, weights, solver and response options)
+
+    Returns:
+        Hex SHA-256 of the canonical JSON form
+    """
+    text = json.dumps(canonicalize(problem), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+    When a directory is given, entries are also written there as JSON and
+    read back on memory misses, so results survive restarts and are shared
+    between processes on the same machine.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = 3600.0, directory: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries kept in memory (0 disables the cache)
+            ttl: Seconds an entry stays valid (None keeps entries until evicted)
+            directory: Optional directory for the on-disk store
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> 'ResultCache':
+        """
+        Build a cache configured by OPTIMIZER_CACHE_SIZE, OPTIMIZER_CACHE_TTL
+        and OPTIMIZER_CACHE_DIR environment variables.
+        """
+        ttl = os.environ.get('OPTIMIZER_CACHE_TTL', '3600')
+        return cls(
+            max_entries=int(os.environ.get('OPTIMIZER_CACHE_SIZE', '256')),
+            ttl=float(ttl) if ttl else None,
+            directory=os.environ.get('OPTIMIZER_CACHE_DIR') or None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a result.
+
+        Args:
+            key: Key from problem_key
+
+        Returns:
+            The stored result, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, entry)
+            return entry[1]
+
+    def put(self, key: str, value: Any):
+        """
+        Store a result.
+
+        Args:
+            key: Key from problem_key
+            value: JSON-serializable result (NumPy arrays are written to disk as lists)
+        """
+        if not self.enabled:
+            return
+
+        entry = (time.time(), value)
+        with self._lock:
+            self._insert(key, entry)
+        self._write_disk(key, entry)
+
+    def _insert(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key: str):
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(stored['created']):
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+            return None
+        return stored['created'], stored['value']
+
+    def _write_disk(self, key: str, entry):
+        if not self.directory:
+            return
+        # Write then rename so readers never see a partial file
+        tmp_path = f"{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'created': entry[0], 'value': entry[1]}, f, default=canonicalize)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Drop every in-memory entry (the on-disk store is left alone)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """
+        Cache counters for sizing.
+
+        Returns:
+            Dictionary with 'hits', 'misses', 'hit_rate', 'evictions', 'entries' and 'max_entries'
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries
+            }
@@ -3,14 +3,167 @@ Flask server for path optimization
 Provides REST API for the frontend to interact with the optimizer
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from optimizer import PathOptimizer
+from cost_evaluator import CostEvaluator
+from moving_obstacles import is_moving
+from distance_field import is_polygon
+from frames import decimate_frames, encode_frames
+from result_cache import ResultCache, problem_key
+from warm_start import WarmStartStore, workspace_key
+from sessions import OptimizationSession, SessionStore, SessionNotFoundError
+from map_store import MapStore, MapNotFoundError
+from profiling import Profile, ProfileTotals, optional_timer
+from metrics import Registry, SIZE_BUCKETS
+from binary_codec import BINARY_MIMETYPE, accepted_dtype, decode_binary, encode_binary
+from worker_pool import (
+    OptimizationPool, PoolFullError, JobTimeoutError, optimize_job, optimize_batch_job,
+    optimization_frames, multires_options, stopping_criteria, timing_options
+)
 import numpy as np
+import json
+import time
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
 
+# Worker processes for long-running optimizations (see OptimizationPool.from_env)
+pool = OptimizationPool.from_env()
+
+# Results of recent /api/optimize problems (see ResultCache.from_env)
+cache = ResultCache.from_env()
+
+# Solved paths, used to warm-start nearby problems
+warm_starts = WarmStartStore()
+
+# Live optimizers stepped by /api/sessions (see SessionStore.from_env)
+sessions = SessionStore.from_env()
+
+# Preprocessed obstacle maps uploaded to /api/maps (see MapStore.from_env)
+maps = MapStore.from_env()
+
+# Running totals of the profiles returned by profiled requests
+profiles = ProfileTotals()
+
+# Prometheus metrics served by /metrics
+metrics = Registry()
+request_count = metrics.counter(
+    'path_optimizer_requests_total', 'HTTP requests by route, method and status code.',
+    ('route', 'method', 'status'))
+request_latency = metrics.histogram(
+    'path_optimizer_request_duration_seconds', 'HTTP request latency by route (until the response starts).',
+    ('route',))
+iteration_count = metrics.counter(
+    'path_optimizer_iterations_total', 'Optimization iterations executed, by endpoint.', ('endpoint',))
+run_outcomes = metrics.counter(
+    'path_optimizer_runs_total', 'Optimization runs computed, by stop reason.', ('stop_reason',))
+obstacle_sizes = metrics.histogram(
+    'path_optimizer_request_obstacles', 'Obstacles per optimization request.', buckets=(0,) + SIZE_BUCKETS)
+point_sizes = metrics.histogram(
+    'path_optimizer_request_points', 'Waypoints per optimization request.', buckets=SIZE_BUCKETS)
+metrics.callback('path_optimizer_queue_depth', 'Optimization jobs running or queued.', lambda: pool.pending)
+metrics.callback('path_optimizer_queue_capacity', 'Maximum optimization jobs running or queued.',
+                 lambda: pool.max_pending)
+metrics.callback('path_optimizer_cache_hits_total', 'Result cache hits.',
+                 lambda: cache.stats()['hits'], kind='counter')
+metrics.callback('path_optimizer_cache_misses_total', 'Result cache misses.',
+                 lambda: cache.stats()['misses'], kind='counter')
+metrics.callback('path_optimizer_cache_hit_ratio', 'Result cache hits per lookup.',
+                 lambda: cache.stats()['hit_rate'])
+metrics.callback('path_optimizer_sessions', 'Live optimization sessions.', lambda: sessions.stats()['sessions'])
+metrics.callback('path_optimizer_profile_seconds_total', 'Time recorded by profiled requests, by timer.',
+                 lambda: [({'timer': name}, timer['seconds']) for name, timer in profiles.stats()['timers'].items()],
+                 kind='counter')
+metrics.callback('path_optimizer_profile_events_total', 'Events counted by profiled requests, by counter.',
+                 lambda: [({'counter': name}, value) for name, value in profiles.stats()['counters'].items()],
+                 kind='counter')
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    """Count the request and its latency under its route pattern (not the raw path, which holds ids)."""
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_count.inc(route=route, method=request.method, status=response.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        request_latency.observe(time.perf_counter() - started, route=route)
+    return response
+
+
+def observe_problem(data: dict, n_points: int):
+    """Record the obstacle count (circles of a stored map) and waypoint count of a request."""
+    if 'map_id' in data:
+        n_obstacles = len(maps.get(data['map_id']).radii)
+    else:
+        n_obstacles = len(data.get('obstacles') or [])
+    obstacle_sizes.observe(n_obstacles)
+    point_sizes.observe(n_points)
+
+
+def observe_run(endpoint: str, iterations: int, stop_reason: str = None):
+    """Record the iterations of a computed optimization run and why it stopped."""
+    iteration_count.inc(iterations, endpoint=endpoint)
+    if stop_reason is not None:
+        run_outcomes.inc(stop_reason=stop_reason)
+
+
+def busy_response(error: Exception):
+    """Build the response for a job rejected or timed out by the worker pool."""
+    if isinstance(error, PoolFullError):
+        response = jsonify({'error': str(error)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return jsonify({'error': str(error)}), 504
+
+
+def obstacle_options(data: dict, safety_margin: float, copy: bool = False) -> dict:
+    """
+    PathOptimizer obstacle arguments for a request: its "obstacles" list, or
+    the stored map named by "map_id" (copy gives a private obstacle set for
+    optimizers whose obstacles change).
+    """
+    if 'map_id' in data:
+        return maps.get(data['map_id']).optimizer_options(safety_margin, copy)
+    return {'obstacles': data['obstacles']}
+
+
+def request_data() -> dict:
+    """Request body: JSON, or a binary body (see binary_codec.py) whose paths arrive as arrays."""
+    if request.mimetype == BINARY_MIMETYPE:
+        return decode_binary(request.get_data())
+    return request.get_json()
+
+
+def payload_response(payload: dict, profile: dict = None):
+    """
+    Build the response for payload: JSON, or a binary body when the Accept
+    header names BINARY_MIMETYPE (see binary_codec.py). With a profile the
+    response also carries a "profile" block, encoded along with the payload.
+    That encoding is timed as 'serialization' and added, with the rest of the
+    profile, to the running totals served by /api/profile.
+    """
+    dtype = accepted_dtype(request.headers.get('Accept'))
+    merged = None
+    if profile is not None:
+        merged = Profile()
+        merged.merge(profile)
+        payload = {**payload, 'profile': profile}
+    
+    with optional_timer(merged, 'serialization'):
+        if dtype is None:
+            response = jsonify(payload)
+        else:
+            response = app.response_class(encode_binary(payload, dtype), mimetype=BINARY_MIMETYPE)
+    if merged is not None:
+        profiles.add(merged.as_dict())
+    return response
+
 
 @app.route('/api/optimize', methods=['POST'])
 def optimize():
@@ -29,6 +182,10 @@ def optimize():
         "learning_rate": 0.001
     }
     
+    The optional fields (stored maps, 3D and moving obstacles, step rules,
+    early stopping, warm starts, frame options, binary bodies and profiling)
+    are listed in README.md under "/api/optimize options".
+    
     Returns:
     {
         "results": [
@@ -36,16 +193,135 @@ def optimize():
             ...
         ],
         "final_cost": 10.5,
-        "initial_cost": 500.0
+        "initial_cost": 500.0,
+        "cost_history": [500.0, ..., 10.5],
+        "frame_encoding": "full",
+        "stop_reason": "cost_tolerance",
+        "iterations": 87,
+        "final_path": [[x1, y1], [x2, y2], ...],
+        "warm_started": false
     }
     """
+    try:
+        data = request_data()
+        binary = accepted_dtype(request.headers.get('Accept')) is not None
+        
+        # Extract parameters
+        start = tuple(data['start'])
+        goal = tuple(data['goal'])
+        map_id = data.get('map_id')
+        obstacles = data['obstacles'] if map_id is None else []
+        n_points = data.get('n_points', 20)
+        safety_margin = data.get('safety_margin', 5.0)
+        weights = data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0})
+        n_iterations = data.get('n_iterations', 500)
+        learning_rate = data.get('learning_rate', 0.001)
+        momentum = data.get('momentum', 0.9)
+        frame_stride = data.get('frame_stride', 1)
+        min_cost_change = data.get('min_cost_change', 0.0)
+        frame_encoding = data.get('frame_encoding', 'full')
+        step_rule = data.get('step_rule', 'momentum')
+        initial_path = data.get('initial_path')
+        profile = bool(data.get('profile', False))
+        
+        # Stored maps are checked here so unknown ids get a 404 before any work
+        if map_id is not None:
+            maps.get(map_id).obstacle_set(safety_margin)
+        observe_problem(data, n_points)
+        
+        # The obstacles are hashed once, for the warm-start store and the cache key
+        obstacles_id = map_id if map_id is not None else problem_key({'obstacles': obstacles})
+        workspace = workspace_key(safety_margin, len(start))
+        warm_start = initial_path is None and bool(data.get('warm_start', False))
+        warm_start_radius = data.get('warm_start_radius')
+        
+        job = {
+            'start': start,
+            'goal': goal,
+            'obstacles': obstacles,
+            'n_points': n_points,
+            'safety_margin': safety_margin,
+            'weights': {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0, **weights},
+            'n_iterations': n_iterations,
+            'learning_rate': learning_rate,
+            'momentum': momentum,
+            'frame_stride': frame_stride,
+            'min_cost_change': min_cost_change,
+            'frame_encoding': frame_encoding,
+            'stopping': stopping_criteria(data),
+            'step_rule': step_rule,
+            'multires': multires_options(data),
+            'initial_path': initial_path,
+            'timing': timing_options(data),
+            'altitude_limits': data.get('altitude_limits'),
+            'obstacle_model': data.get('obstacle_model', 'waypoints')
+        }
+        if map_id is not None:
+            job.update(map_id=map_id, map_dir=maps.directory)
+        if binary:
+            # Keep paths as arrays all the way to the response
+            job['path_format'] = 'array'
+        
+        # Identical requests are answered from the cache, keyed on the request as
+        # sent so a warm-start seed never changes the key; profiled runs are
+        # always computed, and never cached
+        key = problem_key({
+            **job, 'obstacles': obstacles_id, 'warm_start': warm_start, 'warm_start_radius': warm_start_radius
+        })
+        payload = None if profile else cache.get(key)
+        cache_status = 'BYPASS' if profile else 'HIT'
+        if payload is None:
+            # Seed from the closest solved problem, preferably on the same map;
+            # the worker keeps the straight line when it costs less
+            if warm_start:
+                seed = warm_starts.nearest(workspace, obstacles_id, start, goal, warm_start_radius)
+                if seed is not None:
+                    job['warm_start_path'] = seed.tolist()
+            
+            # Run optimization on the worker pool
+            payload = pool.run(optimize_job, **job, profile=profile)
+            if not profile:
+                cache.put(key, payload)
+                cache_status = 'MISS'
+            observe_run('optimize', payload['iterations'], payload['stop_reason'])
+        warm_starts.add(workspace, obstacles_id, start, goal, payload['final_path'])
+        
+        body = dict(payload)
+        response = payload_response(body, body.pop('profile', None))
+        response.headers['X-Cache'] = cache_status
+        return response
+    
+    except (PoolFullError, JobTimeoutError) as e:
+        return busy_response(e)
+    
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/optimize_stream', methods=['POST'])
+def optimize_stream():
+    """
+    Endpoint to optimize a path, streaming iterations as they are computed.
+    
+    Expects the same JSON body as /api/optimize, including the frame options.
+    
+    Returns newline-delimited JSON (application/x-ndjson), one line per iteration:
+    {"iteration": 0, "path": [[x1, y1], [x2, y2], ...], "cost": 123.45}
+    
+    If the optimization fails part way, the last line is {"error": "..."}.
+    The run is iterated in the request thread but counts against the worker
+    pool's queue limit (503 when full) and stops with an error line once
+    OPTIMIZER_JOB_TIMEOUT has passed.
+    """
     try:
         data = request.get_json()
         
         # Extract parameters
         start = tuple(data['start'])
         goal = tuple(data['goal'])
-        obstacles = data['obstacles']
         n_points = data.get('n_points', 20)
         safety_margin = data.get('safety_margin', 5.0)
         weights = data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0})
@@ -53,25 +329,292 @@ def optimize():
         learning_rate = data.get('learning_rate', 0.001)
         momentum = data.get('momentum', 0.9)
         
-        # Create optimizer
+        # Create optimizer before streaming so bad input still gets a 400
         optimizer = PathOptimizer(
             start=start,
             goal=goal,
+            n_points=n_points,
+            safety_margin=safety_margin,
+            weights=weights,
+            step_rule=data.get('step_rule', 'momentum'),
+            initial_path=data.get('initial_path'),
+            altitude_limits=data.get('altitude_limits'),
+            obstacle_model=data.get('obstacle_model', 'waypoints'),
+            **obstacle_options(data, safety_margin),
+            **timing_options(data)
+        )
+        observe_problem(data, n_points)
+        
+        # The run counts against the pool's queue limit and stops at its deadline
+        job = pool.stream(optimization_frames(
+            optimizer,
+            n_iterations,
+            learning_rate,
+            momentum,
+            stopping=stopping_criteria(data),
+            multires=multires_options(data),
+            path_format='array'
+        ))
+        frames = decimate_frames(
+            job,
+            stride=data.get('frame_stride', 1),
+            min_cost_change=data.get('min_cost_change', 0.0)
+        )
+        frames = encode_frames(frames, encoding=data.get('frame_encoding', 'full'))
+    
+    except PoolFullError as e:
+        return busy_response(e)
+    
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        try:
+            for frame in frames:
+                yield json.dumps(frame) + '\n'
+            observe_run('optimize_stream', optimizer.iterations, optimizer.stop_reason)
+        except Exception as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Free the job slot even if the client goes away before the stream starts
+    response.call_on_close(job.close)
+    return response
+
+
+@app.route('/api/optimize_batch', methods=['POST'])
+def optimize_batch():
+    """
+    Endpoint to optimize many start/goal problems against one obstacle map.
+    
+    Expected JSON body:
+    {
+        "problems": [{"start": [x, y], "goal": [x, y]}, ...],
+        "obstacles": [{"center": [x, y], "radius": r}, ...],
+        "n_points": 20,
+        "safety_margin": 5.0,
+        "weights": {"length": 1.0, "smoothness": 50.0, "obstacle": 1000.0},
+        "n_iterations": 500,
+        "learning_rate": 0.001
+    }
+    
+    Returns:
+    {
+        "results": [
+            {"path": [[x1, y1], ...], "initial_cost": 500.0, "final_cost": 10.5, "cost_history": [...]},
+            ...
+        ]
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        # Extract parameters
+        problems = data['problems']
+        starts = [tuple(problem['start']) for problem in problems]
+        goals = [tuple(problem['goal']) for problem in problems]
+        obstacles = data['obstacles']
+        n_points = data.get('n_points', 20)
+        safety_margin = data.get('safety_margin', 5.0)
+        weights = data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0})
+        n_iterations = data.get('n_iterations', 500)
+        learning_rate = data.get('learning_rate', 0.001)
+        momentum = data.get('momentum', 0.9)
+        
+        observe_problem(data, n_points)
+        
+        # Run all problems together on the worker pool
+        payload = pool.run(
+            optimize_batch_job,
+            starts=starts,
+            goals=goals,
             obstacles=obstacles,
             n_points=n_points,
             safety_margin=safety_margin,
-            weights=weights
+            weights=weights,
+            n_iterations=n_iterations,
+            learning_rate=learning_rate,
+            momentum=momentum
         )
+        observe_run('optimize_batch', n_iterations * len(problems))
         
-        # Run optimization
-        results = optimizer.optimize(n_iterations=n_iterations, learning_rate=learning_rate, momentum=momentum)
+        return jsonify(payload)
+    
+    except (PoolFullError, JobTimeoutError) as e:
+        return busy_response(e)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    """
+    Endpoint to create an optimization session that keeps its state between steps.
+    
+    Expected JSON body:
+    {
+        "start": [x, y],
+        "goal": [x, y],
+        "obstacles": [{"center": [x, y], "radius": r}, ...],
+        "map_id": null,
+        "n_points": 20,
+        "safety_margin": 5.0,
+        "weights": {"length": 1.0, "smoothness": 50.0, "obstacle": 1000.0},
+        "learning_rate": 0.001,
+        "momentum": 0.9,
+        "step_rule": "momentum",
+        "initial_path": null,
+        "altitude_limits": null,
+        "obstacle_model": "waypoints",
+        "duration": null,
+        "departure_time": 0.0
+    }
+    
+    Sessions expire after a period without use and the least recently used
+    ones are dropped when the server holds too many.
+    
+    Returns (201):
+    {
+        "session_id": "...",
+        "path": [[x1, y1], [x2, y2], ...],
+        "cost": 123.45
+    }
+    """
+    try:
+        data = request.get_json()
         
-        return jsonify({
-            'results': results,
-            'final_cost': results[-1]['cost'],
-            'initial_cost': results[0]['cost'],
-            'cost_history': optimizer.get_cost_history()
-        })
+        safety_margin = data.get('safety_margin', 5.0)
+        optimizer = PathOptimizer(
+            start=tuple(data['start']),
+            goal=tuple(data['goal']),
+            n_points=data.get('n_points', 20),
+            safety_margin=safety_margin,
+            weights=data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0}),
+            step_rule=data.get('step_rule', 'momentum'),
+            initial_path=data.get('initial_path'),
+            altitude_limits=data.get('altitude_limits'),
+            obstacle_model=data.get('obstacle_model', 'waypoints'),
+            **obstacle_options(data, safety_margin, copy=True),
+            **timing_options(data)
+        )
+        session = OptimizationSession(
+            optimizer,
+            learning_rate=data.get('learning_rate', 0.001),
+            momentum=data.get('momentum', 0.9)
+        )
+        session_id = sessions.create(session)
+        observe_problem(data, optimizer.n_points)
+        
+        return jsonify({'session_id': session_id, **session.state()}), 201
+    
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """Current path, cost history and iteration count of a session."""
+    try:
+        return jsonify(sessions.get(session_id).state())
+    except SessionNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    """Drop a session."""
+    try:
+        sessions.delete(session_id)
+        return '', 204
+    except SessionNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/api/sessions/<session_id>/step', methods=['POST'])
+def step_session(session_id):
+    """
+    Endpoint to advance a session by some optimization steps.
+    
+    Expected JSON body (all optional):
+    {
+        "n_steps": 1,
+        "learning_rate": 0.001,
+        "momentum": 0.9
+    }
+    
+    learning_rate and momentum default to the values the session was created with.
+    
+    Returns:
+    {
+        "path": [[x1, y1], [x2, y2], ...],
+        "cost": 123.45,
+        "costs": [130.0, ..., 123.45],
+        "iteration": 10
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session = sessions.get(session_id)
+        result = session.advance(
+            n_steps=data.get('n_steps', 1),
+            learning_rate=data.get('learning_rate'),
+            momentum=data.get('momentum')
+        )
+        sessions.refresh(session_id)
+        observe_run('sessions', len(result['costs']))
+        return jsonify(result)
+    
+    except SessionNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/sessions/<session_id>/obstacles', methods=['POST'])
+def update_session_obstacles(session_id):
+    """
+    Endpoint to add, remove or move obstacles of a session without resubmitting the map.
+    The next steps continue from the session's current path.
+    
+    Expected JSON body (all optional):
+    {
+        "remove": [id, ...],
+        "move": [{"id": id, "center": [x, y], "radius": r}, ...],
+        "add": [{"center": [x, y], "radius": r}, ...]
+    }
+    
+    Obstacles the session was created with have ids 0, 1, ... in list order;
+    added obstacles get the ids returned here. "radius" is optional in "move".
+    
+    Returns:
+    {
+        "added": [id, ...],
+        "n_obstacles": 12,
+        "cost": 123.45
+    }
+    """
+    try:
+        data = request.get_json()
+        session = sessions.get(session_id)
+        result = session.update_obstacles(
+            add=data.get('add'),
+            remove=data.get('remove'),
+            move=data.get('move')
+        )
+        # Added obstacles count against the session memory budget
+        sessions.refresh(session_id)
+        return jsonify(result)
+    
+    except SessionNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -89,11 +632,20 @@ def single_step():
         "start": [x, y],
         "goal": [x, y],
         "obstacles": [{"center": [x, y], "radius": r}, ...],
+        "map_id": null,
         "safety_margin": 5.0,
         "weights": {"length": 1.0, "smoothness": 50.0, "obstacle": 1000.0},
-        "learning_rate": 0.001
+        "learning_rate": 0.001,
+        "profile": false
     }
     
+    "profile": true adds a "profile" block as for /api/optimize (not for sessions).
+    
+    Each call starts from zero momentum. To keep momentum and skip re-parsing
+    the obstacles, create a session with /api/sessions and send
+    {"session_id": "...", "n_steps": 1} instead; the response then also
+    carries "costs" and "iteration" as for /api/sessions/<id>/step.
+    
     Returns:
     {
         "path": [[x1, y1], [x2, y2], ...],
@@ -101,13 +653,23 @@ def single_step():
     }
     """
     try:
-        data = request.get_json()
+        data = request_data()
+        
+        if 'session_id' in data:
+            session = sessions.get(data['session_id'])
+            result = session.advance(
+                n_steps=data.get('n_steps', 1),
+                learning_rate=data.get('learning_rate'),
+                momentum=data.get('momentum')
+            )
+            sessions.refresh(data['session_id'])
+            observe_run('sessions', len(result['costs']))
+            return payload_response(result)
         
         # Extract parameters
         current_path = np.array(data['current_path'])
         start = tuple(data['start'])
         goal = tuple(data['goal'])
-        obstacles = data['obstacles']
         safety_margin = data.get('safety_margin', 5.0)
         weights = data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0})
         learning_rate = data.get('learning_rate', 0.001)
@@ -118,27 +680,56 @@ def single_step():
         optimizer = PathOptimizer(
             start=start,
             goal=goal,
-            obstacles=obstacles,
             n_points=n_points,
             safety_margin=safety_margin,
-            weights=weights
+            weights=weights,
+            altitude_limits=data.get('altitude_limits'),
+            obstacle_model=data.get('obstacle_model', 'waypoints'),
+            profile=bool(data.get('profile', False)),
+            **obstacle_options(data, safety_margin),
+            **timing_options(data)
         )
         
         # Set current path
         optimizer.path = current_path
         
         # Perform one step
+        observe_problem(data, n_points)
         new_path, cost = optimizer.optimize_step(learning_rate=learning_rate, momentum=momentum)
+        observe_run('single_step', 1)
         
-        return jsonify({
-            'path': new_path.tolist(),
+        # Binary responses send the array itself
+        if accepted_dtype(request.headers.get('Accept')) is None:
+            with optional_timer(optimizer.profile, 'tolist'):
+                new_path = new_path.tolist()
+        payload = {
+            'path': new_path,
             'cost': cost
-        })
+        }
+        return payload_response(payload, optimizer.profile.as_dict() if optimizer.profile is not None else None)
+    
+    except (SessionNotFoundError, MapNotFoundError) as e:
+        return jsonify({'error': str(e)}), 404
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
+def make_evaluator(data: dict, dim: int) -> CostEvaluator:
+    """CostEvaluator for the obstacles, weights and options of a cost request."""
+    safety_margin = data.get('safety_margin', 5.0)
+    return CostEvaluator(
+        safety_margin=safety_margin,
+        weights=data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0}),
+        dim=dim,
+        altitude_limits=data.get('altitude_limits'),
+        obstacle_model=data.get('obstacle_model', 'waypoints'),
+        profile=bool(data.get('profile', False)),
+        **obstacle_options(data, safety_margin),
+        **timing_options(data)
+    )
+
+
 @app.route('/api/calculate_cost', methods=['POST'])
 def calculate_cost():
     """
@@ -148,8 +739,10 @@ def calculate_cost():
     {
         "path": [[x1, y1], [x2, y2], ...],
         "obstacles": [{"center": [x, y], "radius": r}, ...],
+        "map_id": null,
         "safety_margin": 5.0,
-        "weights": {"length": 1.0, "smoothness": 50.0, "obstacle": 1000.0}
+        "weights": {"length": 1.0, "smoothness": 50.0, "obstacle": 1000.0},
+        "profile": false
     }
     
     Returns:
@@ -157,46 +750,246 @@ def calculate_cost():
         "total_cost": 123.45,
         "length_cost": 10.0,
         "smoothness_cost": 5.0,
-        "obstacle_cost": 108.45
+        "obstacle_cost": 108.45,
+        "altitude_cost": 0.0
     }
+    
+    Paths may be 3D, with "altitude_limits", "obstacle_model" and "map_id"
+    as for /api/optimize. "profile": true adds a "profile" block as for
+    /api/optimize. The costs are those of PathOptimizer.total_cost, computed
+    in one pass by a CostEvaluator; to score many paths on the same map use
+    /api/calculate_cost_batch.
+    """
+    try:
+        data = request_data()
+        
+        path = np.asarray(data['path'], dtype=float)
+        if path.ndim != 2:
+            raise ValueError(f"path must be a list of points, got shape {path.shape}")
+        evaluator = make_evaluator(data, path.shape[1])
+        observe_problem(data, len(path))
+        
+        payload = evaluator.evaluate(path)
+        return payload_response(payload, evaluator.profile.as_dict() if evaluator.profile is not None else None)
+    
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/calculate_cost_batch', methods=['POST'])
+def calculate_cost_batch():
+    """
+    Endpoint to score many candidate paths against the same obstacle map.
+    
+    Expected JSON body:
+    {
+        "paths": [[[x1, y1], [x2, y2], ...], ...],
+        "obstacles": [{"center": [x, y], "radius": r}, ...],
+        "map_id": null,
+        "safety_margin": 5.0,
+        "weights": {"length": 1.0, "smoothness": 50.0, "obstacle": 1000.0}
+    }
+    
+    Paths may differ in length; paths of the same length are evaluated
+    together in one vectorized pass. All other options are as for
+    /api/calculate_cost. In a binary body (see README.md) "paths" can be
+    one (n_paths, n_points, dim) array, and binary responses carry each cost
+    as an array.
+    
+    Returns (one entry per path, in order):
+    {
+        "total_cost": [123.45, ...],
+        "length_cost": [10.0, ...],
+        "smoothness_cost": [5.0, ...],
+        "obstacle_cost": [108.45, ...],
+        "altitude_cost": [0.0, ...]
+    }
+    """
+    try:
+        data = request_data()
+        
+        paths = data['paths']
+        dim = np.shape(paths[0])[-1] if len(paths) else 2
+        evaluator = make_evaluator(data, dim)
+        observe_problem(data, max((len(path) for path in paths), default=0))
+        
+        payload = evaluator.evaluate_batch(paths)
+        if accepted_dtype(request.headers.get('Accept')) is None:
+            payload = {key: values.tolist() for key, values in payload.items()}
+        return payload_response(payload, evaluator.profile.as_dict() if evaluator.profile is not None else None)
+    
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/validate_path', methods=['POST'])
+def validate_path():
+    """
+    Endpoint to check a path segment by segment against the obstacles.
+    
+    Expected JSON body:
+    {
+        "path": [[x1, y1], [x2, y2], ...],
+        "obstacles": [{"center": [x, y], "radius": r}, ...],
+        "map_id": null,
+        "safety_margin": 5.0
+    }
+    
+    Returns:
+    {
+        "clearance": [12.5, 3.1, ...],
+        "nearest": [0, 2, ...],
+        "min_clearance": 3.1,
+        "collision_free": true,
+        "within_margin": false
+    }
+    
+    clearance is the exact distance from each segment to the nearest obstacle
+    surface (negative inside an obstacle, null without obstacles), nearest the
+    index of that obstacle in the obstacles list (-1 without obstacles or for
+    polygons, which are sampled along each segment). collision_free says no
+    segment touches an obstacle, within_margin that every segment also keeps
+    safety_margin. Moving obstacles are not checked. For a stored map,
+    nearest counts the map's circles in upload order.
     """
     try:
         data = request.get_json()
         
-        # Extract parameters
-        path = np.array(data['path'])
-        obstacles = data['obstacles']
+        path = np.array(data['path'], dtype=float)
         safety_margin = data.get('safety_margin', 5.0)
-        weights = data.get('weights', {'length': 1.0, 'smoothness': 50.0, 'obstacle': 1000.0})
+        if 'map_id' in data:
+            optimizer = PathOptimizer(tuple(path[0]), tuple(path[-1]), n_points=len(path),
+                                      safety_margin=safety_margin, **obstacle_options(data, safety_margin))
+            return jsonify(optimizer.validate_path(path))
         
-        # Create optimizer (start and goal are just the path endpoints)
-        n_points = len(path)
+        obstacles = data['obstacles']
+        circle_index = [j for j, obstacle in enumerate(obstacles)
+                        if not is_moving(obstacle) and not is_polygon(obstacle)]
+        polygons = [obstacle for obstacle in obstacles if is_polygon(obstacle)]
         optimizer = PathOptimizer(
             start=tuple(path[0]),
             goal=tuple(path[-1]),
-            obstacles=obstacles,
-            n_points=n_points,
-            safety_margin=safety_margin,
-            weights=weights
+            obstacles=[obstacles[j] for j in circle_index] + polygons,
+            n_points=len(path),
+            safety_margin=safety_margin
         )
         
-        # Calculate individual costs
-        length_cost = optimizer.cost_length(path)
-        smoothness_cost = optimizer.cost_smoothness(path)
-        obstacle_cost = optimizer.cost_obstacle(path)
-        total_cost = optimizer.total_cost(path)
-        
-        return jsonify({
-            'total_cost': total_cost,
-            'length_cost': length_cost,
-            'smoothness_cost': smoothness_cost,
-            'obstacle_cost': obstacle_cost
-        })
+        report = optimizer.validate_path(path)
+        report['nearest'] = [circle_index[j] if j >= 0 else -1 for j in report['nearest']]
+        return jsonify(report)
+    
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
+@app.route('/api/maps', methods=['POST'])
+def create_map():
+    """
+    Endpoint to upload an obstacle map once and reference it by id afterwards.
+    
+    Expected JSON body:
+    {
+        "obstacles": [{"center": [x, y], "radius": r}, {"polygon": [[x, y], ...]}, ...],
+        "dim": 2,
+        "rasterize": false,
+        "field_cell_size": null,
+        "field_padding": 50.0
+    }
+    
+    The map is preprocessed into arrays and, for polygons, a signed distance
+    field, then saved as memory-mapped files. "rasterize": true puts the
+    circles into the field as well (2D only), so each waypoint costs one
+    lookup however many obstacles the map has; the circles are then penalized
+    like polygons, (safety_margin - distance)^2, instead of (R^2 - d^2)^2,
+    which changes the obstacle cost scale ("circle_penalty" in the response
+    says which applies). Requests may then use the map
+    with safety margins up to field_padding. Ids are content hashes: the same
+    map uploaded twice gets the same id. Maps hold static obstacles only.
+    
+    Returns (201):
+    {
+        "map_id": "...",
+        "dim": 2,
+        "n_circles": 120,
+        "distance_field": true,
+        "field_padding": 50.0,
+        "circle_penalty": "analytic",
+        "nbytes": 123456
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        stored = maps.put(
+            data['obstacles'],
+            dim=data.get('dim', 2),
+            rasterize=data.get('rasterize', False),
+            field_cell_size=data.get('field_cell_size'),
+            field_padding=data.get('field_padding', 50.0)
+        )
+        return jsonify(stored.info()), 201
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/maps/<map_id>', methods=['GET'])
+def get_map(map_id):
+    """Description of a stored map (see /api/maps)."""
+    try:
+        return jsonify(maps.get(map_id).info())
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/api/maps/<map_id>', methods=['DELETE'])
+def delete_map(map_id):
+    """Remove a stored map."""
+    try:
+        maps.delete(map_id)
+        return '', 204
+    except MapNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Result cache counters (hits, misses, hit rate, evictions, size)."""
+    return jsonify(cache.stats())
+
+
+@app.route('/api/sessions', methods=['GET'])
+def session_stats():
+    """Session counters (live sessions, memory, expiries, evictions)."""
+    return jsonify(sessions.stats())
+
+
+@app.route('/api/profile', methods=['GET'])
+def profile_stats():
+    """Cumulative timers and counters of all profiled requests (see /api/optimize)."""
+    return jsonify(profiles.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus metrics in the text exposition format: requests and latency
+    per route, iterations, run outcomes, obstacle and waypoint counts per
+    request, worker queue depth, result cache hit rate, live sessions and the
+    profile totals of /api/profile.
+    """
+    return Response(metrics.render(), content_type=Registry.CONTENT_TYPE)
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint."""
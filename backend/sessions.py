@@ -0,0 +1,306 @@
+"""
+Stateful optimization sessions
+Keep a PathOptimizer alive between requests so clients can step it incrementally
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from optimizer import PathOptimizer
+
+# Largest number of steps a single advance call may run
+MAX_STEPS_PER_CALL = 1000
+
+
+class SessionNotFoundError(Exception):
+    """Raised when a session id is unknown or its session has expired."""
+
+
+class OptimizationSession:
+    """
+    A PathOptimizer plus the step settings it was created with.
+    Velocity, step rule state and cost history persist between advance calls,
+    so stepping a session N times matches N iterations of optimize().
+    """
+
+    def __init__(self, optimizer: PathOptimizer, learning_rate: float = 0.001, momentum: float = 0.9):
+        """
+        Initialize the session.
+
+        Args:
+            optimizer: Optimizer holding the path to refine
+            learning_rate: Default step size for advance
+            momentum: Default momentum coefficient for advance
+        """
+        self.optimizer = optimizer
+        self.learning_rate = learning_rate
+        self.momentum = momentum
+        self.iterations = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+        optimizer.cost_history = [optimizer.total_cost(optimizer.path)]
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the session's arrays."""
+        optimizer = self.optimizer
+        obstacle_set = optimizer.obstacle_set
+        size = optimizer.path.nbytes * 2  # path and velocity
+        size += obstacle_set.centers.nbytes + obstacle_set.radii.nbytes + obstacle_set.inflated_sq.nbytes
+        if obstacle_set.heights is not None:
+            size += obstacle_set.heights.nbytes
+        size += 8 * len(optimizer.cost_history)
+        if optimizer.distance_field is not None:
+            size += optimizer.distance_field.nbytes
+        return size
+
+    def advance(self, n_steps: int = 1, learning_rate: Optional[float] = None,
+                momentum: Optional[float] = None) -> Dict:
+        """
+        Run optimization steps from the current path.
+
+        Args:
+            n_steps: Number of steps (1 to MAX_STEPS_PER_CALL)
+            learning_rate: Step size, defaults to the session's
+            momentum: Momentum coefficient, defaults to the session's
+
+        Returns:
+            Dictionary with 'path', 'cost', 'costs' (one per step) and
+            'iteration' (steps run since the session was created)
+        """
+        if not 1 <= n_steps <= MAX_STEPS_PER_CALL:
+            raise ValueError(f"n_steps must be between 1 and {MAX_STEPS_PER_CALL}, got {n_steps}")
+        learning_rate = self.learning_rate if learning_rate is None else learning_rate
+        momentum = self.momentum if momentum is None else momentum
+
+        with self.lock:
+            costs = []
+            for _ in range(n_steps):
+                _, cost = self.optimizer.optimize_step(learning_rate, momentum)
+                costs.append(cost)
+            self.iterations += n_steps
+
+            return {
+                'path': self.optimizer.get_path(),
+                'cost': costs[-1],
+                'costs': costs,
+                'iteration': self.iterations
+            }
+
+    def update_obstacles(self, add: List[Dict] = None, remove: List[int] = None,
+                         move: List[Dict] = None) -> Dict:
+        """
+        Change the obstacle map in place; later steps continue from the current path.
+        Obstacles the session was created with have ids 0, 1, ... in list order.
+        The edits are checked before any is applied (see PathOptimizer.update_obstacles).
+
+        Args:
+            add: New obstacles, each with 'center' (x, y) and 'radius'
+            remove: Ids of obstacles to remove
+            move: Changes, each with 'id', 'center' and optionally 'radius' (see
+                PathOptimizer.move_obstacles)
+
+        Returns:
+            Dictionary with 'added' (ids of the new obstacles), 'n_obstacles'
+            and 'cost' (of the current path on the changed map)
+        """
+        with self.lock:
+            optimizer = self.optimizer
+            added = optimizer.update_obstacles(add, remove, move)
+
+            return {
+                'added': added,
+                'n_obstacles': len(optimizer.obstacle_set),
+                'cost': optimizer.total_cost(optimizer.path)
+            }
+
+    def state(self) -> Dict:
+        """
+        Snapshot of the session.
+
+        Returns:
+            Dictionary with 'path', 'cost', 'cost_history' and 'iteration'
+        """
+        with self.lock:
+            cost_history = list(self.optimizer.get_cost_history())
+            return {
+                'path': self.optimizer.get_path(),
+                'cost': cost_history[-1],
+                'cost_history': cost_history,
+                'iteration': self.iterations
+            }
+
+
+class SessionStore:
+    """
+    Thread-safe registry of sessions in least recently used order.
+    Sessions idle for longer than idle_timeout expire. When more than
+    max_sessions sessions exist, or their arrays exceed max_bytes, the least
+    recently used ones are dropped. Sizes are measured on create and again on
+    refresh, which callers run after a session grows.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: Optional[float] = 600.0,
+                 max_bytes: int = 256 * 1024 * 1024):
+        """
+        Initialize the store.
+
+        Args:
+            max_sessions: Maximum number of live sessions
+            idle_timeout: Seconds without use before a session expires (None never expires)
+            max_bytes: Approximate memory budget for all sessions together
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.expired = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> 'SessionStore':
+        """
+        Build a store configured by OPTIMIZER_SESSIONS, OPTIMIZER_SESSION_TTL
+        and OPTIMIZER_SESSION_BYTES environment variables.
+        """
+        ttl = os.environ.get('OPTIMIZER_SESSION_TTL', '600')
+        return cls(
+            max_sessions=int(os.environ.get('OPTIMIZER_SESSIONS', '1000')),
+            idle_timeout=float(ttl) if ttl else None,
+            max_bytes=int(os.environ.get('OPTIMIZER_SESSION_BYTES', str(256 * 1024 * 1024)))
+        )
+
+    def _purge(self):
+        # Sessions are in LRU order, so expired ones are at the front
+        if self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > deadline:
+                break
+            self._drop(session_id)
+            self.expired += 1
+
+    def _drop(self, session_id: str) -> Optional[OptimizationSession]:
+        session = self._sessions.pop(session_id, None)
+        self._bytes -= self._sizes.pop(session_id, 0)
+        return session
+
+    def _evict(self):
+        # Drop least recently used sessions until both limits hold
+        while len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def create(self, session: OptimizationSession) -> str:
+        """
+        Register a session.
+
+        Args:
+            session: Session to keep
+
+        Returns:
+            New session id
+
+        Raises:
+            ValueError: If the session alone exceeds max_bytes
+        """
+        size = session.nbytes
+        if size > self.max_bytes:
+            raise ValueError(f"Session needs about {size} bytes, more than the {self.max_bytes} byte limit")
+
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge()
+            self._sessions[session_id] = session
+            self._sizes[session_id] = size
+            self._bytes += size
+            self._evict()
+        return session_id
+
+    def refresh(self, session_id: str):
+        """
+        Measure a session again after it changed (obstacles added, steps
+        taken) and drop least recently used sessions beyond max_bytes; a
+        session that alone exceeds max_bytes is dropped too. Sessions dropped
+        in the meantime are ignored.
+
+        Args:
+            session_id: Id returned by create
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            size = session.nbytes
+            self._bytes += size - self._sizes[session_id]
+            self._sizes[session_id] = size
+            self._evict()
+
+    def get(self, session_id: str) -> OptimizationSession:
+        """
+        Look up a session and mark it as used.
+
+        Args:
+            session_id: Id returned by create
+
+        Returns:
+            The session
+
+        Raises:
+            SessionNotFoundError: If the id is unknown or expired
+        """
+        with self._lock:
+            self._purge()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise SessionNotFoundError(f"Unknown or expired session {session_id!r}")
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str):
+        """
+        Drop a session.
+
+        Raises:
+            SessionNotFoundError: If the id is unknown or expired
+        """
+        with self._lock:
+            if self._drop(session_id) is None:
+                raise SessionNotFoundError(f"Unknown or expired session {session_id!r}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge()
+            return len(self._sessions)
+
+    def stats(self) -> Dict:
+        """
+        Session counters for sizing.
+
+        Returns:
+            Dictionary with 'sessions', 'bytes', 'expired', 'evictions',
+            'max_sessions' and 'max_bytes'
+        """
+        with self._lock:
+            self._purge()
+            return {
+                'sessions': len(self._sessions),
+                'bytes': self._bytes,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'max_sessions': self.max_sessions,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,394 @@
+"""
+Step rules for the path optimizer
+Each rule turns the whole-path cost and gradient of a PathOptimizer into its next path
+"""
+
+import copy
+import numpy as np
+from collections import deque
+from typing import Optional, Tuple
+
+from banded import quadratic_bands, solve_pentadiagonal
+
+# Per-waypoint gradient norm limit applied by the momentum-based rules
+MAX_GRAD_NORM = 50.0
+
+
+def clip_gradient(grad: np.ndarray, profile=None) -> np.ndarray:
+    """
+    Clip each waypoint gradient to MAX_GRAD_NORM and zero non-finite rows.
+
+    Args:
+        grad: Gradient of the intermediate waypoints (..., n_points - 2, dim),
+            for one path or a stack of paths
+        profile: Optional Profile counting 'clipped_gradients' and 'nan_resets'
+
+    Returns:
+        Clipped gradient
+    """
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        grad_norm = np.linalg.norm(grad, axis=-1, keepdims=True)
+        clipped = grad_norm > MAX_GRAD_NORM
+        scale = np.where(clipped, MAX_GRAD_NORM / grad_norm, 1.0)
+        grad = grad * scale
+    non_finite = ~np.all(np.isfinite(grad), axis=-1)
+    grad[non_finite] = 0.0
+    if profile is not None:
+        profile.count('clipped_gradients', np.count_nonzero(clipped[~non_finite]))
+        profile.count('nan_resets', np.count_nonzero(non_finite))
+    return grad
+
+
+def apply_update(path: np.ndarray, update: np.ndarray, *state: np.ndarray, profile=None) -> np.ndarray:
+    """
+    Move the intermediate waypoints by update, keeping any that would overflow.
+
+    Args:
+        path: Current path (n_points, dim), or a stack of paths (..., n_points, dim)
+        update: Displacement of the intermediate waypoints (..., n_points - 2, dim)
+        *state: Per-waypoint state arrays (..., n_points - 2, dim) zeroed where the update overflowed
+        profile: Optional Profile counting the kept waypoints as 'nan_resets'
+
+    Returns:
+        New path
+    """
+    inner = (Ellipsis, slice(1, path.shape[-2] - 1), slice(None))
+    new_path = path.astype(float, copy=True)
+    with np.errstate(over='ignore', invalid='ignore'):
+        new_path[inner] = path[inner] + update
+
+    # Keep old value and reset state where the update overflowed
+    overflow = ~np.all(np.isfinite(new_path[inner]), axis=-1)
+    if np.any(overflow):
+        new_path[inner][overflow] = path[inner][overflow]
+        for array in state:
+            array[overflow] = 0.0
+        if profile is not None:
+            profile.count('nan_resets', np.count_nonzero(overflow))
+    return new_path
+
+
+def line_search(optimizer, path: np.ndarray, direction: np.ndarray, cost: float, slope: float,
+                max_steps: int = 30, c1: float = 1e-4) -> Tuple[Optional[np.ndarray], Optional[float]]:
+    """
+    Backtracking (Armijo) line search on total_cost along a direction for the
+    intermediate waypoints, starting from a full step.
+
+    Args:
+        optimizer: PathOptimizer providing total_cost
+        path: Current path (n_points, dim)
+        direction: Search direction for the intermediate waypoints (n_points - 2, dim)
+        cost: total_cost of path
+        slope: Directional derivative (gradient . direction), negative for descent
+        max_steps: Maximum number of step halvings
+        c1: Sufficient decrease constant
+
+    Returns:
+        Tuple of (accepted path, its cost), or (None, None) if no step decreased the cost enough
+    """
+    inner = slice(1, len(path) - 1)
+    step = 1.0
+    for _ in range(max_steps):
+        candidate = path.astype(float, copy=True)
+        candidate[inner] += step * direction
+        candidate_cost = optimizer.total_cost(candidate)
+        if candidate_cost <= cost + c1 * step * slope:
+            return candidate, candidate_cost
+        step *= 0.5
+    return None, None
+
+
+class StepRule:
+    """
+    Base class for step rules.
+    A rule keeps its own state between steps; reset() forgets it.
+    """
+
+    name = None
+
+    def reset(self):
+        """Forget any state accumulated by previous steps."""
+
+    def fresh(self) -> 'StepRule':
+        """
+        Copy the rule with its settings (e.g. AdamStep's beta2) but no state.
+
+        Returns:
+            New StepRule instance of the same type
+        """
+        rule = copy.copy(self)
+        rule.reset()
+        return rule
+
+    def step(self, optimizer, learning_rate: float, momentum: float) -> Tuple[np.ndarray, Optional[float]]:
+        """
+        Compute the next path.
+
+        Args:
+            optimizer: PathOptimizer whose path is being optimized
+            learning_rate: Step size
+            momentum: Momentum coefficient (0.0 to 1.0)
+
+        Returns:
+            Tuple of (new_path, cost of new_path or None if not computed)
+        """
+        raise NotImplementedError
+
+
+class MomentumStep(StepRule):
+    """
+    Heavy-ball momentum with per-waypoint gradient clipping.
+    The velocity lives on the optimizer (optimizer.velocity).
+    """
+
+    name = 'momentum'
+
+    def step(self, optimizer, learning_rate, momentum):
+        path = optimizer.path
+        if optimizer.velocity is None:
+            optimizer.velocity = np.zeros_like(path, dtype=float)
+        inner = slice(1, optimizer.n_points - 1)
+
+        grad = clip_gradient(optimizer.interior_gradient(path), optimizer.profile)
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            velocity = momentum * optimizer.velocity[inner] - learning_rate * grad
+        new_path = apply_update(path, velocity, velocity, profile=optimizer.profile)
+        optimizer.velocity[inner] = velocity
+
+        return new_path, None
+
+
+class NesterovStep(StepRule):
+    """
+    Nesterov accelerated gradient: the gradient is taken at the point the
+    momentum is about to carry the path to. Uses the same clipping as MomentumStep.
+    """
+
+    name = 'nesterov'
+
+    def step(self, optimizer, learning_rate, momentum):
+        path = optimizer.path
+        if optimizer.velocity is None:
+            optimizer.velocity = np.zeros_like(path, dtype=float)
+        inner = slice(1, optimizer.n_points - 1)
+
+        lookahead = path.astype(float, copy=True)
+        lookahead[inner] += momentum * optimizer.velocity[inner]
+        grad = clip_gradient(optimizer.interior_gradient(lookahead), optimizer.profile)
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            velocity = momentum * optimizer.velocity[inner] - learning_rate * grad
+        new_path = apply_update(path, velocity, velocity, profile=optimizer.profile)
+        optimizer.velocity[inner] = velocity
+
+        return new_path, None
+
+
+class AdamStep(StepRule):
+    """
+    Adam with bias correction. momentum is used as beta1.
+    Steps are roughly learning_rate long per coordinate regardless of the
+    gradient scale, so learning rates are in path units (e.g. 0.5).
+    """
+
+    name = 'adam'
+
+    def __init__(self, beta2: float = 0.999, eps: float = 1e-8):
+        self.beta2 = beta2
+        self.eps = eps
+        self.reset()
+
+    def reset(self):
+        self.m = None
+        self.v = None
+        self.t = 0
+
+    def step(self, optimizer, learning_rate, momentum):
+        path = optimizer.path
+        grad = optimizer.interior_gradient(path)
+        non_finite = ~np.all(np.isfinite(grad), axis=1)
+        grad[non_finite] = 0.0
+        if optimizer.profile is not None:
+            optimizer.profile.count('nan_resets', np.count_nonzero(non_finite))
+
+        if self.m is None or self.m.shape != grad.shape:
+            self.m = np.zeros_like(grad)
+            self.v = np.zeros_like(grad)
+            self.t = 0
+
+        self.t += 1
+        self.m = momentum * self.m + (1 - momentum) * grad
+        self.v = self.beta2 * self.v + (1 - self.beta2) * grad ** 2
+        m_hat = self.m / (1 - momentum ** self.t) if momentum < 1 else self.m
+        v_hat = self.v / (1 - self.beta2 ** self.t)
+
+        update = -learning_rate * m_hat / (np.sqrt(v_hat) + self.eps)
+        return apply_update(path, update, self.m, self.v, profile=optimizer.profile), None
+
+
+class LBFGSStep(StepRule):
+    """
+    Limited-memory BFGS on the intermediate waypoints with a backtracking
+    (Armijo) line search on total_cost. learning_rate is not used: the first
+    trial step moves the path by one unit, later ones use the BFGS scaling.
+    """
+
+    name = 'lbfgs'
+
+    def __init__(self, memory: int = 10, max_line_search: int = 30, c1: float = 1e-4):
+        self.memory = memory
+        self.max_line_search = max_line_search
+        self.c1 = c1
+        self.reset()
+
+    def reset(self):
+        self.s = deque(maxlen=self.memory)
+        self.y = deque(maxlen=self.memory)
+        self.path = None
+        self.grad = None
+        self.cost = None
+
+    def _direction(self, grad: np.ndarray) -> np.ndarray:
+        # Two-loop recursion
+        q = grad.copy()
+        alphas = []
+        for s, y in zip(reversed(self.s), reversed(self.y)):
+            rho = 1.0 / np.dot(y, s)
+            alpha = rho * np.dot(s, q)
+            q -= alpha * y
+            alphas.append((rho, alpha))
+
+        if self.s:
+            s, y = self.s[-1], self.y[-1]
+            q *= np.dot(s, y) / np.dot(y, y)
+        else:
+            # Unit-length first step
+            q /= max(np.linalg.norm(q), 1e-12)
+
+        for (s, y), (rho, alpha) in zip(zip(self.s, self.y), reversed(alphas)):
+            beta = rho * np.dot(y, q)
+            q += (alpha - beta) * s
+        return -q
+
+    def step(self, optimizer, learning_rate, momentum):
+        path = optimizer.path
+        inner = slice(1, optimizer.n_points - 1)
+
+        # Reuse the gradient and cost from the previous line search
+        if self.path is not path:
+            self.reset()
+            self.grad = optimizer.interior_gradient(path).ravel()
+            self.cost = optimizer.total_cost(path)
+        grad, cost = self.grad, self.cost
+
+        direction = self._direction(grad)
+        slope = np.dot(grad, direction)
+        if not np.isfinite(slope) or slope >= 0:
+            # Not a descent direction, fall back to steepest descent
+            self.s.clear()
+            self.y.clear()
+            direction = self._direction(grad)
+            slope = np.dot(grad, direction)
+
+        candidate, candidate_cost = line_search(
+            optimizer, path, direction.reshape(-1, path.shape[1]), cost, slope, self.max_line_search, self.c1
+        )
+        if candidate is None:
+            # No sufficient decrease: keep the path and start the memory afresh
+            self.s.clear()
+            self.y.clear()
+            self.path = path
+            return path, cost
+
+        new_grad = optimizer.interior_gradient(candidate).ravel()
+        s = (candidate[inner] - path[inner]).ravel()
+        y = new_grad - grad
+        if np.dot(s, y) > 1e-10:
+            self.s.append(s)
+            self.y.append(y)
+
+        self.path, self.grad, self.cost = candidate, new_grad, candidate_cost
+        return candidate, candidate_cost
+
+
+class BandedNewtonStep(StepRule):
+    """
+    Newton step on the quadratic length and smoothness terms.
+    Their Hessian is pentadiagonal and constant, so each step solves one banded
+    system per coordinate. The obstacle term adds the diagonal of its
+    Gauss-Newton Hessian. A backtracking line search on total_cost keeps the
+    step safe. Without obstacles in the way the first step lands on the
+    optimum. learning_rate is not used.
+    """
+
+    name = 'banded_newton'
+
+    def __init__(self, max_line_search: int = 30, c1: float = 1e-4, ridge: float = 1e-9):
+        self.max_line_search = max_line_search
+        self.c1 = c1
+        self.ridge = ridge
+        self.bands = None
+
+    def reset(self):
+        self.bands = None
+
+    def step(self, optimizer, learning_rate, momentum):
+        path = optimizer.path
+        if optimizer.n_points < 3:
+            return path, None
+
+        if self.bands is None or len(self.bands[0]) != optimizer.n_points - 2:
+            self.bands = quadratic_bands(optimizer.n_points, optimizer.w_len, optimizer.w_smooth)
+        main, off1, off2 = self.bands
+
+        grad = optimizer.interior_gradient(path)
+        cost = optimizer.total_cost(path)
+        if not np.all(np.isfinite(grad)):
+            if optimizer.profile is not None:
+                optimizer.profile.count('nan_resets')
+            return path, cost
+
+        # Gauss-Newton diagonal of w_obs * (R_sq - d_sq)^2: 8 * w_obs * (p - c)^2 per coordinate
+        point_index, offset, _ = optimizer.interior_contacts(path)
+        obstacle_diag = np.zeros_like(grad)
+        np.add.at(obstacle_diag, point_index, 8 * optimizer.w_obs * offset ** 2)
+        if optimizer.altitude_limits is not None:
+            # The altitude penalty is quadratic outside the limits
+            z_min, z_max = optimizer.altitude_limits
+            z = path[1:optimizer.n_points - 1, 2]
+            obstacle_diag[:, 2] += 2 * optimizer.w_alt * ((z < z_min) | (z > z_max))
+
+        direction = np.empty_like(grad)
+        for axis in range(grad.shape[1]):
+            diagonal = main + obstacle_diag[:, axis] + self.ridge * max(np.max(main, initial=0.0), 1.0)
+            direction[:, axis] = -solve_pentadiagonal(diagonal, off1, off2, grad[:, axis])
+
+        slope = float(np.sum(grad * direction))
+        new_path, new_cost = line_search(optimizer, path, direction, cost, slope, self.max_line_search, self.c1)
+        if new_path is None:
+            return path, cost
+        return new_path, new_cost
+
+
+# Step rules selectable by name
+STEP_RULES = {
+    rule.name: rule for rule in (MomentumStep, NesterovStep, AdamStep, LBFGSStep, BandedNewtonStep)
+}
+
+
+def make_step_rule(step_rule) -> StepRule:
+    """
+    Create a step rule from its name, or pass an existing instance through.
+
+    Args:
+        step_rule: One of STEP_RULES or a StepRule instance
+
+    Returns:
+        StepRule instance
+    """
+    if isinstance(step_rule, StepRule):
+        return step_rule
+    if step_rule not in STEP_RULES:
+        raise ValueError(f"step_rule must be one of {tuple(STEP_RULES)}, got {step_rule!r}")
+    return STEP_RULES[step_rule]()
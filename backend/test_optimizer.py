@@ -5,11 +5,20 @@ Validates that the optimization algorithm works correctly
 
 import sys
 import os
+import json
 
 # Add backend directory to path
 sys.path.insert(0, os.path.dirname(__file__))
 
 from optimizer import PathOptimizer
+from obstacles import ObstacleSet
+import obstacles as obstacles_module
+from distance_field import DistanceField
+from cost_evaluator import CostEvaluator
+from batch import BatchPathOptimizer
+from benchmark import compare, run_benchmarks
+from step_rules import STEP_RULES, AdamStep
+from multires import resolution_levels, upsample_path
 import numpy as np
 
 
@@ -172,6 +181,566 @@ def test_cost_components():
     print("\n✅ TEST PASSED: All cost components working correctly")
 
 
+def test_vectorized_gradient_matches_pointwise():
+    """Test that the whole-path gradient matches the per-point reference."""
+    print("\n" + "=" * 60)
+    print("TEST: Vectorized Gradient")
+    print("=" * 60)
+    
+    rng = np.random.default_rng(0)
+    obstacles = [
+        {'center': list(rng.uniform(0, 100, 2)), 'radius': float(rng.uniform(3, 15))}
+        for _ in range(10)
+    ]
+    
+    optimizer = PathOptimizer(
+        start=(0, 0),
+        goal=(100, 100),
+        obstacles=obstacles,
+        n_points=25,
+        safety_margin=5.0
+    )
+    path = optimizer.path + rng.normal(0, 5, optimizer.path.shape)
+    
+    reference = np.array([optimizer.gradient_total(path, i) for i in range(optimizer.n_points)])
+    vectorized = optimizer.gradient_total_path(path)
+    
+    print(f"Max abs difference: {np.max(np.abs(reference - vectorized)):.3e}")
+    assert np.allclose(reference, vectorized), "Vectorized gradient should match per-point gradient!"
+    
+    # Both gradient modes should produce the same optimization trajectory
+    pointwise = PathOptimizer((0, 0), (100, 100), obstacles, n_points=25, gradient_mode='pointwise')
+    whole_path = PathOptimizer((0, 0), (100, 100), obstacles, n_points=25, gradient_mode='vectorized')
+    pointwise.optimize(n_iterations=50)
+    whole_path.optimize(n_iterations=50)
+    assert np.allclose(pointwise.path, whole_path.path), "Gradient modes should give the same path!"
+    
+    print("\n✅ TEST PASSED: Vectorized gradient matches reference")
+
+
+def test_batch_matches_single():
+    """Test that BatchPathOptimizer follows the same trajectory as PathOptimizer."""
+    print("\n" + "=" * 60)
+    print("TEST: Batch Optimizer")
+    print("=" * 60)
+    
+    obstacles = [{'center': [400, 300], 'radius': 50}, {'center': [300, 200], 'radius': 30}]
+    starts, goals = [(50, 300), (50, 100)], [(750, 300), (750, 500)]
+    batch = BatchPathOptimizer(starts, goals, obstacles, n_points=20)
+    results = batch.optimize(n_iterations=100)
+    
+    for start, goal, result in zip(starts, goals, results):
+        single = PathOptimizer(start, goal, obstacles, n_points=20)
+        single.optimize(n_iterations=100)
+        print(f"{start} -> {goal}: batch {result['final_cost']:.2f}, single {single.cost_history[-1]:.2f}")
+        assert np.allclose(result['path'], single.path), "Batch paths should match PathOptimizer!"
+        assert np.allclose(result['cost_history'], single.cost_history), "Cost histories should match!"
+    
+    print("\n✅ TEST PASSED: Batch optimizer matches PathOptimizer")
+
+
+def test_obstacle_set():
+    """Test that the array-backed obstacle store matches the obstacle dicts."""
+    print("\n" + "=" * 60)
+    print("TEST: Obstacle Set")
+    print("=" * 60)
+    
+    obstacles = [
+        {'center': [40, 10], 'radius': 10},
+        {'center': [70, -5], 'radius': 20}
+    ]
+    obstacle_set = ObstacleSet.from_dicts(obstacles, safety_margin=5.0)
+    
+    print(f"Obstacles stored: {len(obstacle_set)}")
+    assert obstacle_set.centers.shape == (2, 2), "Centers should be a (n_obstacles, 2) array!"
+    assert np.allclose(obstacle_set.inflated_sq, [225.0, 625.0]), "Inflated radii should be precomputed!"
+    
+    # Cost from the store should match a direct per-obstacle evaluation
+    points = np.array([[40.0, 0.0], [65.0, 0.0], [200.0, 0.0]])
+    expected = 0.0
+    for point in points:
+        for obstacle in obstacles:
+            violation = (obstacle['radius'] + 5.0) ** 2 - np.sum((point - obstacle['center']) ** 2)
+            expected += max(violation, 0.0) ** 2
+    
+    print(f"Store cost: {obstacle_set.cost(points):.2f}, expected: {expected:.2f}")
+    assert np.isclose(obstacle_set.cost(points), expected), "Obstacle cost should match!"
+    assert np.allclose(obstacle_set.gradient(points)[2], 0.0), "Point outside all zones has zero gradient!"
+    
+    print("\n✅ TEST PASSED: Obstacle set matches obstacle dicts")
+
+
+def test_spatial_index_matches_dense():
+    """Test that the uniform grid index gives the same penalties as the dense check."""
+    print("\n" + "=" * 60)
+    print("TEST: Spatial Index")
+    print("=" * 60)
+    
+    rng = np.random.default_rng(1)
+    centers = rng.uniform(0, 1000, (500, 2))
+    radii = rng.uniform(2, 25, 500)
+    points = rng.uniform(-50, 1050, (200, 2))
+    
+    dense = ObstacleSet(centers, radii, safety_margin=5.0, spatial_index='none')
+    indexed = ObstacleSet(centers, radii, safety_margin=5.0, spatial_index='grid')
+    
+    print(f"Grid cells occupied: {len(indexed.grid.cell_keys)}")
+    print(f"Dense cost: {dense.cost(points):.2f}, indexed cost: {indexed.cost(points):.2f}")
+    assert np.isclose(dense.cost(points), indexed.cost(points)), "Indexed cost should match dense cost!"
+    assert np.allclose(dense.gradient(points), indexed.gradient(points)), "Indexed gradient should match!"
+    
+    print("\n✅ TEST PASSED: Spatial index matches dense obstacle check")
+
+
+def test_incremental_obstacles():
+    """Test that adding, removing and moving obstacles in place matches a rebuilt set."""
+    print("\n" + "=" * 60)
+    print("TEST: Incremental Obstacle Updates")
+    print("=" * 60)
+    
+    rng = np.random.default_rng(2)
+    centers = rng.uniform(0, 1000, (300, 2))
+    radii = rng.uniform(5, 30, 300)
+    points = rng.uniform(-50, 1050, (500, 2))
+    
+    obstacle_set = ObstacleSet(centers, radii, safety_margin=5.0)
+    expected = {i: (centers[i], radii[i]) for i in range(300)}
+    for update in range(100):
+        ids = rng.choice(sorted(expected), 3, replace=False)
+        if update % 3 == 0:
+            new_centers, new_radii = rng.uniform(0, 1100, (3, 2)), rng.uniform(5, 30, 3)
+            for i, center, radius in zip(obstacle_set.add(new_centers, new_radii), new_centers, new_radii):
+                expected[int(i)] = (center, radius)
+        elif update % 3 == 1:
+            obstacle_set.remove(ids)
+            for i in ids:
+                del expected[int(i)]
+        else:
+            new_centers = rng.uniform(-100, 1100, (3, 2))
+            obstacle_set.move(ids, new_centers)
+            for i, center in zip(ids, new_centers):
+                expected[int(i)] = (center, expected[int(i)][1])
+    
+    rebuilt = ObstacleSet(
+        np.array([expected[i][0] for i in obstacle_set.ids]),
+        np.array([expected[i][1] for i in obstacle_set.ids]),
+        safety_margin=5.0, spatial_index='none'
+    )
+    print(f"Obstacles: {len(obstacle_set)}, indexed: {obstacle_set.grid is not None}")
+    assert sorted(obstacle_set.ids.tolist()) == sorted(expected), "Ids should survive updates!"
+    assert np.isclose(obstacle_set.cost(points), rebuilt.cost(points)), "Updated cost should match rebuilt set!"
+    assert np.allclose(obstacle_set.gradient(points), rebuilt.gradient(points)), "Updated gradient should match!"
+    
+    # Removing the obstacle in the last slot leaves nothing dirty, but its grid entries are stale
+    centers = np.column_stack([np.linspace(0, 990, 100), np.zeros(100)])
+    obstacle_set = ObstacleSet(centers, np.full(100, 5.0), safety_margin=5.0)
+    obstacle_set.remove([99])
+    assert obstacle_set.grid is not None and obstacle_set.cost(np.array([[990.0, 0.0]])) == 0.0, "Removed obstacle should be gone!"
+    assert obstacle_set.cost(np.array([[980.0, 0.0]])) > 0, "Remaining obstacles should still be found!"
+    
+    # A new obstacle on the path is avoided without restarting
+    optimizer = PathOptimizer(start=(0, 0), goal=(200, 0), obstacles=[], n_points=15)
+    optimizer.optimize(n_iterations=50)
+    [obstacle_id] = optimizer.add_obstacles([{'center': [100, 5], 'radius': 20}])
+    assert optimizer.cost_obstacle(optimizer.path) > 0, "New obstacle should be hit by the old path!"
+    optimizer.optimize(n_iterations=300)
+    assert optimizer.cost_obstacle(optimizer.path) < 1.0, "Path should move around the new obstacle!"
+    optimizer.move_obstacles([{'id': obstacle_id, 'center': [100, 500]}])
+    optimizer.remove_obstacles([obstacle_id])
+    assert len(optimizer.obstacle_set) == 0, "Obstacle should be removed!"
+    
+    # In 3D, buildings are moved with the same 2-coordinate centers they are added with
+    optimizer = PathOptimizer(start=(0, 0, 10), goal=(200, 0, 10), obstacles=[], n_points=15)
+    [building_id] = optimizer.add_obstacles([{'center': [100, 0], 'radius': 20, 'top': 30}])
+    assert optimizer.cost_obstacle(optimizer.path) > 0, "Building should be hit!"
+    optimizer.move_obstacles([{'id': building_id, 'center': [100, 300], 'top': 30}])
+    assert optimizer.cost_obstacle(optimizer.path) == 0, "Moved building should be out of the way!"
+    optimizer.move_obstacles([{'id': building_id, 'center': [100, 0], 'base': 20, 'top': 40, 'radius': 5}])
+    assert np.allclose(optimizer.obstacle_set.centers[0], [100, 0, 20]), "Base should set the center height!"
+    assert optimizer.obstacle_set.heights[0] == 20 and optimizer.obstacle_set.radii[0] == 5, "Extent should change!"
+    
+    print("\n✅ TEST PASSED: Incremental updates match a rebuilt obstacle set")
+
+
+def test_moving_obstacles():
+    """Test that waypoints are checked against obstacles where they are at arrival time."""
+    print("\n" + "=" * 60)
+    print("TEST: Moving Obstacles")
+    print("=" * 60)
+    
+    obstacles = [
+        {'center': [400, 0], 'velocity': [0, 30], 'radius': 40},
+        {'trajectory': [[0, 200, 600], [10, 200, 300], [20, 600, 300]], 'radius': 30},
+        {'center': [650, 320], 'radius': 20}
+    ]
+    optimizer = PathOptimizer(start=(50, 300), goal=(750, 300), obstacles=obstacles, n_points=30, duration=20.0)
+    assert len(optimizer.obstacle_set) == 1 and len(optimizer.moving_obstacles) == 2, "Moving obstacles split off!"
+    
+    centers = optimizer.moving_obstacles.positions(np.array([-5.0, 5.0, 10.0, 15.0, 30.0]))
+    assert np.allclose(centers[:, 0], [[400, -150], [400, 150], [400, 300], [400, 450], [400, 900]]), \
+        "Constant velocity obstacle should drift from its center!"
+    assert np.allclose(centers[:, 1], [[200, 600], [200, 450], [200, 300], [400, 300], [600, 300]]), \
+        "Trajectory obstacle should interpolate and hold its end keyframes!"
+    
+    rng = np.random.default_rng(3)
+    path = optimizer.path + rng.normal(0, 20, optimizer.path.shape)
+    pointwise = np.array([optimizer.gradient_total(path, i) for i in range(optimizer.n_points)])
+    assert np.allclose(optimizer.gradient_total_path(path), pointwise), "Vectorized gradient should match pointwise!"
+    
+    initial_obstacle_cost = optimizer.cost_obstacle(optimizer.path)
+    optimizer.optimize(n_iterations=3000, learning_rate=0.001, momentum=0.9)
+    final_obstacle_cost = optimizer.cost_obstacle(optimizer.path)
+    print(f"Obstacle cost: {initial_obstacle_cost:.1f} -> {final_obstacle_cost:.4f}")
+    assert initial_obstacle_cost > 0, "Straight path should meet the moving obstacles!"
+    assert final_obstacle_cost < 1.0, "Optimized path should dodge the moving obstacles!"
+    
+    try:
+        PathOptimizer(start=(50, 300), goal=(750, 300), obstacles=obstacles)
+        assert False, "Moving obstacles without duration should be rejected!"
+    except ValueError:
+        pass
+    
+    print("\n✅ TEST PASSED: Moving obstacles are avoided at arrival time")
+
+
+def test_3d_paths():
+    """Test 3D paths with spheres, building cylinders and altitude limits."""
+    print("\n" + "=" * 60)
+    print("TEST: 3D Paths")
+    print("=" * 60)
+    
+    obstacles = [
+        {'center': [400, 300, 50], 'radius': 40},
+        {'center': [250, 320], 'radius': 30, 'top': 120},
+        {'center': [550, 280], 'radius': 30, 'base': 20, 'top': 200}
+    ]
+    optimizer = PathOptimizer(
+        start=(50, 300, 60), goal=(750, 300, 60), obstacles=obstacles, n_points=30, altitude_limits=(30, 150)
+    )
+    assert optimizer.path.shape == (30, 3), "Path should be 3D!"
+    assert np.allclose(optimizer.obstacle_set.heights, [0, 120, 180]), "Cylinders should span base to top!"
+    
+    rng = np.random.default_rng(4)
+    path = optimizer.path + rng.normal(0, 20, optimizer.path.shape)
+    path[5, 2] = 10.0  # below z_min
+    vectorized = optimizer.gradient_total_path(path)
+    pointwise = np.array([optimizer.gradient_total(path, i) for i in range(optimizer.n_points)])
+    assert np.allclose(vectorized, pointwise), "Vectorized 3D gradient should match pointwise!"
+    
+    # Central differences of total_cost
+    eps = 1e-4
+    numeric = np.zeros_like(path)
+    for i in range(1, optimizer.n_points - 1):
+        for axis in range(3):
+            step = np.zeros_like(path)
+            step[i, axis] = eps
+            numeric[i, axis] = (optimizer.total_cost(path + step) - optimizer.total_cost(path - step)) / (2 * eps)
+    error = np.max(np.abs(numeric[1:-1] - vectorized[1:-1])) / np.max(np.abs(vectorized[1:-1]))
+    print(f"Relative gradient error: {error:.2e}")
+    assert error < 1e-6, "3D gradient should match finite differences!"
+    
+    optimizer.optimize(n_iterations=3000, learning_rate=0.001, momentum=0.9)
+    print(f"Obstacle cost: {optimizer.cost_obstacle(optimizer.path):.4f}, "
+          f"altitude cost: {optimizer.cost_altitude(optimizer.path):.4f}")
+    assert optimizer.cost_obstacle(optimizer.path) < 10.0, "3D path should clear the obstacles!"
+    assert optimizer.cost_altitude(optimizer.path) < 1.0, "3D path should respect the altitude limits!"
+    
+    try:
+        PathOptimizer(start=(0, 0), goal=(10, 10, 10), obstacles=[])
+        assert False, "Mixed dimensions should be rejected!"
+    except ValueError:
+        pass
+    
+    print("\n✅ TEST PASSED: 3D paths avoid spheres and buildings within altitude limits")
+
+
+def test_segment_obstacles():
+    """Test the segment obstacle model and per-segment path validation."""
+    print("\n" + "=" * 60)
+    print("TEST: Segment Obstacles")
+    print("=" * 60)
+    
+    # A small obstacle between two waypoints of a coarse path
+    obstacles = [{'center': [37.5, 2], 'radius': 4}]
+    waypoints = PathOptimizer((0, 0), (100, 0), obstacles, n_points=5, safety_margin=1.0)
+    segments = PathOptimizer((0, 0), (100, 0), obstacles, n_points=5, safety_margin=1.0,
+                             obstacle_model='segments')
+    print(f"Waypoint cost: {waypoints.cost_obstacle(waypoints.path):.2f}, "
+          f"segment cost: {segments.cost_obstacle(segments.path):.2f}")
+    assert waypoints.cost_obstacle(waypoints.path) == 0, "Waypoints should miss the obstacle!"
+    assert segments.cost_obstacle(segments.path) > 0, "Segments should hit the obstacle!"
+    
+    report = segments.validate_path()
+    assert not report['collision_free'], "Straight path should collide!"
+    assert np.isclose(report['clearance'][1], -2.0), "Segment 1 should pass 2 inside the obstacle!"
+    assert report['nearest'] == [0, 0, 0, 0], "Only one obstacle to be nearest!"
+    
+    # Vectorized gradient matches pointwise and finite differences, 2D and 3D
+    rng = np.random.default_rng(5)
+    for start, goal, obstacle_list in [
+        ((0, 0), (100, 0), [{'center': [37.5, 2], 'radius': 4}, {'center': [60, -3], 'radius': 6}]),
+        ((0, 0, 10), (100, 0, 10), [{'center': [37.5, 2], 'radius': 4, 'top': 8},
+                                    {'center': [60, -3, 12], 'radius': 6}])
+    ]:
+        optimizer = PathOptimizer(start, goal, obstacle_list, n_points=6, safety_margin=1.0,
+                                  obstacle_model='segments')
+        path = optimizer.path + rng.normal(0, 2, optimizer.path.shape)
+        vectorized = optimizer.gradient_total_path(path)
+        pointwise = np.array([optimizer.gradient_total(path, i) for i in range(optimizer.n_points)])
+        assert np.allclose(vectorized, pointwise), "Vectorized segment gradient should match pointwise!"
+        
+        eps = 1e-5
+        numeric = np.zeros_like(path)
+        for i in range(1, optimizer.n_points - 1):
+            for axis in range(len(start)):
+                step = np.zeros_like(path)
+                step[i, axis] = eps
+                numeric[i, axis] = (optimizer.total_cost(path + step) - optimizer.total_cost(path - step)) / (2 * eps)
+        error = np.max(np.abs(numeric[1:-1] - vectorized[1:-1])) / np.max(np.abs(vectorized[1:-1]))
+        print(f"{len(start)}D relative gradient error: {error:.2e}")
+        assert error < 1e-5, "Segment gradient should match finite differences!"
+    
+    # Optimizing against segments clears the obstacle between waypoints
+    segments.optimize(n_iterations=2000, learning_rate=0.001, momentum=0.9)
+    report = segments.validate_path()
+    print(f"Minimum clearance after optimization: {report['min_clearance']:.2f}")
+    assert report['collision_free'], "Optimized segments should clear the obstacle!"
+    
+    empty = PathOptimizer((0, 0), (100, 0), [], n_points=5).validate_path()
+    assert empty['min_clearance'] is None and empty['collision_free'], "No obstacles means no collision!"
+    
+    # Grid-backed segment contacts match testing every pair, also in small chunks and after updates
+    rng = np.random.default_rng(6)
+    for dim in (2, 3):
+        centers = rng.uniform(0, 300, (2000, dim))
+        radii = rng.uniform(1, 5, 2000)
+        heights = rng.uniform(0, 50, 2000) if dim == 3 else None
+        dense = ObstacleSet(centers, radii, safety_margin=5.0, spatial_index='none', heights=heights)
+        indexed = ObstacleSet(centers, radii, safety_margin=5.0, spatial_index='grid', heights=heights)
+        path = np.cumsum(rng.uniform(-3, 6, (200, dim)), axis=0)
+        for step in range(2):
+            for max_pairs in (obstacles_module.MAX_SEGMENT_PAIRS, 500):
+                saved, obstacles_module.MAX_SEGMENT_PAIRS = obstacles_module.MAX_SEGMENT_PAIRS, max_pairs
+                try:
+                    assert np.isclose(indexed.segment_cost(path), dense.segment_cost(path)), \
+                        "Grid segment cost should match dense!"
+                    assert np.allclose(indexed.segment_gradient(path), dense.segment_gradient(path)), \
+                        "Grid segment gradient should match dense!"
+                    assert np.allclose(indexed.segment_clearance(path)[0], dense.segment_clearance(path)[0]), \
+                        "Chunked segment clearance should match!"
+                finally:
+                    obstacles_module.MAX_SEGMENT_PAIRS = saved
+            ids = indexed.ids[:50]
+            moved = rng.uniform(0, 300, (50, dim))
+            for obstacle_set in (dense, indexed):
+                obstacle_set.remove(indexed.ids[-20:])
+                obstacle_set.move(ids, moved)
+    print(f"Grid segment cost matches dense on {len(dense)} obstacles")
+    
+    print("\n✅ TEST PASSED: Segment penalty catches obstacles between waypoints")
+
+
+def test_polygon_obstacles():
+    """Test polygon obstacles through the signed distance field."""
+    print("\n" + "=" * 60)
+    print("TEST: Polygon Obstacles")
+    print("=" * 60)
+    
+    square = {'polygon': [[100, 100], [200, 100], [200, 200], [100, 200]]}
+    field = DistanceField.from_dicts([square, {'center': [400, 150], 'radius': 30}], cell_size=1.0, padding=25)
+    points = np.array([[90, 150], [150, 215], [120, 130], [450, 150], [1000, 1000]])
+    distance, gradient = field.sample(points)
+    print(f"Sampled distances: {np.round(distance, 3)}")
+    assert np.allclose(distance[:4], [10, 15, -20, 20], atol=1e-6), "Field should hold signed distances!"
+    assert np.allclose(gradient[:4], [[-1, 0], [0, 1], [-1, 0], [1, 0]], atol=0.02), "Gradient should point away!"
+    assert np.isinf(distance[4]) and not gradient[4].any(), "Points outside the grid should be free!"
+    
+    # Vectorized gradient matches pointwise and finite differences for both obstacle models
+    triangle = {'polygon': [[340, 260], [460, 260], [400, 450]]}
+    rng = np.random.default_rng(6)
+    for obstacle_model in ('waypoints', 'segments'):
+        optimizer = PathOptimizer((50, 300), (750, 300), [triangle, {'center': [600, 310], 'radius': 20}],
+                                  n_points=20, safety_margin=10.0, obstacle_model=obstacle_model)
+        path = optimizer.path + rng.normal(0, 5, optimizer.path.shape)
+        vectorized = optimizer.gradient_total_path(path)
+        pointwise = np.array([optimizer.gradient_total(path, i) for i in range(optimizer.n_points)])
+        assert np.allclose(vectorized, pointwise), "Vectorized field gradient should match pointwise!"
+        
+        eps = 1e-6
+        numeric = np.zeros_like(path)
+        for i in range(1, optimizer.n_points - 1):
+            for axis in range(2):
+                step = np.zeros_like(path)
+                step[i, axis] = eps
+                numeric[i, axis] = (optimizer.total_cost(path + step) - optimizer.total_cost(path - step)) / (2 * eps)
+        error = np.max(np.abs(numeric[1:-1] - vectorized[1:-1])) / np.max(np.abs(vectorized[1:-1]))
+        print(f"{obstacle_model}: relative gradient error {error:.2e}")
+        assert error < 1e-4, "Field gradient should match finite differences!"
+        
+        optimizer.optimize(n_iterations=1500, learning_rate=0.001, momentum=0.9)
+        report = optimizer.validate_path()
+        print(f"{obstacle_model}: minimum clearance {report['min_clearance']:.2f}")
+        assert optimizer.cost_obstacle(optimizer.path) < 1.0, "Path should leave the polygon's margin!"
+    
+    # Waypoints alone may straddle a corner, segments keep the whole path out
+    assert report['collision_free'] and report['min_clearance'] > 9.5, "Segments should clear the polygon!"
+    
+    try:
+        optimizer.add_obstacles([square])
+        assert False, "Polygons cannot be added in place!"
+    except ValueError:
+        pass
+    
+    print("\n✅ TEST PASSED: Polygons are avoided through the distance field")
+
+
+def test_early_stopping():
+    """Test that optimize stops once the cost has converged."""
+    print("\n" + "=" * 60)
+    print("TEST: Early Stopping")
+    print("=" * 60)
+    
+    optimizer = PathOptimizer(
+        start=(0, 0),
+        goal=(100, 0),
+        obstacles=[],
+        n_points=12,
+        safety_margin=5.0
+    )
+    
+    # Bent path with nothing in the way settles back towards a straight line
+    optimizer.path[1:-1, 1] += 10 * np.sin(np.linspace(0, np.pi, 10))
+    results = optimizer.optimize(n_iterations=2000, learning_rate=0.001, cost_tolerance=1e-6)
+    
+    print(f"Stopped after {optimizer.iterations} iterations: {optimizer.stop_reason}")
+    assert optimizer.stop_reason == 'cost_tolerance', "Should stop on the cost tolerance!"
+    assert optimizer.iterations < 2000, "Should stop before the iteration limit!"
+    assert len(results) == optimizer.iterations + 1, "Should return one frame per iteration run!"
+    assert results[-1]['stop_reason'] == 'cost_tolerance', "Last frame should carry the stop reason!"
+    
+    optimizer = PathOptimizer((0, 0), (100, 0), [], n_points=12)
+    optimizer.optimize(n_iterations=10)
+    assert optimizer.stop_reason == 'max_iterations', "Without criteria the full run should complete!"
+    
+    print("\n✅ TEST PASSED: Optimization stops on convergence")
+
+
+def test_step_rules():
+    """Test that every step rule reduces the cost."""
+    print("\n" + "=" * 60)
+    print("TEST: Step Rules")
+    print("=" * 60)
+    
+    obstacles = [{'center': [400, 300], 'radius': 50}]
+    learning_rates = {'momentum': 0.001, 'nesterov': 0.001, 'adam': 1.0, 'lbfgs': 1.0, 'banded_newton': 1.0}
+    
+    final_costs = {}
+    for rule in STEP_RULES:
+        optimizer = PathOptimizer(
+            start=(50, 300),
+            goal=(750, 300),
+            obstacles=obstacles,
+            n_points=15,
+            safety_margin=10.0,
+            step_rule=rule
+        )
+        results = optimizer.optimize(n_iterations=100, learning_rate=learning_rates[rule])
+        final_costs[rule] = results[-1]['cost']
+        print(f"{rule:>9}: {results[0]['cost']:.2f} -> {results[-1]['cost']:.2f}")
+        assert results[-1]['cost'] < results[0]['cost'], f"{rule} should reduce the cost!"
+    
+    assert final_costs['lbfgs'] <= final_costs['momentum'], "L-BFGS should do at least as well as momentum!"
+    
+    print("\n✅ TEST PASSED: All step rules reduce the cost")
+
+
+def test_banded_newton():
+    """Test that the banded Newton step solves the quadratic terms exactly."""
+    print("\n" + "=" * 60)
+    print("TEST: Banded Newton Step")
+    print("=" * 60)
+    
+    optimizer = PathOptimizer(
+        start=(0, 0),
+        goal=(100, 0),
+        obstacles=[],
+        n_points=200,
+        step_rule='banded_newton'
+    )
+    straight_cost = optimizer.total_cost(optimizer.path)
+    
+    # Without obstacles one step should take a bent path straight back
+    optimizer.path[1:-1, 1] += 10 * np.sin(np.linspace(0, np.pi, 198))
+    results = optimizer.optimize(n_iterations=1)
+    
+    print(f"Bent cost: {results[0]['cost']:.4f}, after one step: {results[1]['cost']:.4f}")
+    assert np.isclose(results[1]['cost'], straight_cost), "One Newton step should reach the optimum!"
+    
+    # With an obstacle a handful of steps should beat 500 momentum iterations
+    obstacles = [{'center': [400, 300], 'radius': 50}, {'center': [250, 260], 'radius': 30}]
+    newton = PathOptimizer((50, 300), (750, 300), obstacles, n_points=100, safety_margin=10.0,
+                           step_rule='banded_newton')
+    momentum = PathOptimizer((50, 300), (750, 300), obstacles, n_points=100, safety_margin=10.0)
+    newton_cost = newton.optimize(n_iterations=20)[-1]['cost']
+    momentum_cost = momentum.optimize(n_iterations=500)[-1]['cost']
+    
+    print(f"Newton (20 iterations): {newton_cost:.2f}, momentum (500 iterations): {momentum_cost:.2f}")
+    assert newton_cost < momentum_cost, "Banded Newton should converge in far fewer iterations!"
+    
+    print("\n✅ TEST PASSED: Banded Newton step converges quickly")
+
+
+def test_multires():
+    """Test coarse-to-fine optimization and path upsampling."""
+    print("\n" + "=" * 60)
+    print("TEST: Multi-Resolution Optimization")
+    print("=" * 60)
+    
+    print(f"Levels for 101 points: {resolution_levels(101, 4)}")
+    assert resolution_levels(101, 4) == [13, 26, 51, 101], "Each level should halve the segments!"
+    
+    # Upsampling keeps the coarse waypoints and the endpoints
+    coarse = np.array([[0.0, 0.0], [10.0, 5.0], [20.0, 0.0]])
+    for interpolation in ('linear', 'spline'):
+        fine = upsample_path(coarse, 5, interpolation)
+        assert np.allclose(fine[::2], coarse), f"{interpolation} upsampling should keep coarse waypoints!"
+    
+    # Off-centre so no coarse waypoint lands exactly on an obstacle centre, where the gradient has no sideways part
+    obstacles = [{'center': [400, 310], 'radius': 50}, {'center': [250, 260], 'radius': 30}]
+    multires = PathOptimizer((50, 300), (750, 300), obstacles, n_points=101, safety_margin=10.0)
+    multires_results = multires.optimize_multires(n_iterations=300, levels=4)
+    levels = [frame['level'] for frame in multires_results]
+    fine_iterations = levels.count(3)
+    print(f"Iterations per level: {[levels.count(level) for level in range(4)]}")
+    assert levels.count(0) == 301 and fine_iterations == 300 >> 3, "Finer levels should get fewer iterations!"
+    
+    # The finest level runs 37 iterations; plain runs get as many, and eight times as many
+    for n_iterations in (fine_iterations, 300):
+        plain = PathOptimizer((50, 300), (750, 300), obstacles, n_points=101, safety_margin=10.0)
+        plain_results = plain.optimize(n_iterations=n_iterations)
+        print(f"Plain ({n_iterations} iterations): {plain_results[-1]['cost']:.2f}, "
+              f"multi-resolution: {multires_results[-1]['cost']:.2f}")
+        assert multires_results[-1]['cost'] < plain_results[-1]['cost'], "Coarse-to-fine should reach a lower cost!"
+    assert len(multires_results[-1]['path']) == 101, "Final level should have n_points waypoints!"
+    assert len(multires.get_cost_history()) == multires.iterations + 1, "Cost history should cover all levels!"
+    
+    # Coarse levels run a copy of the configured step rule, settings included
+    seen = []
+    
+    class RecordingAdam(AdamStep):
+        def step(self, optimizer, learning_rate, momentum):
+            seen.append((optimizer.n_points, self.beta2))
+            return super().step(optimizer, learning_rate, momentum)
+    
+    configured = PathOptimizer((50, 300), (750, 300), obstacles, n_points=101, safety_margin=10.0,
+                               step_rule=RecordingAdam(beta2=0.5))
+    configured.optimize_multires(n_iterations=8, learning_rate=1.0, levels=3)
+    assert {n_points for n_points, _ in seen} == {26, 51, 101}, "Every level should step with the rule!"
+    assert all(beta2 == 0.5 for _, beta2 in seen), "Coarse levels should keep the rule's settings!"
+    
+    print("\n✅ TEST PASSED: Multi-resolution optimization works")
+
+
 def visualize_path(optimizer):
     """Print a simple ASCII visualization of the path."""
     print("\n" + "=" * 60)
@@ -192,13 +761,98 @@ def visualize_path(optimizer):
     print(f"  Y range: [{min(y_coords):.1f}, {max(y_coords):.1f}]")
 
 
+def test_benchmark_suite():
+    """Test that the benchmark suite times the core functions and flags slowdowns."""
+    print("\n" + "=" * 60)
+    print("TEST: Benchmark Suite")
+    print("=" * 60)
+    
+    results = run_benchmarks(quick=True, endpoints=False, only='n_points=10]', repeat=2, min_time=0.0)
+    names = {entry['name'] for entry in results['results']}
+    print(f"Benchmarks run: {[entry['key'] for entry in results['results']]}")
+    assert names == {'total_cost', 'gradient_total', 'optimize_step', 'evaluate_batch'}, \
+        "Should time every core function!"
+    assert all(entry['min'] > 0 and entry['calls'] >= 1 for entry in results['results']), "Timings should be set!"
+    json.dumps(results)
+    
+    # A baseline twice as fast as this run is a regression, one twice as slow is not
+    faster = {'results': [dict(entry, min=entry['min'] / 2) for entry in results['results']]}
+    slower = {'results': [dict(entry, min=entry['min'] * 2) for entry in results['results']]}
+    assert all(entry['regression'] for entry in compare(results, faster, tolerance=0.2)), "Should flag slowdowns!"
+    assert not any(entry['regression'] for entry in compare(results, slower, tolerance=0.2)), "Speedups are fine!"
+    
+    print("\n✅ TEST PASSED: Benchmarks produce JSON and compare against a baseline")
+
+
+def test_cost_evaluator():
+    """Test that the standalone evaluator matches PathOptimizer costs, one path or many."""
+    print("\n" + "=" * 60)
+    print("TEST: Cost Evaluator")
+    print("=" * 60)
+    
+    rng = np.random.default_rng(8)
+    obstacles = [{'center': [float(x), float(y)], 'radius': 20.0}
+                 for x, y in rng.uniform([150, 150], [650, 450], (60, 2))]
+    obstacles += [{'polygon': [[340, 260], [460, 260], [400, 350]]},
+                  {'center': [100, 300], 'velocity': [20, 0], 'radius': 25}]
+    weights = {'length': 2.0, 'smoothness': 30.0, 'obstacle': 500.0}
+    
+    for obstacle_model in ('waypoints', 'segments'):
+        evaluator = CostEvaluator(obstacles, 5.0, weights, obstacle_model=obstacle_model, duration=20.0)
+        optimizer = PathOptimizer((50, 300), (750, 300), obstacles, n_points=25, weights=weights,
+                                  obstacle_model=obstacle_model, duration=20.0,
+                                  distance_field=evaluator.distance_field)
+        paths = optimizer.path[None] + rng.normal(0, 30, (40, 25, 2))
+        paths[:, [0, -1]] = optimizer.path[[0, -1]]
+        
+        costs = evaluator.evaluate_batch(paths)
+        expected = np.array([[optimizer.total_cost(path), optimizer.cost_obstacle(path)] for path in paths])
+        print(f"{obstacle_model}: {np.count_nonzero(costs['obstacle_cost'])} of 40 paths touch obstacles")
+        assert np.allclose(costs['total_cost'], expected[:, 0], rtol=1e-12), "Totals should match total_cost!"
+        assert np.allclose(costs['obstacle_cost'], expected[:, 1], rtol=1e-12), "Obstacle terms should match!"
+        
+        single = evaluator.evaluate(paths[3])
+        assert np.isclose(single['total_cost'], expected[3, 0], rtol=1e-12), "A single path should match too!"
+        assert np.isclose(single['length_cost'], optimizer.cost_length(paths[3])), "Length term should match!"
+    
+    # Paths of different lengths are grouped, and results keep the input order
+    ragged = evaluator.evaluate_batch([paths[0], paths[1][::2], paths[2]])
+    assert np.isclose(ragged['total_cost'][1], evaluator.evaluate(paths[1][::2])['total_cost']), "Wrong order!"
+    assert np.isclose(ragged['total_cost'][2], costs['total_cost'][2]), "Wrong order!"
+    
+    # 3D paths with altitude limits
+    evaluator = CostEvaluator([{'center': [400, 300, 50], 'radius': 40}], dim=3, altitude_limits=(20, 80))
+    optimizer = PathOptimizer((50, 300, 50), (750, 300, 50), [{'center': [400, 300, 50], 'radius': 40}],
+                              n_points=15, altitude_limits=(20, 80))
+    path = optimizer.path + rng.normal(0, 40, optimizer.path.shape)
+    assert np.isclose(evaluator.evaluate(path)['total_cost'], optimizer.total_cost(path)), "3D costs should match!"
+    assert evaluator.evaluate(path)['altitude_cost'] > 0, "Altitude violations should be penalized!"
+    
+    print("\n✅ TEST PASSED: Cost evaluator matches PathOptimizer in one pass")
+
+
 if __name__ == '__main__':
     print("\n" + "🧪 RUNNING PATH OPTIMIZER TESTS" + "\n")
     
     try:
         # Run all tests
         test_gradient_calculations()
+        test_vectorized_gradient_matches_pointwise()
+        test_batch_matches_single()
         test_cost_components()
+        test_obstacle_set()
+        test_spatial_index_matches_dense()
+        test_incremental_obstacles()
+        test_moving_obstacles()
+        test_3d_paths()
+        test_segment_obstacles()
+        test_polygon_obstacles()
+        test_early_stopping()
+        test_step_rules()
+        test_banded_newton()
+        test_multires()
+        test_benchmark_suite()
+        test_cost_evaluator()
         optimizer = test_basic_optimization()
         test_obstacle_avoidance()
         visualize_path(optimizer)
@@ -0,0 +1,809 @@
+"""
+Test script for the Flask API
+Exercises the endpoints through the Flask test client
+"""
+
+import sys
+import os
+import json
+import base64
+import threading
+import time
+
+import numpy as np
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import tempfile
+
+import server
+from server import app
+from result_cache import ResultCache, problem_key
+from warm_start import WarmStartStore, workspace_key
+from sessions import SessionStore
+from map_store import MapStore
+from binary_codec import BINARY_MIMETYPE, decode_binary, encode_binary
+from optimizer import PathOptimizer
+from worker_pool import OptimizationPool, PoolFullError, JobTimeoutError, optimize_job
+
+
+def test_optimize_batch():
+    """Test that the batch endpoint solves every problem."""
+    print("=" * 60)
+    print("TEST: Batch Optimization Endpoint")
+    print("=" * 60)
+
+    client = app.test_client()
+    response = client.post('/api/optimize_batch', json={
+        'problems': [
+            {'start': [50, 300], 'goal': [750, 300]},
+            {'start': [50, 100], 'goal': [750, 500]}
+        ],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 15,
+        'safety_margin': 10.0,
+        'n_iterations': 100
+    })
+
+    assert response.status_code == 200, f"Unexpected status {response.status_code}"
+    results = response.get_json()['results']
+    print(f"Problems solved: {len(results)}")
+
+    assert len(results) == 2, "Should return one result per problem!"
+    for result in results:
+        assert len(result['path']) == 15, "Each path should have n_points waypoints!"
+        assert len(result['cost_history']) == 101, "Cost history should include the initial cost!"
+        assert result['final_cost'] < result['initial_cost'], "Cost should decrease for every problem!"
+
+    print("\n✅ TEST PASSED: Batch endpoint optimized all problems")
+
+
+def test_optimize_on_worker_pool():
+    """Test that /api/optimize runs on worker processes and rejects jobs when full."""
+    print("\n" + "=" * 60)
+    print("TEST: Worker Pool")
+    print("=" * 60)
+
+    client = app.test_client()
+    payload = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 10,
+        'n_iterations': 20
+    }
+
+    original_pool, original_cache = server.pool, server.cache
+    server.pool = OptimizationPool(max_workers=1, max_pending=1, job_timeout=60)
+    server.cache = ResultCache(max_entries=0)
+    try:
+        response = client.post('/api/optimize', json=payload)
+        assert response.status_code == 200, f"Unexpected status {response.status_code}"
+        assert len(response.get_json()['results']) == 21, "Should return every iteration!"
+        print("Optimization on worker process: OK")
+
+        # Hold the only slot with a long job, the next request must be rejected
+        future = server.pool.submit(optimize_job, (0, 0), (100, 0), [], 200, 5.0, None, 3000, 0.001, 0.9)
+        response = client.post('/api/optimize', json=payload)
+        print(f"Status with full queue: {response.status_code}")
+        assert response.status_code == 503, "Full queue should answer 503!"
+        assert response.headers.get('Retry-After'), "Full queue should send Retry-After!"
+        future.result()
+
+        # A timed-out job stops at its deadline and frees its worker
+        started = time.perf_counter()
+        try:
+            server.pool.run(optimize_job, (0, 0), (100, 0), [], 200, 5.0, None, 10 ** 7, 0.001, 0.9, timeout=0.5)
+            assert False, "Job should time out!"
+        except JobTimeoutError:
+            pass
+        while server.pool.pending and time.perf_counter() - started < 10:
+            time.sleep(0.05)
+        print(f"Worker freed {time.perf_counter() - started:.2f}s after submitting a timed-out job")
+        assert server.pool.pending == 0, "Timed-out jobs should stop running!"
+    finally:
+        server.pool.shutdown()
+        server.pool, server.cache = original_pool, original_cache
+
+    # Concurrent first jobs share one executor
+    pool = OptimizationPool(max_workers=1)
+    executors = []
+    threads = [threading.Thread(target=lambda: executors.append(pool._get_executor())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(executor) for executor in executors}) == 1, "Only one executor should be created!"
+    pool.shutdown()
+
+    # Inline pools enforce the same bound
+    inline = OptimizationPool(max_workers=0, max_pending=0)
+    try:
+        inline.run(optimize_job, (0, 0), (100, 0), [], 10, 5.0, None, 1, 0.001, 0.9)
+        assert False, "Inline pool with no slots should reject jobs!"
+    except PoolFullError:
+        pass
+    inline = OptimizationPool(max_workers=0, job_timeout=0.2)
+    try:
+        inline.run(optimize_job, (0, 0), (100, 0), [], 200, 5.0, None, 10 ** 7, 0.001, 0.9)
+        assert False, "Inline jobs should stop at their deadline too!"
+    except JobTimeoutError:
+        pass
+
+    print("\n✅ TEST PASSED: Worker pool runs jobs and applies backpressure")
+
+
+def test_optimize_stream():
+    """Test that the streaming endpoint sends one NDJSON line per iteration."""
+    print("\n" + "=" * 60)
+    print("TEST: Streaming Optimization Endpoint")
+    print("=" * 60)
+
+    client = app.test_client()
+    response = client.post('/api/optimize_stream', json={
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 10,
+        'n_iterations': 30
+    })
+
+    assert response.status_code == 200, f"Unexpected status {response.status_code}"
+    assert response.mimetype == 'application/x-ndjson', "Stream should be NDJSON!"
+
+    frames = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    print(f"Frames streamed: {len(frames)}")
+    assert [frame['iteration'] for frame in frames] == list(range(31)), "Should stream every iteration in order!"
+    assert frames[-1]['cost'] < frames[0]['cost'], "Cost should decrease over the stream!"
+
+    response = client.post('/api/optimize_stream', json={'start': [0, 0]})
+    assert response.status_code == 400, "Invalid input should fail before streaming!"
+
+    # Streams count against the pool's queue limit and stop at the job timeout
+    original_pool = server.pool
+    server.pool = OptimizationPool(max_workers=0, max_pending=1, job_timeout=0.3)
+    try:
+        problem = {'start': [0, 0], 'goal': [100, 0], 'obstacles': [], 'n_points': 200, 'n_iterations': 10 ** 7}
+        held = client.post('/api/optimize_stream', json=problem, buffered=False)
+        assert server.pool.pending == 1, "An open stream should hold a job slot!"
+        assert client.post('/api/optimize_stream', json=problem).status_code == 503, "Full queue should answer 503!"
+        lines = held.get_data(as_text=True).splitlines()
+        held.close()
+        assert 'error' in json.loads(lines[-1]), "A stream past its deadline should end with an error!"
+        assert server.pool.pending == 0, "A finished stream should free its slot!"
+    finally:
+        server.pool = original_pool
+
+    print("\n✅ TEST PASSED: Streaming endpoint sent every frame")
+
+
+def test_frame_options():
+    """Test frame decimation and delta encoding on /api/optimize."""
+    print("\n" + "=" * 60)
+    print("TEST: Frame Decimation and Delta Encoding")
+    print("=" * 60)
+
+    client = app.test_client()
+    payload = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 12,
+        'n_iterations': 45
+    }
+
+    full = client.post('/api/optimize', json=payload).get_json()
+    strided = client.post('/api/optimize', json=dict(payload, frame_stride=10)).get_json()
+    delta = client.post('/api/optimize', json=dict(payload, frame_encoding='delta')).get_json()
+
+    iterations = [frame['iteration'] for frame in strided['results']]
+    print(f"Iterations kept with stride 10: {iterations}")
+    assert iterations == [0, 10, 20, 30, 40, 45], "Should keep every 10th frame plus the last!"
+    assert strided['cost_history'] == full['cost_history'], "Cost history should stay complete!"
+
+    # Only the kept frames are converted to lists
+    profiled = client.post('/api/optimize', json=dict(payload, frame_stride=10, profile=True)).get_json()
+    conversions = profiled['profile']['timers']['tolist']['calls']
+    print(f"tolist() calls with stride 10: {conversions}")
+    assert conversions == len(profiled['results']), "Dropped frames should never be converted!"
+
+    # Rebuild every path from the float32 deltas
+    path = np.array(delta['results'][0]['path'])
+    for frame, expected in zip(delta['results'][1:], full['results'][1:]):
+        step = np.frombuffer(base64.b64decode(frame['delta']), dtype='<f4').reshape(-1, 2)
+        path = path + step
+        assert np.allclose(path, expected['path'], atol=1e-3), "Reconstructed path should match!"
+    print(f"Max reconstruction error: {np.max(np.abs(path - np.array(full['results'][-1]['path']))):.2e}")
+
+    # A new multires level restarts the deltas with a full path
+    levels = client.post('/api/optimize', json=dict(payload, frame_encoding='delta', multires_levels=2)).get_json()
+    full_frames = [len(frame['path']) for frame in levels['results'] if 'path' in frame]
+    assert full_frames == [6, 12], "Each level should start with a full path!"
+
+    response = client.post('/api/optimize', json=dict(payload, frame_stride=0))
+    assert response.status_code == 400, "Invalid frame_stride should be rejected!"
+
+    print("\n✅ TEST PASSED: Frame options reduce the history without losing costs")
+
+
+def test_result_cache():
+    """Test that repeated /api/optimize problems are served from the cache."""
+    print("\n" + "=" * 60)
+    print("TEST: Result Cache")
+    print("=" * 60)
+
+    # Equivalent problems hash to the same key
+    assert problem_key({'start': (0, 0), 'n_points': 20}) == problem_key({'n_points': 20.0, 'start': [0.0, 0.0]}), \
+        "Key should not depend on number types or key order!"
+
+    client = app.test_client()
+    payload = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 10,
+        'n_iterations': 20
+    }
+
+    original_cache = server.cache
+    with tempfile.TemporaryDirectory() as directory:
+        server.cache = ResultCache(max_entries=1, ttl=60, directory=directory)
+        try:
+            first = client.post('/api/optimize', json=payload)
+            second = client.post('/api/optimize', json=dict(payload, weights={'length': 1}))
+            print(f"First request: {first.headers['X-Cache']}, second: {second.headers['X-Cache']}")
+            assert first.headers['X-Cache'] == 'MISS', "First request should miss!"
+            assert second.headers['X-Cache'] == 'HIT', "Same problem with default weights spelled out should hit!"
+            assert first.get_json() == second.get_json(), "Cached result should be identical!"
+
+            # Evicted from memory by another problem, still found on disk
+            client.post('/api/optimize', json=dict(payload, n_points=11))
+            third = client.post('/api/optimize', json=payload)
+            assert third.headers['X-Cache'] == 'HIT', "On-disk store should serve evicted entries!"
+
+            stats = client.get('/api/cache').get_json()
+            print(f"Cache stats: {stats}")
+            assert stats['hits'] == 2 and stats['misses'] == 2, "Counters should track hits and misses!"
+            assert stats['evictions'] >= 1, "Bounded cache should evict!"
+        finally:
+            server.cache = original_cache
+
+    print("\n✅ TEST PASSED: Result cache answers repeated problems")
+
+
+def test_warm_start():
+    """Test that replanning a nearby problem starts from the previous solution."""
+    print("\n" + "=" * 60)
+    print("TEST: Warm Start")
+    print("=" * 60)
+
+    client = app.test_client()
+    payload = {
+        'obstacles': [{'center': [400, 320], 'radius': 50}],
+        'n_points': 20,
+        'n_iterations': 2000,
+        'step_rule': 'lbfgs',
+        'cost_tolerance': 1e-4
+    }
+
+    original_cache, original_store = server.cache, server.warm_starts
+    server.cache = ResultCache(max_entries=0)
+    server.warm_starts = WarmStartStore()
+    try:
+        first = client.post('/api/optimize', json=dict(payload, start=[50, 300], goal=[750, 300], warm_start=True))
+        assert not first.get_json()['warm_started'], "Nothing solved yet to warm-start from!"
+
+        moved = dict(payload, start=[55, 305], goal=[745, 298])
+        cold = client.post('/api/optimize', json=moved).get_json()
+        warm = client.post('/api/optimize', json=dict(moved, warm_start=True)).get_json()
+        print(f"Cold start: {cold['iterations']} iterations, warm start: {warm['iterations']} iterations")
+        assert warm['warm_started'], "Nearby problem should be warm-started!"
+        assert warm['iterations'] < cold['iterations'] / 2, "Warm start should converge much faster!"
+        assert warm['final_cost'] <= cold['final_cost'] * 1.05, "Warm start should find an equally good path!"
+
+        # The seed is resampled and moved onto the new endpoints; reversed problems reuse it too
+        explicit = client.post('/api/optimize', json=dict(
+            moved, n_points=15, n_iterations=0, initial_path=first.get_json()['final_path']
+        )).get_json()
+        seeded = explicit['results'][0]['path']
+        assert len(seeded) == 15 and seeded[0] == [55, 305] and seeded[-1] == [745, 298], \
+            "initial_path should be fitted to n_points, start and goal!"
+        assert max(abs(y - 300) for x, y in seeded) > 30, "initial_path should keep the detour!"
+
+        reverse = client.post('/api/optimize', json=dict(payload, start=[750, 300], goal=[50, 300], warm_start=True))
+        assert reverse.get_json()['warm_started'], "Reversed problem should reuse the stored path!"
+        far = client.post('/api/optimize', json=dict(
+            payload, start=[50, 500], goal=[750, 500], warm_start=True, warm_start_radius=50
+        ))
+        assert not far.get_json()['warm_started'], "Problems beyond warm_start_radius should start cold!"
+
+        # Adding an obstacle changes the map, but the previous solution still seeds the run
+        added = dict(moved, obstacles=payload['obstacles'] + [{'center': [600, 450], 'radius': 20}])
+        warm_added = client.post('/api/optimize', json=dict(added, warm_start=True)).get_json()
+        cold_added = client.post('/api/optimize', json=added).get_json()
+        print(f"After adding an obstacle: cold {cold_added['iterations']}, warm {warm_added['iterations']} iterations")
+        assert warm_added['warm_started'], "A changed map should still be warm-started!"
+        assert warm_added['iterations'] < cold_added['iterations'] / 2, "Warm start should converge much faster!"
+
+        # The cache key is the request as sent, so repeating a warm-started request hits the cache
+        server.cache = ResultCache(max_entries=8)
+        repeated = [client.post('/api/optimize', json=dict(moved, warm_start=True)) for _ in range(3)]
+        assert [r.headers['X-Cache'] for r in repeated] == ['MISS', 'HIT', 'HIT'], "Warm starts should be cached!"
+        assert all(r.get_json()['warm_started'] for r in repeated), "Cached answers should stay warm-started!"
+
+        # A seed that costs more than the straight line is not used
+        empty = dict(moved, obstacles=[], n_iterations=0)
+        seeded = client.post('/api/optimize', json=dict(empty, warm_start=True, warm_start_radius=1000)).get_json()
+        straight = client.post('/api/optimize', json=empty).get_json()
+        assert not seeded['warm_started'], "A worse seed should be skipped!"
+        assert seeded['initial_cost'] == straight['initial_cost'], "Warm start should never start worse!"
+    finally:
+        server.cache, server.warm_starts = original_cache, original_store
+
+    # Paths solved on the same map are preferred over closer ones from other maps
+    store = WarmStartStore()
+    workspace = workspace_key(5.0)
+    store.add(workspace, 'other', (0, 0), (100, 0), [[0, 0], [50, 10], [100, 0]])
+    store.add(workspace, 'same', (0, 5), (100, 5), [[0, 5], [50, -10], [100, 5]])
+    assert store.nearest(workspace, 'same', (0, 0), (100, 0))[1, 1] == -10, "Same map should win!"
+    assert store.nearest(workspace, 'new', (0, 0), (100, 0))[1, 1] == 10, "Other maps should be a fallback!"
+    assert store.nearest(workspace, 'new', (0, 300), (100, 300)) is None, "Far paths on other maps should be ignored!"
+    assert store.nearest(workspace, 'same', (0, 300), (100, 300)) is not None, "The same map has no default radius!"
+    assert store.nearest(workspace_key(5.0, 3), 'same', (0, 0), (100, 0)) is None, "Workspaces are separate!"
+
+    print("\n✅ TEST PASSED: Warm start reuses nearby solutions")
+
+
+def test_sessions():
+    """Test that stepping a session matches an uninterrupted optimization."""
+    print("\n" + "=" * 60)
+    print("TEST: Sessions")
+    print("=" * 60)
+
+    client = app.test_client()
+    problem = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 320], 'radius': 50}],
+        'n_points': 15
+    }
+
+    original_sessions = server.sessions
+    server.sessions = SessionStore(max_sessions=2, idle_timeout=60)
+    try:
+        created = client.post('/api/sessions', json=problem)
+        assert created.status_code == 201, f"Expected 201, got {created.status_code}"
+        session_id = created.get_json()['session_id']
+
+        # 3 + 7 steps through the API, momentum kept between calls
+        client.post(f'/api/sessions/{session_id}/step', json={'n_steps': 3})
+        stepped = client.post('/api/single_step', json={'session_id': session_id, 'n_steps': 7}).get_json()
+
+        reference = PathOptimizer(tuple(problem['start']), tuple(problem['goal']), problem['obstacles'], n_points=15)
+        frames = reference.optimize(n_iterations=10)
+        print(f"Session cost after 10 steps: {stepped['cost']:.2f}, optimize(): {frames[-1]['cost']:.2f}")
+        assert stepped['iteration'] == 10, "Session should count its steps!"
+        assert np.allclose(stepped['path'], frames[-1]['path']), "Session steps should match optimize()!"
+
+        state = client.get(f'/api/sessions/{session_id}').get_json()
+        assert np.allclose(state['cost_history'], reference.get_cost_history()), "Cost history should be kept!"
+
+        # Obstacles change in place and stepping continues from the current path
+        update = client.post(f'/api/sessions/{session_id}/obstacles', json={
+            'remove': [0], 'add': [{'center': [400, 280], 'radius': 30}]
+        }).get_json()
+        assert update['added'] == [1] and update['n_obstacles'] == 1, "Update should report the new obstacle!"
+        stepped = client.post(f'/api/sessions/{session_id}/step', json={'n_steps': 5}).get_json()
+        assert stepped['iteration'] == 15, "Session should keep counting after an update!"
+
+        # The oldest session is dropped beyond max_sessions
+        client.post('/api/sessions', json=problem)
+        client.post('/api/sessions', json=problem)
+        missing = client.post(f'/api/sessions/{session_id}/step', json={})
+        assert missing.status_code == 404, "Evicted session should be gone!"
+        assert client.get('/api/sessions').get_json()['evictions'] == 1, "Eviction should be counted!"
+
+        # Idle sessions expire
+        server.sessions.idle_timeout = 0
+        assert len(server.sessions) == 0, "Idle sessions should expire!"
+
+        # 3D sessions move buildings with the same 2-coordinate centers they are added with
+        server.sessions.idle_timeout = 60
+        session_3d = client.post('/api/sessions', json=dict(
+            problem, start=[50, 300, 10], goal=[750, 300, 10], obstacles=[]
+        )).get_json()['session_id']
+        building = {'center': [400, 300], 'radius': 30, 'top': 40}
+        added = client.post(f'/api/sessions/{session_3d}/obstacles', json={'add': [building]}).get_json()
+        assert added['cost'] > 0, "Building should be hit!"
+        moved = client.post(f'/api/sessions/{session_3d}/obstacles', json={
+            'move': [dict(building, id=added['added'][0], center=[400, 600])]
+        })
+        assert moved.status_code == 200, f"Moving a building should succeed, got {moved.get_json()}"
+        assert moved.get_json()['cost'] < added['cost'], "Moved building should be out of the way!"
+
+        # A failing edit leaves the map as it was, even when other edits came first
+        failed = client.post(f'/api/sessions/{session_3d}/obstacles', json={
+            'remove': [added['added'][0]], 'move': [{'id': 99, 'center': [0, 0]}]
+        })
+        assert failed.status_code == 400, "Unknown ids should be rejected!"
+        state = client.post(f'/api/sessions/{session_3d}/obstacles', json={}).get_json()
+        assert state['n_obstacles'] == 1, "A rejected update should not remove anything!"
+
+        # Sessions that grow are measured again, so the memory budget still holds
+        server.sessions = SessionStore(max_sessions=10, idle_timeout=60, max_bytes=4000)
+        older = client.post('/api/sessions', json=problem).get_json()['session_id']
+        newer = client.post('/api/sessions', json=problem).get_json()['session_id']
+        client.post(f'/api/sessions/{newer}/obstacles', json={
+            'add': [{'center': [x, 0], 'radius': 1} for x in range(100)]
+        })
+        stats = client.get('/api/sessions').get_json()
+        print(f"Session bytes after adding 100 obstacles: {stats['bytes']} of {stats['max_bytes']}")
+        assert stats['bytes'] <= stats['max_bytes'], "Growing sessions should stay within max_bytes!"
+        assert client.post(f'/api/sessions/{older}/step', json={}).status_code == 404, "Older session should be evicted!"
+        assert client.post(f'/api/sessions/{newer}/step', json={}).status_code == 200, "Grown session should stay!"
+    finally:
+        server.sessions = original_sessions
+
+    print("\n✅ TEST PASSED: Sessions keep optimizer state between calls")
+
+
+def test_validate_path():
+    """Test per-segment validation and the segment obstacle model through the API."""
+    print("\n" + "=" * 60)
+    print("TEST: Path Validation Endpoint")
+    print("=" * 60)
+
+    client = app.test_client()
+    obstacles = [
+        {'center': [50, 0], 'velocity': [1, 0], 'radius': 5},
+        {'center': [37.5, 2], 'radius': 4}
+    ]
+    report = client.post('/api/validate_path', json={
+        'path': [[0, 0], [25, 0], [50, 0], [75, 0], [100, 0]],
+        'obstacles': obstacles,
+        'safety_margin': 1.0
+    }).get_json()
+    print(f"Clearance per segment: {report['clearance']}")
+
+    assert not report['collision_free'], "Segment through the obstacle should collide!"
+    assert np.isclose(report['min_clearance'], -2.0), "Path should pass 2 inside the static obstacle!"
+    assert report['nearest'] == [1, 1, 1, 1], "Nearest should index the request's obstacle list!"
+
+    payload = {
+        'start': [0, 0], 'goal': [100, 0], 'obstacles': obstacles[1:], 'n_points': 5,
+        'safety_margin': 1.0, 'n_iterations': 1000, 'obstacle_model': 'segments'
+    }
+    result = client.post('/api/optimize', json=payload).get_json()
+    report = client.post('/api/validate_path', json={
+        'path': result['final_path'], 'obstacles': obstacles[1:], 'safety_margin': 1.0
+    }).get_json()
+    assert report['collision_free'], "Segment model should route the path around the obstacle!"
+
+    response = client.post('/api/optimize', json=dict(payload, obstacle_model='corners'))
+    assert response.status_code == 400, "Unknown obstacle models should be rejected!"
+
+    print("\n✅ TEST PASSED: Paths are validated segment by segment")
+
+
+def test_maps():
+    """Test that stored maps give the same answers as sending the obstacles."""
+    print("\n" + "=" * 60)
+    print("TEST: Stored Maps")
+    print("=" * 60)
+
+    client = app.test_client()
+    rng = np.random.default_rng(7)
+    obstacles = [{'center': [float(x), float(y)], 'radius': 15.0}
+                 for x, y in rng.uniform([150, 100], [650, 500], (200, 2))]
+    problem = {'start': [50, 300], 'goal': [750, 300], 'n_points': 20, 'n_iterations': 100}
+
+    original_maps = server.maps
+    with tempfile.TemporaryDirectory() as directory:
+        server.maps = MapStore(directory)
+        try:
+            created = client.post('/api/maps', json={'obstacles': obstacles})
+            assert created.status_code == 201, f"Expected 201, got {created.status_code}"
+            info = created.get_json()
+            print(f"Stored map {info['map_id']}: {info['n_circles']} circles, {info['nbytes']} bytes")
+            assert info['n_circles'] == 200 and not info['distance_field'], "Map should hold the circles!"
+            again = client.post('/api/maps', json={'obstacles': obstacles}).get_json()
+            assert again['map_id'] == info['map_id'], "The same map should get the same id!"
+
+            by_list = client.post('/api/optimize', json=dict(problem, obstacles=obstacles)).get_json()
+            by_id = client.post('/api/optimize', json=dict(problem, map_id=info['map_id'])).get_json()
+            assert np.allclose(by_id['final_path'], by_list['final_path']), "Stored map should match the list!"
+
+            path = by_list['final_path']
+            cost = client.post('/api/calculate_cost', json={'path': path, 'obstacles': obstacles}).get_json()
+            stored_cost = client.post('/api/calculate_cost', json={'path': path, 'map_id': info['map_id']}).get_json()
+            assert np.isclose(stored_cost['total_cost'], cost['total_cost']), "Costs should match!"
+
+            # A fresh store on the same directory reads the map back from disk
+            server.maps = MapStore(directory)
+            assert client.get(f"/api/maps/{info['map_id']}").get_json() == info, "Map should persist!"
+
+            # Polygons (and, when rasterized, circles) are stored as a distance field
+            field_map = client.post('/api/maps', json={
+                'obstacles': obstacles[:5] + [{'polygon': [[380, 260], [420, 260], [400, 340]]}],
+                'rasterize': True, 'field_padding': 20.0
+            }).get_json()
+            assert field_map['distance_field'] and field_map['n_circles'] == 0, "Circles should be rasterized!"
+            assert field_map['circle_penalty'] == 'distance_field', "Rasterized circles should report their penalty!"
+            assert info['circle_penalty'] == 'analytic', "Circle maps should keep the analytic penalty!"
+            response = client.post('/api/calculate_cost', json={
+                'path': path, 'map_id': field_map['map_id'], 'safety_margin': 30.0
+            })
+            assert response.status_code == 400, "Margins beyond the field padding should be rejected!"
+
+            assert client.delete(f"/api/maps/{info['map_id']}").status_code == 204, "Delete should succeed!"
+            response = client.post('/api/optimize', json=dict(problem, map_id=info['map_id']))
+            assert response.status_code == 404, "Deleted maps should be unknown!"
+            assert client.get('/api/maps/../../etc').status_code == 404, "Ids should not reach outside the store!"
+        finally:
+            server.maps = original_maps
+
+    print("\n✅ TEST PASSED: Maps are stored once and referenced by id")
+
+
+def test_profile():
+    """Test that profiled requests report timers and counters and add them to the totals."""
+    print("\n" + "=" * 60)
+    print("TEST: Profiling")
+    print("=" * 60)
+
+    client = app.test_client()
+    problem = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 20,
+        'n_iterations': 30
+    }
+
+    original_pool = server.pool
+    server.pool = OptimizationPool(max_workers=0)
+    try:
+        before_totals = client.get('/api/profile').get_json()
+        before = before_totals['requests']
+        before_serialized = before_totals['timers'].get('serialization', {}).get('calls', 0)
+        plain = client.post('/api/optimize', json=problem).get_json()
+        assert 'profile' not in plain, "Only profiled requests should carry a profile!"
+
+        response = client.post('/api/optimize', json=dict(problem, profile=True))
+        assert response.headers['X-Cache'] == 'BYPASS', "Profiled runs should skip the cache!"
+        data = response.get_json()
+        profile = data['profile']
+        print(f"Timers: {sorted(profile['timers'])}")
+        print(f"Counters: {profile['counters']}")
+        for timer in ('cost_length', 'cost_smoothness', 'cost_obstacle', 'gradient_length',
+                      'gradient_smoothness', 'gradient_obstacle', 'tolist', 'run'):
+            assert timer in profile['timers'], f"Missing timer {timer}!"
+        # One cost for the initial path and one per momentum step
+        assert profile['counters']['cost_evaluations'] == data['iterations'] + 1, "Wrong cost evaluation count!"
+        assert profile['counters']['gradient_evaluations'] == data['iterations'], "Wrong gradient count!"
+        assert profile['counters'].get('clipped_gradients', 0) > 0, "A path through an obstacle should be clipped!"
+        assert np.allclose(data['final_path'], plain['final_path']), "Profiling should not change the result!"
+
+        step = client.post('/api/single_step', json={
+            'current_path': data['results'][0]['path'], 'start': problem['start'], 'goal': problem['goal'],
+            'obstacles': problem['obstacles'], 'profile': True
+        }).get_json()
+        assert step['profile']['counters']['cost_evaluations'] == 1, "A step should evaluate the cost once!"
+        cost = client.post('/api/calculate_cost', json={
+            'path': data['final_path'], 'obstacles': problem['obstacles'], 'profile': True
+        }).get_json()
+        assert 'profile' in cost, "Cost responses should carry the profile!"
+
+        totals = client.get('/api/profile').get_json()
+        # The profile block is encoded with the payload, so serialization shows in the totals
+        assert totals['timers']['serialization']['calls'] == before_serialized + 3, \
+            "Totals should time every serialization!"
+        assert totals['requests'] == before + 3, "Every profiled request should add to the totals!"
+        assert totals['counters']['cost_evaluations'] >= data['iterations'] + 3, "Totals should accumulate!"
+    finally:
+        server.pool = original_pool
+
+    print("\n✅ TEST PASSED: Profiles break down where requests spend their time")
+
+
+def test_metrics():
+    """Test that /metrics exposes request, run and problem size metrics in the Prometheus format."""
+    print("\n" + "=" * 60)
+    print("TEST: Prometheus Metrics")
+    print("=" * 60)
+
+    def scrape():
+        response = client.get('/metrics')
+        assert response.status_code == 200, f"Unexpected status {response.status_code}"
+        assert response.content_type.startswith('text/plain; version=0.0.4'), "Wrong content type!"
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    client = app.test_client()
+    problem = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}, {'center': [200, 250], 'radius': 30}],
+        'n_points': 20,
+        'n_iterations': 25
+    }
+
+    original_pool, original_cache = server.pool, server.cache
+    server.pool = OptimizationPool(max_workers=0)
+    server.cache = ResultCache(max_entries=8)
+    try:
+        before = scrape()
+        route = '{route="/api/optimize",method="POST",status="200"}'
+        first = client.post('/api/optimize', json=problem).get_json()
+        client.post('/api/optimize', json=problem)
+        client.get('/api/sessions/unknown')
+        after = scrape()
+
+        requests = after[f'path_optimizer_requests_total{route}'] - before.get(f'path_optimizer_requests_total{route}', 0)
+        print(f"Optimize requests counted: {requests:.0f}")
+        assert requests == 2, "Both optimize requests should be counted!"
+        assert after['path_optimizer_requests_total{route="/api/sessions/<session_id>",method="GET",status="404"}'] >= 1, \
+            "Requests should be labelled by route pattern and status!"
+        latency = 'path_optimizer_request_duration_seconds_count{route="/api/optimize"}'
+        assert after[latency] - before.get(latency, 0) == 2, "Latency should be observed per request!"
+
+        # Only the first request ran; the second was a cache hit
+        iterations = 'path_optimizer_iterations_total{endpoint="optimize"}'
+        assert after[iterations] - before.get(iterations, 0) == first['iterations'], "Iterations should be counted once!"
+        outcome = 'path_optimizer_runs_total{stop_reason="max_iterations"}'
+        assert after[outcome] - before.get(outcome, 0) == 1, "Run outcome should be counted!"
+        assert after['path_optimizer_cache_hits_total'] == 1 and after['path_optimizer_cache_hit_ratio'] == 0.5, \
+            "Cache hit rate should be exposed!"
+        assert after['path_optimizer_request_obstacles_bucket{le="2"}'] - \
+            before.get('path_optimizer_request_obstacles_bucket{le="2"}', 0) == 2, "Obstacle counts should be observed!"
+        assert after['path_optimizer_request_points_sum'] - before.get('path_optimizer_request_points_sum', 0) == 40, \
+            "Waypoint counts should be observed!"
+        assert after['path_optimizer_queue_depth'] == 0, "No job should be in flight!"
+    finally:
+        server.pool, server.cache = original_pool, original_cache
+
+    print("\n✅ TEST PASSED: Metrics cover requests, runs, problem sizes, queue and cache")
+
+
+def test_binary_bodies():
+    """Test that binary requests and responses carry the same data as JSON."""
+    print("\n" + "=" * 60)
+    print("TEST: Binary Bodies")
+    print("=" * 60)
+
+    client = app.test_client()
+    problem = {
+        'start': [50, 300],
+        'goal': [750, 300],
+        'obstacles': [{'center': [400, 300], 'radius': 50}],
+        'n_points': 30,
+        'n_iterations': 40
+    }
+
+    original_pool, original_cache = server.pool, server.cache
+    server.pool = OptimizationPool(max_workers=0)
+    server.cache = ResultCache(max_entries=8)
+    try:
+        as_json = client.post('/api/optimize', json=problem)
+        as_binary = client.post('/api/optimize', json=problem, headers={'Accept': BINARY_MIMETYPE})
+        as_float32 = client.post('/api/optimize', json=problem, headers={'Accept': f'{BINARY_MIMETYPE}; dtype=float32'})
+        print(f"Response sizes: JSON {len(as_json.data)}, float64 {len(as_binary.data)}, "
+              f"float32 {len(as_float32.data)} bytes")
+        assert as_binary.content_type == BINARY_MIMETYPE, "Binary should be negotiated by Accept!"
+        assert len(as_float32.data) < len(as_binary.data) < len(as_json.data), "Binary bodies should be smaller!"
+
+        expected = as_json.get_json()
+        decoded = decode_binary(as_binary.data)
+        assert decoded['final_path'].dtype == np.float64 and decoded['final_path'].shape == (30, 2), "Wrong array!"
+        assert np.array_equal(decoded['final_path'], expected['final_path']), "float64 paths should be exact!"
+        assert np.array_equal(decoded['cost_history'], expected['cost_history']), "Cost history should be exact!"
+        for frame, expected_frame in zip(decoded['results'], expected['results']):
+            assert frame['iteration'] == expected_frame['iteration'], "Frames should match!"
+            assert np.array_equal(frame['path'], expected_frame['path']), "Frame paths should be exact!"
+        single = decode_binary(as_float32.data)
+        assert single['final_path'].dtype == np.float32, "dtype=float32 should send float32 buffers!"
+        assert np.allclose(single['final_path'], expected['final_path'], atol=1e-3), "float32 should round only!"
+
+        # Binary request bodies, paths sent as arrays
+        path = np.asarray(expected['final_path'])
+        body = encode_binary({'current_path': path, 'start': problem['start'], 'goal': problem['goal'],
+                              'obstacles': problem['obstacles']})
+        step = client.post('/api/single_step', data=body, content_type=BINARY_MIMETYPE,
+                           headers={'Accept': BINARY_MIMETYPE})
+        json_step = client.post('/api/single_step', json={'current_path': path.tolist(), 'start': problem['start'],
+                                                         'goal': problem['goal'], 'obstacles': problem['obstacles']})
+        assert np.array_equal(decode_binary(step.data)['path'], json_step.get_json()['path']), "Steps should match!"
+
+        cost = client.post('/api/calculate_cost', data=encode_binary({'path': path, 'obstacles': problem['obstacles']}),
+                           content_type=BINARY_MIMETYPE)
+        assert cost.content_type == 'application/json', "JSON should stay the default response!"
+        assert np.isclose(cost.get_json()['total_cost'], expected['final_cost']), "Cost should match the run!"
+
+        response = client.post('/api/calculate_cost', data=b'not a binary body', content_type=BINARY_MIMETYPE)
+        assert response.status_code == 400, "Malformed binary bodies should be rejected!"
+        response = client.post('/api/optimize', json=problem, headers={'Accept': f'{BINARY_MIMETYPE}; dtype=int8'})
+        assert response.status_code == 400, "Unknown dtypes should be rejected!"
+    finally:
+        server.pool, server.cache = original_pool, original_cache
+
+    print("\n✅ TEST PASSED: Binary bodies round-trip paths without JSON")
+
+
+def test_calculate_cost_batch():
+    """Test that batch scoring matches scoring the paths one at a time."""
+    print("\n" + "=" * 60)
+    print("TEST: Batch Cost Evaluation")
+    print("=" * 60)
+
+    client = app.test_client()
+    rng = np.random.default_rng(9)
+    obstacles = [{'center': [float(x), float(y)], 'radius': 20.0}
+                 for x, y in rng.uniform([150, 150], [650, 450], (50, 2))]
+    straight = np.linspace([50, 300], [750, 300], 20)
+    paths = [(straight + rng.normal(0, 20, straight.shape)).tolist() for _ in range(12)]
+    paths.append(np.linspace([50, 300], [750, 300], 9).tolist())
+
+    response = client.post('/api/calculate_cost_batch', json={'paths': paths, 'obstacles': obstacles})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    batch = response.get_json()
+    assert len(batch['total_cost']) == len(paths), "Should score every path!"
+    for index, path in enumerate(paths):
+        single = client.post('/api/calculate_cost', json={'path': path, 'obstacles': obstacles}).get_json()
+        for key, value in single.items():
+            assert np.isclose(batch[key][index], value, rtol=1e-12), f"{key} of path {index} should match!"
+    print(f"Scored {len(paths)} paths, best total cost {min(batch['total_cost']):.1f}")
+
+    # Stored maps, and one (n_paths, n_points, dim) array in a binary body
+    original_maps = server.maps
+    with tempfile.TemporaryDirectory() as directory:
+        server.maps = MapStore(directory)
+        try:
+            map_id = client.post('/api/maps', json={'obstacles': obstacles}).get_json()['map_id']
+            by_id = client.post('/api/calculate_cost_batch', json={'paths': paths, 'map_id': map_id}).get_json()
+            assert np.allclose(by_id['total_cost'], batch['total_cost']), "Stored map should match the list!"
+
+            body = encode_binary({'paths': np.asarray(paths[:12]), 'map_id': map_id})
+            binary = client.post('/api/calculate_cost_batch', data=body, content_type=BINARY_MIMETYPE,
+                                 headers={'Accept': BINARY_MIMETYPE})
+            decoded = decode_binary(binary.data)
+            assert isinstance(decoded['total_cost'], np.ndarray), "Binary responses should carry arrays!"
+            assert np.array_equal(decoded['total_cost'], batch['total_cost'][:12]), "Binary costs should be exact!"
+        finally:
+            server.maps = original_maps
+
+    response = client.post('/api/calculate_cost_batch', json={'paths': [[1, 2, 3]], 'obstacles': []})
+    assert response.status_code == 400, "Malformed paths should be rejected!"
+
+    print("\n✅ TEST PASSED: Batch costs match single-path costs")
+
+
+if __name__ == '__main__':
+    print("\n" + "🧪 RUNNING API TESTS" + "\n")
+
+    try:
+        test_optimize_batch()
+        test_optimize_on_worker_pool()
+        test_optimize_stream()
+        test_frame_options()
+        test_result_cache()
+        test_warm_start()
+        test_sessions()
+        test_validate_path()
+        test_maps()
+        test_profile()
+        test_metrics()
+        test_binary_bodies()
+        test_calculate_cost_batch()
+
+        print("\n" + "=" * 60)
+        print("🎉 ALL TESTS PASSED!")
+        print("=" * 60)
+
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}")
+        sys.exit(1)
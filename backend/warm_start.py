@@ -0,0 +1,129 @@
+"""
+Warm-start store for replanning
+Remembers solved paths so nearby problems, on the same or a slightly changed
+obstacle map, can start from them
+"""
+
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Paths from other obstacle maps are only used within this fraction of the
+# start-goal distance, unless a max_distance is given
+OTHER_MAP_RADIUS_FRACTION = 0.25
+
+
+def workspace_key(safety_margin: float, dim: int = 2) -> Tuple[float, int]:
+    """
+    Identify the problems whose solved paths may seed each other.
+
+    Args:
+        safety_margin: Additional safety distance around obstacles
+        dim: Path dimension (2 or 3)
+
+    Returns:
+        Tuple of (safety_margin, dim)
+    """
+    return float(safety_margin), int(dim)
+
+
+class WarmStartStore:
+    """
+    Solved paths grouped by workspace (see workspace_key), both levels kept
+    in LRU order. A lookup returns the stored path whose endpoints are
+    closest to the new start and goal, preferring paths solved on the same
+    obstacle map. When that map has none in range, nearby paths from other
+    maps are used, so replanning after an obstacle is added or moved still
+    starts from the previous solution. A path solved in the opposite direction is reversed.
+    """
+
+    def __init__(self, max_workspaces: int = 32, max_paths_per_workspace: int = 256):
+        """
+        Initialize the store.
+
+        Args:
+            max_workspaces: Maximum number of workspaces remembered
+            max_paths_per_workspace: Maximum number of solved paths per workspace
+        """
+        self.max_workspaces = max_workspaces
+        self.max_paths_per_workspace = max_paths_per_workspace
+        self._workspaces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, workspace: Tuple, map_id: str, start, goal, path):
+        """
+        Remember a solved path.
+
+        Args:
+            workspace: Key from workspace_key
+            map_id: Identity of the obstacle map (stored map id or obstacle hash)
+            start: Start point (x, y)
+            goal: Goal point (x, y)
+            path: Solved path (n_points, dim)
+        """
+        key = (map_id, (tuple(np.asarray(start, dtype=float)), tuple(np.asarray(goal, dtype=float))))
+        path = np.asarray(path, dtype=float)
+        with self._lock:
+            paths = self._workspaces.setdefault(workspace, OrderedDict())
+            self._workspaces.move_to_end(workspace)
+            paths[key] = path
+            paths.move_to_end(key)
+            while len(paths) > self.max_paths_per_workspace:
+                paths.popitem(last=False)
+            while len(self._workspaces) > self.max_workspaces:
+                self._workspaces.popitem(last=False)
+
+    def nearest(self, workspace: Tuple, map_id: str, start, goal,
+                max_distance: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Find the stored path whose endpoints are closest to start and goal,
+        on map_id if it has one within max_distance, otherwise on any map
+        within max_distance (OTHER_MAP_RADIUS_FRACTION of |goal - start| by default).
+
+        Args:
+            workspace: Key from workspace_key
+            map_id: Identity of the obstacle map (stored map id or obstacle hash)
+            start: Start point (x, y)
+            goal: Goal point (x, y)
+            max_distance: Ignore paths whose summed endpoint distance is larger
+                (unbounded on map_id by default)
+
+        Returns:
+            The closest path (oriented from start to goal), or None
+        """
+        with self._lock:
+            paths = self._workspaces.get(workspace)
+            if not paths:
+                return None
+            self._workspaces.move_to_end(workspace)
+            keys = list(paths.keys())
+            stored = list(paths.values())
+
+        same_map = np.array([key[0] == map_id for key in keys])
+        endpoints = np.array([key[1] for key in keys])
+        start = np.asarray(start, dtype=float)
+        goal = np.asarray(goal, dtype=float)
+
+        # Distance for the stored direction and for the reversed one
+        forward = np.linalg.norm(endpoints[:, 0] - start, axis=1) + np.linalg.norm(endpoints[:, 1] - goal, axis=1)
+        backward = np.linalg.norm(endpoints[:, 1] - start, axis=1) + np.linalg.norm(endpoints[:, 0] - goal, axis=1)
+        distance = np.minimum(forward, backward)
+
+        if max_distance is None:
+            # Any path on the same map, only nearby ones from other maps
+            candidates = same_map | (distance <= OTHER_MAP_RADIUS_FRACTION * np.linalg.norm(goal - start))
+        else:
+            candidates = distance <= max_distance
+        if np.any(candidates & same_map):
+            candidates &= same_map
+        if not np.any(candidates):
+            return None
+
+        best = int(np.argmin(np.where(candidates, distance, np.inf)))
+        path = stored[best]
+        return path[::-1].copy() if backward[best] < forward[best] else path.copy()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(paths) for paths in self._workspaces.values())
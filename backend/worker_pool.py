@@ -0,0 +1,429 @@
+"""
+Worker pool for running optimizations outside the request thread
+Bounds the number of in-flight jobs and enforces per-job timeouts
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from optimizer import PathOptimizer, STOPPING_CRITERIA
+from batch import BatchPathOptimizer
+from frames import decimate_frames, encode_frames
+from map_store import open_store
+from profiling import optional_timer
+
+
+class PoolFullError(Exception):
+    """Raised when the pool already holds its maximum number of jobs."""
+
+
+class JobTimeoutError(Exception):
+    """Raised when a job does not finish within its timeout."""
+
+
+class OptimizationPool:
+    """
+    Bounded front end for a ProcessPoolExecutor.
+    Jobs beyond max_pending (running + queued) are rejected instead of queued,
+    so callers can answer with a retryable error instead of piling up work.
+    A max_workers of 0 runs jobs inline in the calling thread.
+
+    A running job cannot be cancelled from outside, so jobs started by run()
+    with a timeout get a 'deadline' keyword (time.time() seconds) and must
+    stop by raising JobTimeoutError once it has passed (see check_deadline).
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 job_timeout: Optional[float] = None):
+        """
+        Initialize the pool. Worker processes are started on first use.
+
+        Args:
+            max_workers: Number of worker processes (defaults to the CPU count, 0 runs inline)
+            max_pending: Maximum number of running + queued jobs (defaults to 4 per worker)
+            job_timeout: Seconds a job may take, including time queued (None has no limit)
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if max_pending is None:
+            max_pending = 4 * max(max_workers, 1)
+
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @classmethod
+    def from_env(cls) -> 'OptimizationPool':
+        """
+        Build a pool configured by OPTIMIZER_WORKERS, OPTIMIZER_MAX_PENDING
+        and OPTIMIZER_JOB_TIMEOUT environment variables.
+        """
+        workers = os.environ.get('OPTIMIZER_WORKERS')
+        pending = os.environ.get('OPTIMIZER_MAX_PENDING')
+        timeout = os.environ.get('OPTIMIZER_JOB_TIMEOUT', '110')
+        return cls(
+            max_workers=int(workers) if workers else None,
+            max_pending=int(pending) if pending else None,
+            job_timeout=float(timeout) if timeout else None
+        )
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently running or queued."""
+        return self._pending
+
+    def _get_executor(self, broken: ProcessPoolExecutor = None) -> ProcessPoolExecutor:
+        # Created under the lock so concurrent first jobs share one executor,
+        # and a broken executor is replaced once rather than by every job that saw it fail
+        with self._lock:
+            if self._executor is None or self._executor is broken:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolFullError(f"Optimization queue is full ({self.max_pending} jobs)")
+            self._pending += 1
+
+    def _release(self, future: Future = None):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submit a job to the worker processes.
+
+        Args:
+            fn: Picklable module-level function to run
+            *args, **kwargs: Arguments passed to fn
+
+        Returns:
+            Future for the job result
+
+        Raises:
+            PoolFullError: If max_pending jobs are already in flight
+        """
+        self._acquire()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died; start a fresh executor for this and later jobs
+            try:
+                future = self._get_executor(broken=executor).submit(fn, *args, **kwargs)
+            except Exception:
+                self._release()
+                raise
+        except Exception:
+            self._release()
+            raise
+
+        # The slot is held until the job really finishes, even after a timeout
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Run a job and wait for its result. With a timeout, fn is also passed
+        deadline=time.time() + timeout and stops itself once it has passed.
+
+        Args:
+            fn: Picklable module-level function to run, taking a deadline keyword
+            *args, **kwargs: Arguments passed to fn
+            timeout: Seconds the job may take, overriding job_timeout
+
+        Returns:
+            The job's return value
+
+        Raises:
+            PoolFullError: If max_pending jobs are already in flight
+            JobTimeoutError: If the job does not finish in time
+        """
+        timeout = timeout if timeout is not None else self.job_timeout
+        if timeout is not None:
+            kwargs['deadline'] = time.time() + timeout
+
+        if self.max_workers == 0:
+            self._acquire()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._release()
+
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            # Drops the job if it is still queued; a running job stops at its deadline
+            future.cancel()
+            raise JobTimeoutError("Optimization did not finish within the time limit")
+
+    def stream(self, frames: Iterator[Dict], timeout: Optional[float] = None) -> 'StreamJob':
+        """
+        Admit a streamed run, iterated in the calling thread: it holds a job
+        slot until it finishes or is closed, and stops at its deadline like
+        jobs started by run().
+
+        Args:
+            frames: Frame iterator of the run (see optimization_frames)
+            timeout: Seconds the run may take, overriding job_timeout
+
+        Returns:
+            StreamJob yielding the frames
+
+        Raises:
+            PoolFullError: If max_pending jobs are already in flight
+        """
+        timeout = timeout if timeout is not None else self.job_timeout
+        self._acquire()
+        return StreamJob(frames, None if timeout is None else time.time() + timeout, self._release)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class StreamJob:
+    """
+    Frame iterator of a streamed run admitted by OptimizationPool.stream.
+    Raises JobTimeoutError once the deadline has passed, and gives its job
+    slot back when exhausted, failed or closed (whichever comes first).
+    """
+
+    def __init__(self, frames: Iterator[Dict], deadline: Optional[float], release: Callable):
+        self._frames = iter(frames)
+        self._deadline = deadline
+        self._release = release
+
+    def __iter__(self) -> 'StreamJob':
+        return self
+
+    def __next__(self) -> Dict:
+        if self._release is None:
+            raise StopIteration
+        try:
+            frame = next(self._frames)
+            check_deadline(self._deadline)
+        except BaseException:
+            self.close()
+            raise
+        return frame
+
+    def close(self):
+        """Stop the run and free its job slot."""
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+def check_deadline(deadline: Optional[float]):
+    """
+    Stop a job whose deadline has passed.
+
+    Args:
+        deadline: time.time() by which the job must finish, or None
+
+    Raises:
+        JobTimeoutError: If the deadline has passed
+    """
+    if deadline is not None and time.time() > deadline:
+        raise JobTimeoutError("Optimization did not finish within the time limit")
+
+
+def _until_deadline(frames: Iterator[Dict], deadline: Optional[float]) -> Iterator[Dict]:
+    # Check the deadline after every iteration of a run
+    for frame in frames:
+        check_deadline(deadline)
+        yield frame
+
+
+def optimize_job(start, goal, obstacles: List[Dict], n_points: int, safety_margin: float,
+                 weights: Dict[str, float], n_iterations: int, learning_rate: float,
+                 momentum: float, frame_stride: int = 1, min_cost_change: float = 0.0,
+                 frame_encoding: str = 'full', stopping: Dict = None,
+                 step_rule: str = 'momentum', multires: Dict = None, initial_path=None,
+                 warm_start_path=None, timing: Dict = None, altitude_limits=None,
+                 obstacle_model: str = 'waypoints', map_id: str = None, map_dir: str = None,
+                 profile: bool = False, path_format: str = 'list', deadline: float = None) -> Dict:
+    """
+    Run a single path optimization and build the /api/optimize payload.
+    Frames are decimated and encoded as they are produced (see frames.py);
+    the cost history is always complete. stopping holds early stopping
+    criteria passed to PathOptimizer.optimize_iter, step_rule selects the
+    update rule (see step_rules.py), multires enables coarse-to-fine
+    optimization (see optimization_frames), initial_path warm-starts the
+    optimizer and warm_start_path (a stored solution, see warm_start.py)
+    replaces the straight line only if it costs less, timing holds 'duration' and 'departure_time' for moving
+    obstacles, altitude_limits bounds z for 3D paths and obstacle_model
+    picks the static obstacle penalty ('waypoints' or 'segments'). With
+    map_id the obstacles are the stored map of that id in map_dir (see
+    map_store.py), loaded once per worker process. profile adds the
+    optimizer's profile (see profiling.py), with the whole run timed as 'run'.
+    path_format 'array' returns the frame paths, final_path and cost_history
+    as NumPy arrays for binary responses (see binary_codec.py). deadline is
+    checked after every iteration (see OptimizationPool.run).
+
+    Returns:
+        Dictionary with 'results', 'final_cost', 'initial_cost', 'cost_history',
+        'frame_encoding', 'stop_reason', 'iterations', 'final_path' and
+        'warm_started', and 'profile' when profiling
+
+    Raises:
+        JobTimeoutError: If the run is still going at deadline
+    """
+    if map_id is not None:
+        obstacle_options = open_store(map_dir).get(map_id).optimizer_options(safety_margin)
+    else:
+        obstacle_options = {'obstacles': obstacles}
+    optimizer = PathOptimizer(
+        start=start,
+        goal=goal,
+        n_points=n_points,
+        safety_margin=safety_margin,
+        weights=weights,
+        step_rule=step_rule,
+        initial_path=initial_path,
+        altitude_limits=altitude_limits,
+        obstacle_model=obstacle_model,
+        profile=profile,
+        **obstacle_options,
+        **(timing or {})
+    )
+    warm_started = initial_path is not None
+    if warm_start_path is not None and not warm_started:
+        warm_started = optimizer.warm_start(warm_start_path)
+    with optional_timer(optimizer.profile, 'run'):
+        # Frames stay arrays until decimation has picked the ones to send
+        frames = optimization_frames(optimizer, n_iterations, learning_rate, momentum, stopping, multires, 'array')
+        frames = _until_deadline(frames, deadline)
+        frames = decimate_frames(frames, stride=frame_stride, min_cost_change=min_cost_change)
+        results = list(encode_frames(frames, frame_encoding, path_format, optimizer.profile))
+    cost_history = optimizer.get_cost_history()
+    final_path = optimizer.get_path()
+    if path_format == 'array':
+        final_path = optimizer.path.copy()
+        cost_history = np.asarray(cost_history, dtype=float)
+
+    payload = {
+        'results': results,
+        'final_cost': float(cost_history[-1]),
+        'initial_cost': float(cost_history[0]),
+        'cost_history': cost_history,
+        'frame_encoding': frame_encoding,
+        'stop_reason': optimizer.stop_reason,
+        'iterations': optimizer.iterations,
+        'final_path': final_path,
+        'warm_started': warm_started
+    }
+    if optimizer.profile is not None:
+        payload['profile'] = optimizer.profile.as_dict()
+    return payload
+
+
+def optimization_frames(optimizer: PathOptimizer, n_iterations: int, learning_rate: float, momentum: float,
+                        stopping: Dict = None, multires: Dict = None, path_format: str = 'list') -> Iterator[Dict]:
+    """
+    Start an optimization run and return its frame iterator.
+
+    Args:
+        optimizer: Optimizer to run
+        n_iterations: Maximum number of iterations (of the coarsest level with multires)
+        learning_rate: Step size for gradient descent
+        momentum: Momentum coefficient (0.0 to 1.0)
+        stopping: Early stopping criteria, see PathOptimizer.optimize_iter
+        multires: Optional 'levels' and 'interpolation', see PathOptimizer.optimize_multires_iter
+        path_format: 'list' or 'array' frame paths, see PathOptimizer.optimize_iter
+
+    Returns:
+        Iterator over the optimization frames
+    """
+    stopping = dict(stopping or {}, path_format=path_format)
+    if multires and multires.get('levels', 1) > 1:
+        return optimizer.optimize_multires_iter(n_iterations, learning_rate, momentum, **multires, **stopping)
+    return optimizer.optimize_iter(n_iterations, learning_rate, momentum, **stopping)
+
+
+def multires_options(data: Dict) -> Dict:
+    """
+    Pick the coarse-to-fine options out of a request body.
+
+    Args:
+        data: Request JSON
+
+    Returns:
+        Dictionary with 'levels' and 'interpolation'
+    """
+    return {
+        'levels': data.get('multires_levels', 1),
+        'interpolation': data.get('interpolation', 'linear')
+    }
+
+
+def timing_options(data: Dict) -> Dict:
+    """
+    Pick the waypoint timing for moving obstacles out of a request body.
+
+    Args:
+        data: Request JSON
+
+    Returns:
+        Keyword arguments 'duration' and 'departure_time' for PathOptimizer
+    """
+    return {
+        'duration': data.get('duration'),
+        'departure_time': data.get('departure_time', 0.0)
+    }
+
+
+def stopping_criteria(data: Dict) -> Dict:
+    """
+    Pick the early stopping criteria out of a request body.
+
+    Args:
+        data: Request JSON
+
+    Returns:
+        Keyword arguments for PathOptimizer.optimize_iter
+    """
+    return {key: data[key] for key in STOPPING_CRITERIA if data.get(key) is not None}
+
+
+def optimize_batch_job(starts, goals, obstacles: List[Dict], n_points: int, safety_margin: float,
+                       weights: Dict[str, float], n_iterations: int, learning_rate: float,
+                       momentum: float, deadline: float = None) -> Dict:
+    """
+    Run a batch optimization and build the /api/optimize_batch payload.
+    deadline is checked after every iteration (see OptimizationPool.run).
+
+    Returns:
+        Dictionary with 'results'
+
+    Raises:
+        JobTimeoutError: If the run is still going at deadline
+    """
+    optimizer = BatchPathOptimizer(
+        starts=starts,
+        goals=goals,
+        obstacles=obstacles,
+        n_points=n_points,
+        safety_margin=safety_margin,
+        weights=weights
+    )
+    results = optimizer.optimize(n_iterations=n_iterations, learning_rate=learning_rate, momentum=momentum,
+                                 on_step=lambda: check_deadline(deadline))
+
+    return {'results': results}